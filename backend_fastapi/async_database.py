@@ -0,0 +1,176 @@
+"""
+Async access to the same database for the hot endpoints. A sync handler
+holds one of the threadpool's threads for as long as it waits on MySQL, so
+concurrency is capped by the thread count however idle the server is. With
+ASYNC_DB_ENABLED the product listing/detail, order history and login
+handlers are registered as coroutines on mysql.connector.aio connections
+instead, and a request waiting on the database costs only a suspended task.
+
+Requests beyond ASYNC_DB_POOL_SIZE wait for a free connection for up to
+ASYNC_DB_ACQUIRE_TIMEOUT seconds and then get 503 with Retry-After.
+
+Query logic shared by both variants is written as a generator that yields
+(query, params) and is sent (column_names, rows) back; run_queries() in
+database.py and run_queries_async() here drive it against a sync or async
+connection respectively, checking one out only once the first query is
+yielded (a cache hit never touches the pool).
+"""
+import asyncio
+import functools
+import inspect
+import os
+import time
+from contextlib import asynccontextmanager
+import mysql.connector
+import mysql.connector.aio
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from database import db_config, run_queries
+from query_stats import wrap_async_cursor
+
+load_dotenv()
+
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "false").lower() == "true"
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "50"))
+ASYNC_DB_ACQUIRE_TIMEOUT = float(os.getenv("ASYNC_DB_ACQUIRE_TIMEOUT", "5"))
+# Idle connections are pinged before reuse only after this long
+PING_AFTER_IDLE_SECONDS = 30
+
+
+def db_endpoint(steps_fn=None, *, read_only: bool = False, scope=None):
+    """
+    Make an endpoint out of a query generator with the endpoint's signature:
+    a coroutine on async_pool when ASYNC_DB_ENABLED, else a sync handler on
+    the threaded pool. read_only=True lets the sync variant read from a
+    replica, staying on the primary for a `current_user` who just wrote or
+    after a recent write to `scope` (replicas are not wired into the async
+    pool). `scope` may also be a function of the endpoint's keyword
+    arguments, for scopes that depend on the request.
+    """
+    if steps_fn is None:
+        return functools.partial(db_endpoint, read_only=read_only, scope=scope)
+    if ASYNC_DB_ENABLED:
+        async def endpoint(*args, **kwargs):
+            return await run_queries_async(steps_fn(*args, **kwargs))
+    else:
+        def endpoint(*args, **kwargs):
+            user = kwargs.get("current_user")
+            return run_queries(
+                steps_fn(*args, **kwargs), read_only=read_only, user_id=user['id'] if user else None,
+                scope=scope(**kwargs) if callable(scope) else scope
+            )
+    # Not functools.wraps: FastAPI follows __wrapped__ and would take the
+    # generator for a yield dependency
+    endpoint.__name__ = steps_fn.__name__
+    endpoint.__qualname__ = steps_fn.__qualname__
+    endpoint.__doc__ = steps_fn.__doc__
+    endpoint.__signature__ = inspect.signature(steps_fn)
+    return endpoint
+
+
+def when_async_enabled(async_endpoint):
+    """Register `async_endpoint` instead of the decorated sync handler when ASYNC_DB_ENABLED."""
+    def choose(sync_endpoint):
+        return async_endpoint if ASYNC_DB_ENABLED else sync_endpoint
+    return choose
+
+
+class AsyncConnectionPool:
+    def __init__(self, size: int, acquire_timeout: float, **config):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._config = config
+        self._idle = []  # (connection, released at); reused newest first
+        self._slots = None  # created on first use, inside the event loop
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a connection; it is rolled back if needed and returned on exit."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            conn = await self._checkout()
+            try:
+                yield _CountedConnection(conn)
+            finally:
+                await self._checkin(conn)
+        finally:
+            self._slots.release()
+
+    async def _checkout(self):
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at < PING_AFTER_IDLE_SECONDS or await conn.is_connected():
+                return conn
+            await _close_quietly(conn)
+        try:
+            return await mysql.connector.aio.connect(**self._config)
+        except mysql.connector.Error as err:
+            print(f"Error connecting to database: {err}")
+            raise HTTPException(status_code=500, detail="Database connection failed")
+
+    async def _checkin(self, conn):
+        try:
+            # Whatever the handler left open must not leak into the next request
+            if conn.in_transaction:
+                await conn.rollback()
+        except Exception:
+            await _close_quietly(conn)
+            return
+        self._idle.append((conn, time.monotonic()))
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            await _close_quietly(conn)
+
+
+class _CountedConnection:
+    """Hands out cursors counted towards the current request's query stats."""
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def cursor(self, *args, **kwargs):
+        return wrap_async_cursor(await self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+async def _close_quietly(conn):
+    try:
+        await conn.close()
+    except Exception:
+        pass
+
+
+async def run_queries_async(steps):
+    """Async counterpart of database.run_queries(), on a connection from async_pool."""
+    try:
+        query, params = next(steps)
+    except StopIteration as done:
+        return done.value
+    async with async_pool.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            while True:
+                await cursor.execute(query, params)
+                query, params = steps.send((cursor.column_names, await cursor.fetchall()))
+        except StopIteration as done:
+            return done.value
+        finally:
+            await cursor.close()
+
+
+async_pool = AsyncConnectionPool(ASYNC_DB_POOL_SIZE, ASYNC_DB_ACQUIRE_TIMEOUT, **db_config)
@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from database import get_db_connection
+from database import get_db_connection, replica_set
+from prepared_statements import hot_query
+from async_database import async_pool
+from cache_utils import user_cache
+from password_hashing import password_hasher
+from token_denylist import token_denylist
+import uuid
 
 load_dotenv()
 
@@ -14,23 +19,36 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-it-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+# Trust the role/email/name claims embedded at login instead of loading the
+# user. Profile or role changes then only show up after the next login.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() == "true"
+STATELESS_CLAIMS = ("role", "email", "name")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
 
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_and_update(plain_password, hashed_password)[0]
+
+def verify_and_update_password(plain_password, hashed_password):
+    """(valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    return password_hasher.verify_and_update(plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    return await password_hasher.verify_and_update_async(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=15)
+    # jti identifies the token for revocation; iat lets a user-wide cutoff apply
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -41,30 +59,74 @@ def decode_access_token(token: str):
     except JWTError:
         return None
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+USER_QUERY = hot_query("SELECT id, name, email, role, phone, created_at FROM users WHERE id = %s")
+
+def load_user(user_id: str):
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(USER_QUERY, (user_id,))
+        user = cursor.fetchone()
+        cursor.close()
+        return user
+    finally:
+        conn.close()
+
+async def load_user_async(user_id: str):
+    async with async_pool.connection() as conn:
+        cursor = await conn.cursor(dictionary=True)
+        await cursor.execute(USER_QUERY, (user_id,))
+        user = await cursor.fetchone()
+        await cursor.close()
+        return user
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _token_user(token: str, request: Optional[Request]):
+    """(user_id, user) for a valid token; user is None when it has to be loaded."""
     payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
+    if payload is None or token_denylist.is_revoked(payload):
+        raise _credentials_exception()
     
     user_id = payload.get("sub")
     if user_id is None:
-        raise credentials_exception
-        
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+        raise _credentials_exception()
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name, email, role, phone, created_at FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    # Read-your-writes: this user's reads stay on the primary for a while
+    if request is not None and request.method not in READ_METHODS:
+        replica_set.mark_written(user_id)
     
+    # Tokens issued without the claims fall through to the lookup
+    if AUTH_STATELESS and all(payload.get(claim) for claim in STATELESS_CLAIMS):
+        return user_id, {"id": user_id, "name": payload["name"], "email": payload["email"], "role": payload["role"]}
+    return user_id, user_cache.get(user_id)
+
+def get_current_user(token: str = Depends(oauth2_scheme), request: Request = None):
+    user_id, user = _token_user(token, request)
+    if user is None:
+        generation = user_cache.generation
+        user = load_user(user_id)
+        if user is None:
+            raise _credentials_exception()
+        user_cache.set(user_id, user, generation=generation)
+    # Handlers get their own copy; the cached row is shared
+    return dict(user)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), request: Request = None):
+    """get_current_user for async handlers: a cache miss does not block the event loop."""
+    user_id, user = _token_user(token, request)
     if user is None:
-        raise credentials_exception
-    return user
+        generation = user_cache.generation
+        user = await load_user_async(user_id)
+        if user is None:
+            raise _credentials_exception()
+        user_cache.set(user_id, user, generation=generation)
+    return dict(user)
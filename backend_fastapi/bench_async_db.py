@@ -0,0 +1,89 @@
+"""
+Load test of the hot read endpoints with sync and async handlers: requests
+per second, p50/p99 latency and errors at 100-1000 concurrent clients. Each
+mode runs a fresh uvicorn server (ASYNC_DB_ENABLED=false/true) with the
+product caches disabled, so every request reaches the database. Needs the
+database from .env with products seeded (seeder.py) and httpx installed.
+
+    python bench_async_db.py [seconds] [concurrency ...]
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import httpx
+from database import get_db_connection
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+async def client(http, product_ids, deadline, timings, errors):
+    while time.perf_counter() < deadline:
+        if random.random() < 0.5:
+            url = f"{BASE_URL}/api/products/{random.choice(product_ids)}"
+        else:
+            url = f"{BASE_URL}/api/products/?limit=20&fields=card"
+        start = time.perf_counter()
+        try:
+            status = (await http.get(url)).status_code
+        except httpx.HTTPError:
+            status = "error"
+        if status == 200:
+            timings.append(time.perf_counter() - start)
+        else:
+            errors[status] = errors.get(status, 0) + 1
+
+
+async def load(product_ids, seconds, concurrency):
+    timings, errors = [], {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client(http, product_ids, deadline, timings, errors) for _ in range(concurrency)))
+    timings.sort()
+    if not timings:
+        return 0, 0, 0, errors
+    p50 = timings[len(timings) // 2] * 1e3
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e3
+    return len(timings) / seconds, p50, p99, errors
+
+
+def start_server(async_enabled):
+    env = dict(os.environ, ASYNC_DB_ENABLED=str(async_enabled).lower(), PRODUCT_CACHE_TTL="0", RATE_LIMIT_ENABLED="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"], env=env
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"{BASE_URL}/")
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    levels = [int(arg) for arg in sys.argv[2:]] or [100, 250, 500, 1000]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM products LIMIT 500")
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+
+    for async_enabled in (False, True):
+        server = start_server(async_enabled)
+        try:
+            for concurrency in levels:
+                rps, p50, p99, errors = asyncio.run(load(product_ids, seconds, concurrency))
+                label = "async" if async_enabled else "sync"
+                print(f"{label:<6} {concurrency:>5} clients  {rps:8.0f} req/s  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  errors {errors}")
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,49 @@
+"""
+Authenticated-request throughput of the get_current_user dependency: a
+users lookup per request (previous behaviour), the user cache, and
+stateless claims. Needs the database from .env with at least one user
+(seeder.py).
+
+    python bench_auth.py [requests] [threads]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import auth_utils
+from auth_utils import create_access_token, get_current_user, load_user
+from cache_utils import user_cache
+from database import get_db_connection
+
+
+def lookup_every_time(token):
+    payload = auth_utils.decode_access_token(token)
+    return load_user(payload["sub"])
+
+
+def measure(label, fn, token, requests, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for _ in pool.map(lambda _: fn(token), range(requests)):
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} {requests / elapsed:10.0f} requests/s")
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, email, role FROM users LIMIT 1")
+    user_id, name, email, role = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    token = create_access_token({"sub": user_id, "role": role, "email": email, "name": name})
+
+    print(f"{requests} requests, {threads} threads")
+    measure("db lookup", lookup_every_time, token, requests, threads)
+    user_cache.clear()
+    measure("user cache", get_current_user, token, requests, threads)
+    auth_utils.AUTH_STATELESS = True
+    measure("stateless claims", get_current_user, token, requests, threads)
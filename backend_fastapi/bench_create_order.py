@@ -0,0 +1,72 @@
+"""
+Order-creation write path, before and after batching, for 1/10/100-item
+carts. Needs the database from .env with products seeded (seeder.py).
+Every run is rolled back, so nothing is left behind.
+
+    python bench_create_order.py [runs]
+"""
+import statistics
+import sys
+import time
+import uuid
+from database import get_db_connection
+from routers.orders import OrderItemSchema, _price_items, _insert_order_items
+
+
+def legacy(cursor, user_id, items):
+    # Previous behaviour: trust client prices, one INSERT per line
+    order_id = str(uuid.uuid4())
+    cursor.execute(
+        "INSERT INTO orders (id, user_id, total_amount, shipping_address, status) VALUES (%s, %s, %s, %s, %s)",
+        (order_id, user_id, sum(item.price * item.quantity for item in items), "bench", "pending")
+    )
+    for item in items:
+        cursor.execute(
+            "INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase) VALUES (%s, %s, %s, %s)",
+            (order_id, item.product_id, item.quantity, item.price)
+        )
+
+
+def batched(cursor, user_id, items):
+    order_id = str(uuid.uuid4())
+    priced = _price_items(cursor, items)
+    cursor.execute(
+        "INSERT INTO orders (id, user_id, total_amount, shipping_address, status) VALUES (%s, %s, %s, %s, %s)",
+        (order_id, user_id, sum(item.price * item.quantity for item in priced), "bench", "pending")
+    )
+    _insert_order_items(cursor, order_id, priced)
+
+
+def run(fn, conn, user_id, items, runs):
+    timings = []
+    cursor = conn.cursor()
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(cursor, user_id, items)
+        timings.append(time.perf_counter() - start)
+        conn.rollback()
+    cursor.close()
+    timings.sort()
+    return statistics.median(timings) * 1e3, timings[int(len(timings) * 0.95) - 1] * 1e3
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users LIMIT 1")
+    user_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id, price FROM products")
+    products = cursor.fetchall()
+    cursor.close()
+
+    print(f"{'items':>5} {'legacy p50':>11} {'p95':>8} {'batched p50':>12} {'p95':>8}  (ms)")
+    for size in (1, 10, 100):
+        items = [
+            OrderItemSchema(product_id=products[i % len(products)][0], quantity=1, price=float(products[i % len(products)][1]))
+            for i in range(size)
+        ]
+        legacy_p50, legacy_p95 = run(legacy, conn, user_id, items, runs)
+        batched_p50, batched_p95 = run(batched, conn, user_id, items, runs)
+        print(f"{size:>5} {legacy_p50:>11.2f} {legacy_p95:>8.2f} {batched_p50:>12.2f} {batched_p95:>8.2f}")
+    conn.close()
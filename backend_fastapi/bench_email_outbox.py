@@ -0,0 +1,87 @@
+"""
+Delivery throughput against a local SMTP stand-in: one connection per
+email (the old inline send) versus a reused SMTPSession (what the outbox
+workers do). The stand-in can add a delay to every SMTP command to mimic a
+remote relay. No database needed; needs aiosmtpd (pip install aiosmtpd).
+
+    python bench_email_outbox.py [emails] [delay_ms]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.update({
+    "EMAIL_BACKEND": "smtp",
+    "SMTP_SERVER": "127.0.0.1",
+    "SMTP_PORT": "8025",
+    "SMTP_STARTTLS": "false",
+})
+os.environ.pop("SMTP_USER", None)
+os.environ.pop("SMTP_PASSWORD", None)
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP
+from email_utils import SMTPSession, build_message
+from email_templates import render_order_confirmation
+
+
+class SlowSMTP(SMTP):
+    delay = 0.0
+
+    async def push(self, status):
+        # Every reply, including the greeting, pays the simulated round trip
+        await asyncio.sleep(self.delay)
+        return await super().push(status)
+
+
+class SlowController(Controller):
+    def factory(self):
+        return SlowSMTP(self.handler)
+
+
+class Counter:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def message(n):
+    items = [{"product_id": f"p{k}", "quantity": 1, "price": 9.99} for k in range(3)]
+    return build_message("bench@example.com", *render_order_confirmation(f"order-{n:08d}", 29.97, items))
+
+
+def one_connection_each(emails):
+    for n in range(emails):
+        session = SMTPSession()
+        session.send("bench@example.com", message(n))
+        session.close()
+
+
+def reused_session(emails):
+    session = SMTPSession()
+    for n in range(emails):
+        session.send("bench@example.com", message(n))
+    session.close()
+
+
+if __name__ == "__main__":
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    SlowSMTP.delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 2) / 1000
+
+    counter = Counter()
+    controller = SlowController(counter, hostname="127.0.0.1", port=8025)
+    controller.start()
+    try:
+        print(f"{emails} emails, {SlowSMTP.delay * 1000:.0f} ms per SMTP reply")
+        for label, fn in (("connection per email", one_connection_each), ("reused session", reused_session)):
+            start = time.perf_counter()
+            fn(emails)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<22} {emails / elapsed:8.0f} emails/s")
+    finally:
+        controller.stop()
+    assert counter.received == 2 * emails
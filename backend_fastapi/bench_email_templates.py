@@ -0,0 +1,75 @@
+"""
+Order confirmation rendering throughput: the previous f-string
+concatenation versus the compiled templates, as used by bulk resend and
+backfill jobs. The old code printed raw product ids and escaped nothing;
+the templates also fill in product names and images and HTML-escape
+them, so the comparison is not like for like. No database needed.
+
+    python bench_email_templates.py [emails] [items]
+"""
+import sys
+import time
+from email_templates import render_order_confirmation
+
+
+def legacy(order_id, total_amount, items):
+    # Previous email_utils body building, kept for comparison
+    subject = f"Order Confirmation - Order #{order_id[:8]}"
+    body = f"""
+    Thank you for your order!
+
+    Order ID: {order_id}
+    Total Amount: ${total_amount:.2f}
+
+    Items:
+    """
+    for item in items:
+        body += f"- Product ID: {item['product_id']}, Qty: {item['quantity']}, Price: ${item['price']:.2f}\n"
+    body += "\nWe will notify you when your order is shipped."
+    html_body = f"""
+    <html>
+      <body>
+        <h2>Thank you for your order!</h2>
+        <p><strong>Order ID:</strong> {order_id}</p>
+        <p><strong>Total Amount:</strong> ${total_amount:.2f}</p>
+        <h3>Items:</h3>
+        <ul>
+    """
+    for item in items:
+        html_body += f"<li>Product ID: {item['product_id']}, Qty: {item['quantity']}, Price: ${item['price']:.2f}</li>"
+    html_body += """
+        </ul>
+        <p>We will notify you when your order is shipped.</p>
+      </body>
+    </html>
+    """
+    return subject, body, html_body
+
+
+def measure(label, fn, orders, products, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for order_id, total_amount, items in orders:
+            fn(order_id, total_amount, items, products)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<20} {len(orders) / best:10.0f} emails/s")
+
+
+if __name__ == "__main__":
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    products = {
+        f"p{k}": (f"Premium Cotton T-Shirt #{k}", f"https://images.example.com/{k}/0.jpg") for k in range(100)
+    }
+    orders = [
+        (
+            f"{n:08d}-0000-0000-0000-000000000000",
+            9.99 * size,
+            [{"product_id": f"p{(n + k) % 100}", "quantity": 1, "price": 9.99} for k in range(size)],
+        )
+        for n in range(emails)
+    ]
+    print(f"{emails} confirmations, {size} items each")
+    measure("f-string concat", lambda o, t, i, p: legacy(o, t, i), orders, products)
+    measure("compiled templates", render_order_confirmation, orders, products)
@@ -0,0 +1,91 @@
+"""
+Hammers one SKU from many threads and reports reservation throughput and
+oversell, with the plain conditional UPDATE and with stock buckets.
+Needs the database from .env (MySQL 8.0+ / MariaDB 10.6+). Creates and
+removes its own product.
+
+    python bench_inventory.py [threads] [stock]
+"""
+import sys
+import threading
+import time
+import uuid
+import mysql.connector
+from fastapi import HTTPException
+from database import db_config
+from inventory import DEFAULT_STOCK_BUCKETS, reserve_stock, set_stock_buckets
+
+
+class Line:
+    def __init__(self, product_id, quantity=1):
+        self.product_id = product_id
+        self.quantity = quantity
+
+
+def worker(product_id, stats, lock):
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    sold = rejected = 0
+    while True:
+        try:
+            reserve_stock(cursor, [Line(product_id)])
+            conn.commit()
+            sold += 1
+        except HTTPException:
+            conn.rollback()
+            rejected += 1
+            break
+    cursor.close()
+    conn.close()
+    with lock:
+        stats["sold"] += sold
+        stats["rejected"] += rejected
+
+
+def run(threads, stock, buckets):
+    product_id = f"bench-{uuid.uuid4()}"
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO products (id, name, price, stockQuantity, inStock) VALUES (%s, %s, %s, %s, TRUE)",
+        (product_id, "Inventory bench", 1, stock)
+    )
+    if buckets:
+        set_stock_buckets(cursor, product_id, buckets)
+    conn.commit()
+
+    stats, lock = {"sold": 0, "rejected": 0}, threading.Lock()
+    pool = [threading.Thread(target=worker, args=(product_id, stats, lock)) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    cursor.execute(
+        "SELECT COALESCE(SUM(quantity), 0) FROM stock_buckets WHERE product_id = %s", (product_id,)
+    )
+    left = int(cursor.fetchone()[0])
+    if not buckets:
+        cursor.execute("SELECT stockQuantity FROM products WHERE id = %s", (product_id,))
+        left = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM stock_buckets WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    mode = f"{buckets} buckets" if buckets else "single row"
+    oversell = max(0, stats["sold"] - stock)
+    print(f"{mode:<12} {stats['sold'] / elapsed:>10.0f} orders/s  sold={stats['sold']} "
+          f"left={left} oversell={oversell}")
+    assert oversell == 0 and left >= 0
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    stock = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"{threads} threads, {stock} units of one SKU")
+    run(threads, stock, 0)
+    run(threads, stock, DEFAULT_STOCK_BUCKETS)
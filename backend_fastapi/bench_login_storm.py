@@ -0,0 +1,69 @@
+"""
+Catalog latency while logins hammer the API: idle, with passwords hashed
+inline on the request threads (previous behaviour), and with the hashing
+process pool. Runs the app in-process. Needs the database from .env with
+products seeded (seeder.py); creates and removes its own user.
+
+    python bench_login_storm.py [seconds] [login_threads]
+"""
+import statistics
+import sys
+import threading
+import time
+import uuid
+from fastapi.testclient import TestClient
+import main
+from database import get_db_connection
+from password_hashing import password_hasher
+
+
+def catalog_latencies(client, seconds):
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        client.get("/api/products/", params={"limit": 20})
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings) * 1e3, timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e3
+
+
+def storm(client, email, stop, counts):
+    while not stop.is_set():
+        status = client.post("/api/auth/login", json={"email": email, "password": "bench-password"}).status_code
+        counts[status] = counts.get(status, 0) + 1
+
+
+def run(label, client, email, seconds, threads):
+    stop, counts = threading.Event(), {}
+    pool = [threading.Thread(target=storm, args=(client, email, stop, counts)) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    p50, p99 = catalog_latencies(client, seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    print(f"{label:<16} catalog p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  logins {counts}")
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+
+    with TestClient(main.app) as client:
+        client.post("/api/auth/register", json={"name": "Bench", "email": email, "password": "bench-password"})
+        try:
+            run("no logins", client, email, seconds, 0)
+            workers = password_hasher.workers
+            password_hasher.workers = 0
+            run("inline hashing", client, email, seconds, threads)
+            password_hasher.workers = workers
+            run(f"process pool x{workers}", client, email, seconds, threads)
+        finally:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM users WHERE email = %s", (email,))
+            conn.commit()
+            cursor.close()
+            conn.close()
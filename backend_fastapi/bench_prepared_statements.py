@@ -0,0 +1,93 @@
+"""
+Time per request of the hot lookups (user by id, product by id, wishlist
+join, first page of reviews) sent as text versus as cached server-side
+prepared statements, on one connection so only the protocol differs: the
+gap is the SQL parsing and parameter escaping/row decoding the binary
+protocol saves. Needs the database from .env with data seeded (seeder.py).
+
+    python bench_prepared_statements.py [requests]
+"""
+import random
+import sys
+import time
+import mysql.connector
+from database import db_config
+from auth_utils import USER_QUERY
+from prepared_statements import StatementCache
+from routers.products import PRODUCT_QUERY
+from routers.reviews import FIRST_PAGE_QUERY
+from routers.wishlist import FULL_WISHLIST_QUERY
+
+
+def sample_ids(conn):
+    cursor = conn.cursor()
+    ids = {}
+    for name, query in (
+        ("users", "SELECT id FROM users LIMIT 200"),
+        ("products", "SELECT id FROM products LIMIT 500"),
+        ("wishlist_users", "SELECT DISTINCT user_id FROM wishlist LIMIT 200"),
+        ("reviewed", "SELECT DISTINCT product_id FROM reviews LIMIT 200"),
+    ):
+        cursor.execute(query)
+        ids[name] = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    ids["wishlist_users"] = ids["wishlist_users"] or ids["users"]
+    ids["reviewed"] = ids["reviewed"] or ids["products"]
+    return ids
+
+
+def request_mix(ids, n):
+    """The statements of `n` requests, each doing all four lookups."""
+    return [
+        (
+            (USER_QUERY, (random.choice(ids["users"]),), True),
+            (PRODUCT_QUERY, (random.choice(ids["products"]),), False),
+            (FULL_WISHLIST_QUERY, (random.choice(ids["wishlist_users"]),), False),
+            (FIRST_PAGE_QUERY, (random.choice(ids["reviewed"]), 21), True),
+        )
+        for _ in range(n)
+    ]
+
+
+def run_text(conn, requests):
+    cursors = {False: conn.cursor(), True: conn.cursor(dictionary=True)}
+    started = time.perf_counter()
+    for statements in requests:
+        for query, params, dictionary in statements:
+            cursors[dictionary].execute(query, params)
+            cursors[dictionary].fetchall()
+    elapsed = time.perf_counter() - started
+    for cursor in cursors.values():
+        cursor.close()
+    return elapsed
+
+
+def run_prepared(cache, requests):
+    started = time.perf_counter()
+    for statements in requests:
+        for query, params, dictionary in statements:
+            cache.execute(query, params, dictionary).fetchall()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    conn = mysql.connector.connect(**db_config)
+    requests = request_mix(sample_ids(conn), n)
+    conn.rollback()
+
+    # Warm up the buffer pool and the statement cache before timing
+    cache = StatementCache(conn, 16)
+    run_text(conn, requests[:100])
+    run_prepared(cache, requests[:100])
+
+    text = min(run_text(conn, requests) for _ in range(3))
+    prepared = min(run_prepared(cache, requests) for _ in range(3))
+    conn.close()
+
+    per_text = text / n * 1e6
+    per_prepared = prepared / n * 1e6
+    print(f"{n} requests x 4 lookups")
+    print(f"text      {per_text:9.1f} us/request")
+    print(f"prepared  {per_prepared:9.1f} us/request")
+    print(f"saved     {per_text - per_prepared:9.1f} us/request ({(1 - prepared / text) * 100:.1f}%)")
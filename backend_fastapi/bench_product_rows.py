@@ -0,0 +1,92 @@
+"""
+Compares the old eager per-row decoding (dict row + json.loads of every JSON
+column + bool() of every flag) with ProductRow on a synthetic listing, and
+what product_rows() returns for full rows and for the "card" projection.
+No database needed: python bench_product_rows.py [rows]
+"""
+import json
+import sys
+import time
+import tracemalloc
+from fastapi.encoders import jsonable_encoder
+from product_rows import PROJECTIONS, ProductRow, _column_map, product_rows
+
+COLUMNS = (
+    "id", "name", "description", "price", "originalPrice", "images", "category", "subcategory",
+    "brand", "rating", "reviewCount", "inStock", "stockQuantity", "tags", "featured", "sizes",
+    "colors", "material", "gender", "sku", "discount", "isNew", "isBestseller", "created_at",
+)
+
+
+def make_rows(n):
+    return [
+        (
+            str(i), f"Product {i}", "Premium quality cotton t-shirt with comfortable fit. " * 3,
+            24.99, 34.99, json.dumps([f"https://images.example.com/{i}/{k}.jpg" for k in range(3)]),
+            "Men", "T-Shirts", "ComfortWear", 4.5, 234, 1, 50,
+            json.dumps(["casual", "cotton", "t-shirt", "basic"]), 0,
+            json.dumps(["S", "M", "L", "XL", "XXL"]), json.dumps(["White", "Black", "Navy", "Gray"]),
+            "100% Cotton", "men", f"SKU-{i}", 29, 0, 1, "2024-01-01 00:00:00",
+        )
+        for i in range(n)
+    ]
+
+
+def eager(rows):
+    products = [dict(zip(COLUMNS, values)) for values in rows]
+    for product in products:
+        product['images'] = json.loads(product['images']) if product['images'] else []
+        product['tags'] = json.loads(product['tags']) if product['tags'] else []
+        product['sizes'] = json.loads(product['sizes']) if product['sizes'] else []
+        product['colors'] = json.loads(product['colors']) if product['colors'] else []
+        product['inStock'] = bool(product['inStock'])
+        product['featured'] = bool(product['featured'])
+        product['isNew'] = bool(product['isNew'])
+        product['isBestseller'] = bool(product['isBestseller'])
+    return products
+
+
+def lazy(rows):
+    columns = _column_map(COLUMNS)
+    return [ProductRow(values, columns) for values in rows]
+
+
+def card(products):
+    # What a grid view reads: no tags/sizes/colors
+    return [(p['id'], p['name'], p['price'], p['images'][0], p['rating']) for p in products]
+
+
+def full(products):
+    # What FastAPI does with the returned list
+    return jsonable_encoder(products)
+
+
+def measure(label, fn, rows, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    n = len(rows)
+    print(f"{label:<28} {best / n * 1e6:8.2f} us/row {peak / n:10.0f} bytes/row")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rows = make_rows(n)
+    print(f"{n} rows")
+    measure("eager decode", eager, rows)
+    measure("ProductRow wrap", lazy, rows)
+    measure("eager decode + card view", lambda r: card(eager(r)), rows)
+    measure("ProductRow + card view", lambda r: card(lazy(r)), rows)
+    measure("eager decode + full JSON", lambda r: full(eager(r)), rows)
+    measure("ProductRow + full JSON", lambda r: full(lazy(r)), rows)
+    measure("product_rows + full JSON", lambda r: full(product_rows(COLUMNS, r)), rows)
+    card_columns = PROJECTIONS["card"]
+    card_rows = [tuple(values[COLUMNS.index(column)] for column in card_columns) for values in rows]
+    measure("product_rows + card JSON", lambda r: full(product_rows(card_columns, r)), card_rows)
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    `generation` is bumped on every invalidation. Readers snapshot it before
+    going to the database and pass it back to `set`, so a value read before a
+    concurrent write can never be stored after that write invalidated it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation: int = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self.generation += 1
+            entry = self._data.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Decoded single products keyed by id, and decoded listing results keyed by query
+product_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL", "300")),
+)
+product_list_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_LIST_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL", "300")),
+)
+
+def invalidate_product(product_id: str = None, listings: bool = True):
+    """
+    Drop a product (or every product) and, unless listings=False, all cached
+    listings that may contain it. Reads of the product, and with listings
+    of the whole catalog, stay on the primary for a while: a replica that
+    has not applied the write yet would cache the old rows again. Writes
+    that only move a product's rating or stock pass listings=False; cached
+    listings pick those up when they expire.
+    """
+    # database imports this module
+    from database import CATALOG, product_scope, replica_set
+    if product_id is None:
+        product_cache.clear()
+    else:
+        product_cache.pop(product_id)
+        replica_set.mark_written(product_scope(product_id))
+    if listings or product_id is None:
+        product_list_cache.clear()
+        replica_set.mark_written(CATALOG)
+
+
+# Authenticated users keyed by the token's `sub`, so get_current_user can
+# skip the users lookup. Kept short-lived: only update_profile invalidates.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+
+def invalidate_user(user_id: str):
+    user_cache.pop(user_id)
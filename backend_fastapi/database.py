@@ -1,7 +1,45 @@
+"""
+The MySQL connection pool. get_db_connection() waits up to DB_POOL_TIMEOUT
+seconds for a free connection when all DB_POOL_SIZE are checked out, then
+raises 503 with Retry-After instead of failing the request outright. It
+still returns None when the database cannot be reached.
+
+Connections are handed out wrapped so the pool can see them: checkout wait
+and hold times feed pool_stats(), and a connection held longer than
+DB_LEAK_SECONDS is reported once, with the stack that checked it out. A
+connection dropped without close() is returned to the pool once it is
+garbage collected, so a leak costs a slot only while something still
+references it. Use `with db_connection() as conn:` where a handler can raise
+between checkout and close.
+
+Reads that tolerate replication lag ask for get_db_connection(read_only=True)
+and are served by a replica from DB_REPLICA_HOSTS when one is healthy. A
+user who just made a write request keeps reading from the primary for
+DB_STICKY_SECONDS so they see their own change. Shared data works the same
+way under scope keys: a product write marks CATALOG and the product's own
+scope, a review only the product's; listings read under CATALOG and a
+product or its reviews under the product's scope (product pages under
+both), so for that window nobody reads (and caches) the rows a lagging
+replica still has. Stickiness is per worker process; behind
+several workers a follow-up request may land elsewhere, so keep the window
+above typical replication lag.
+"""
 import mysql.connector
-from mysql.connector import pooling
+import itertools
 import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from cache_utils import TTLCache
+from query_stats import wrap_cursor
+import prepared_statements
+from prepared_statements import PREPARED_STATEMENTS_ENABLED, PreparingCursor
 
 load_dotenv()
 
@@ -12,17 +50,465 @@ db_config = {
     "database": os.getenv("DB_NAME", "eliteshop"),
 }
 
-# Create a connection pool
-connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=10,
-    **db_config
-)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_LEAK_SECONDS = float(os.getenv("DB_LEAK_SECONDS", "30"))
+STACK_LIMIT = 20
+# Comma-separated host[:port] list; user, password and database as for the primary
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+DB_REPLICA_POLICY = os.getenv("DB_REPLICA_POLICY", "least_loaded")  # or round_robin
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "5"))
+# Replicas further behind than this are taken out of rotation
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))
+DB_STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "5"))
+# Sticky scope of products, their listings and reviews (a tuple, so it
+# cannot collide with a user id)
+CATALOG = ("scope", "catalog")
+
+
+def product_scope(product_id: str):
+    """Sticky scope of one product's row, reviews and rating."""
+    return ("product", product_id)
+
+
+def _checkout_site(depth):
+    """(code, line) pairs for the stack `depth` frames above the caller; cheap to take."""
+    frame = sys._getframe(1)
+    for _ in range(depth):
+        if frame.f_back is None:
+            break
+        frame = frame.f_back
+    site = []
+    while frame is not None and len(site) < STACK_LIMIT:
+        site.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    return site
+
+
+def _format_site(site):
+    return "".join(traceback.format_list([
+        traceback.FrameSummary(code.co_filename, line, code.co_name) for code, line in reversed(site)
+    ]))
+
+
+class PooledConnection:
+    """A checked-out connection; close() (or leaving a `with` block) returns it once."""
+
+    __slots__ = ("_conn", "_pool", "checked_out_at", "_site", "long_lived", "reported", "_finalizer", "__weakref__")
+
+    def __init__(self, conn, pool, site):
+        self._conn = conn
+        self._pool = pool
+        self.checked_out_at = time.monotonic()
+        # Only formatted if the connection is reported
+        self._site = site
+        self.long_lived = False
+        self.reported = False
+        # Queues the driver connection for the pool to take back if this
+        # wrapper is garbage collected without close(); only an append, as
+        # it can run inside any code that triggers a collection
+        self._finalizer = weakref.finalize(self, pool._abandoned.append, (conn, self.checked_out_at, site))
+        self._finalizer.atexit = False
+
+    def allow_long_hold(self):
+        """Exempt this checkout from leak reports (e.g. a streaming export)."""
+        self.long_lived = True
+
+    def checkout_stack(self):
+        return _format_site(self._site)
+
+    def cursor(self, *args, **kwargs):
+        """A driver cursor, counted towards the current request's query stats."""
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        cursor = self._conn.cursor(*args, **kwargs)
+        if PREPARED_STATEMENTS_ENABLED and not args and set(kwargs) <= {"dictionary"}:
+            # Statements are cached on the connection, which outlives this checkout
+            cursor = PreparingCursor(cursor, self._conn, kwargs.get("dictionary", False))
+        return wrap_cursor(cursor)
 
-def get_db_connection():
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._finalizer.detach()
+        self._pool._check_in(conn, self.checked_out_at, self)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _rollback_open_transaction(conn):
+    # Without the pool's session reset a transaction (and its read snapshot)
+    # would carry over to the next checkout
     try:
-        connection = connection_pool.get_connection()
-        return connection
-    except mysql.connector.Error as err:
-        print(f"Error connecting to database: {err}")
+        if conn.in_transaction:
+            conn.rollback()
+    except mysql.connector.Error:
+        pass  # a dead connection is reconnected on its next checkout
+
+
+class ConnectionPool:
+    """
+    Up to `size` driver connections, opened on demand and kept open between
+    checkouts. The pool holds the connections themselves rather than the
+    driver's per-checkout wrappers, so per-connection state such as the
+    prepared statement cache can be keyed on them.
+    """
+
+    def __init__(self, size: int, timeout: float, leak_seconds: float, pool_name: str = "mypool", **config):
+        self.name = pool_name
+        self.size = size
+        self.timeout = timeout
+        self.leak_seconds = leak_seconds
+        # A session reset would deallocate the connection's prepared statements
+        self.reset_session = not PREPARED_STATEMENTS_ENABLED
+        self._config = config
+        self._idle = []  # open connections, reused newest first
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # Weak, so a connection its caller dropped can be collected and reclaimed
+        self._checked_out = weakref.WeakSet()
+        self._abandoned = deque()
+        self._next_leak_scan = 0.0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.leaks = 0
+        self.reclaimed = 0
+        self._wait_total = self._wait_max = 0.0
+        self._hold_total = self._hold_max = 0.0
+        self._released = 0
+
+    def get_connection(self, depth: int = 1):
+        """
+        A PooledConnection, None if the database is unreachable; 503 after
+        `timeout`. `depth` is how many frames up the checkout site is.
+        """
+        started = time.monotonic()
+        if self._abandoned:
+            self._reclaim_abandoned()
+        if started >= self._next_leak_scan:
+            self.report_leaks()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.timeouts += 1
+                self.report_leaks()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server busy, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+        try:
+            conn = self._open()
+        except mysql.connector.Error as err:
+            self._slots.release()
+            print(f"Error connecting to database: {err}")
+            return None
+        pooled = PooledConnection(conn, self, _checkout_site(depth + 1))
+        waited = pooled.checked_out_at - started
+        with self._lock:
+            self._checked_out.add(pooled)
+            self.checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return pooled
+
+    def _open(self):
+        """An idle connection, reconnected if it dropped, or a new one."""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            return mysql.connector.connect(**self._config)
+        if not conn.is_connected():
+            conn.reconnect()
+        return conn
+
+    def _check_in(self, conn, checked_out_at, pooled=None):
+        try:
+            if self.reset_session:
+                conn.reset_session()
+            else:
+                _rollback_open_transaction(conn)
+        except mysql.connector.Error:
+            pass  # a dead connection is reconnected on its next checkout
+        finally:
+            with self._lock:
+                self._idle.append(conn)
+            self._release(checked_out_at, pooled)
+
+    def _reclaim_abandoned(self):
+        """Return the connections of wrappers collected without close()."""
+        while self._abandoned:
+            conn, checked_out_at, site = self._abandoned.popleft()
+            with self._lock:
+                self.reclaimed += 1
+            print(
+                "Database connection garbage collected without close(), returning it to the pool; checked out at:\n"
+                + _format_site(site)
+            )
+            try:
+                self._check_in(conn, checked_out_at)
+            except mysql.connector.Error:
+                pass  # the slot is released either way
+
+    def _release(self, checked_out_at, pooled=None):
+        held = time.monotonic() - checked_out_at
+        with self._lock:
+            # A collected wrapper has already left the WeakSet
+            if pooled is not None:
+                self._checked_out.discard(pooled)
+            self._released += 1
+            self._hold_total += held
+            self._hold_max = max(self._hold_max, held)
+        self._slots.release()
+
+    def report_leaks(self):
+        """Print every connection held past leak_seconds that was not reported yet."""
+        now = time.monotonic()
+        self._next_leak_scan = now + self.leak_seconds / 2
+        if self._abandoned:
+            self._reclaim_abandoned()
+        with self._lock:
+            leaked = [
+                pooled for pooled in self._checked_out
+                if not pooled.reported and not pooled.long_lived and now - pooled.checked_out_at > self.leak_seconds
+            ]
+            for pooled in leaked:
+                pooled.reported = True
+            self.leaks += len(leaked)
+        for pooled in leaked:
+            print(
+                f"Database connection held for {now - pooled.checked_out_at:.1f}s, checked out at:\n"
+                + pooled.checkout_stack()
+            )
+
+    @property
+    def in_use(self):
+        return len(self._checked_out)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": len(self._checked_out),
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "leaks_reported": self.leaks,
+                "leaks_reclaimed": self.reclaimed,
+                "wait_ms_avg": round(self._wait_total / self.checkouts * 1e3, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self._wait_max * 1e3, 3),
+                "hold_ms_avg": round(self._hold_total / self._released * 1e3, 3) if self._released else 0.0,
+                "hold_ms_max": round(self._hold_max * 1e3, 3),
+            }
+
+
+class Replica:
+    def __init__(self, host: str, config: dict, index: int):
+        hostname, _, port = host.partition(":")
+        self.host = host
+        self.config = dict(config, host=hostname, **({"port": int(port)} if port else {}))
+        self.pool_name = f"replica{index}"
+        self.pool = None
+        self.healthy = False
+        self.lag = None
+
+    def check(self):
+        """Probe on a connection of its own; the pool is (re)built once the replica answers."""
+        try:
+            conn = mysql.connector.connect(connection_timeout=2, **self.config)
+        except mysql.connector.Error as err:
+            if self.healthy:
+                print(f"Replica {self.host} unreachable: {err}")
+            self.healthy = False
+            return
+        try:
+            self.lag = _replication_lag(conn)
+        finally:
+            conn.close()
+        if self.pool is None:
+            try:
+                self.pool = ConnectionPool(
+                    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_LEAK_SECONDS, pool_name=self.pool_name, **self.config
+                )
+            except mysql.connector.Error as err:
+                print(f"Error creating pool for replica {self.host}: {err}")
+                return
+        self.healthy = self.lag is None or self.lag <= DB_REPLICA_MAX_LAG
+
+    def stats(self):
+        stats = {"host": self.host, "healthy": self.healthy, "lag_seconds": self.lag}
+        if self.pool is not None:
+            stats.update(self.pool.stats())
+        return stats
+
+
+def _replication_lag(conn):
+    """Seconds behind the source, inf if replication is stopped, None if unknown."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for query, column in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),  # MariaDB, MySQL < 8.0.22
+        ):
+            try:
+                cursor.execute(query)
+            except mysql.connector.Error:
+                continue
+            row = cursor.fetchone()
+            cursor.fetchall()
+            if row is None:
+                # Not a replica (or no privilege to tell): trust it
+                return None
+            return float("inf") if row.get(column) is None else float(row[column])
         return None
+    finally:
+        cursor.close()
+
+
+class ReplicaSet:
+    def __init__(self, hosts, policy: str, config: dict):
+        self.replicas = [Replica(host, config, index) for index, host in enumerate(hosts, 1)]
+        self.policy = policy
+        self._turn = itertools.count()
+        # Users who recently sent a write request, and scopes recently
+        # written, read from the primary
+        self._sticky = TTLCache(maxsize=100000, ttl=DB_STICKY_SECONDS)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def mark_written(self, key):
+        """`key` is a user id or a scope such as CATALOG or product_scope(id)."""
+        self._sticky.set(key, True)
+
+    def choose(self):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        turn = next(self._turn)
+        if self.policy == "round_robin":
+            return healthy[turn % len(healthy)]
+        # Rotating the start spreads ties between equally loaded replicas
+        start = turn % len(healthy)
+        return min(healthy[start:] + healthy[:start], key=lambda replica: replica.pool.in_use)
+
+    def get_connection(self, user_id=None, depth: int = 1, scope=None):
+        """
+        A replica connection, or None when the primary should serve the read.
+        `scope` is one scope key or a list of them.
+        """
+        scopes = scope if isinstance(scope, list) else [scope]
+        if any(key is not None and self._sticky.get(key) for key in [user_id, *scopes]):
+            return None
+        replica = self.choose()
+        if replica is None:
+            return None
+        conn = replica.pool.get_connection(depth + 1)
+        if conn is None:
+            replica.healthy = False
+        return conn
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def start(self):
+        if not self.replicas or self._thread:
+            return
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(DB_REPLICA_CHECK_SECONDS):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error checking replicas: {e}")
+
+
+connection_pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_LEAK_SECONDS, **db_config)
+replica_set = ReplicaSet(DB_REPLICA_HOSTS, DB_REPLICA_POLICY, db_config)
+
+def get_db_connection(read_only: bool = False, user_id: str = None, scope=None):
+    """
+    A primary connection, or with read_only=True a replica one when a
+    healthy replica exists and neither `user_id` nor `scope` was written
+    recently.
+    """
+    if read_only and replica_set:
+        conn = replica_set.get_connection(user_id, scope=scope)
+        if conn is not None:
+            return conn
+    return connection_pool.get_connection()
+
+@contextmanager
+def db_connection():
+    """Check out a connection that is returned however the block exits."""
+    conn = connection_pool.get_connection(depth=2)
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def pool_stats():
+    stats = connection_pool.stats()
+    stats["replicas"] = [replica.stats() for replica in replica_set.replicas]
+    stats["prepared_statements"] = prepared_statements.stats()
+    return stats
+
+def run_queries(steps, conn=None, read_only: bool = False, user_id: str = None, scope=None):
+    """
+    Drive a query generator (see async_database.py) on `conn`, or on a
+    pooled connection checked out for the first query and released after.
+    Returns the generator's return value.
+    """
+    try:
+        query, params = next(steps)
+    except StopIteration as done:
+        return done.value
+    owned = conn is None
+    if owned:
+        conn = get_db_connection(read_only, user_id, scope)
+        if not conn:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(query, params)
+            query, params = steps.send((cursor.column_names, cursor.fetchall()))
+    except StopIteration as done:
+        return done.value
+    finally:
+        cursor.close()
+        if owned:
+            conn.close()
@@ -0,0 +1,225 @@
+"""
+Transactional outbox for outgoing email. Request handlers only insert an
+email_outbox row on their own cursor, in the same transaction as the change
+the email is about, so an email is queued exactly when that change commits
+and checkout never waits on SMTP.
+
+A small pool of background threads drains the table: each claims a batch
+with FOR UPDATE SKIP LOCKED, sends it over its own long-lived SMTP session
+and records the outcome. Failed sends are retried with exponential backoff
+until EMAIL_MAX_ATTEMPTS, then left as 'failed'. A claimed row whose worker
+died is picked up again once its lease runs out, so delivery is at least
+once: a crash between sending and recording can repeat an email.
+
+SKIP LOCKED needs MySQL 8.0+ or MariaDB 10.6+.
+"""
+import json
+import os
+import random
+import threading
+from dotenv import load_dotenv
+from database import get_db_connection
+from email_utils import SMTPSession, build_message
+from email_templates import fetch_product_summaries, render_order_confirmation
+
+load_dotenv()
+
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "2"))
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+CLAIM_LEASE_SECONDS = 5 * 60
+
+# kind -> (product ids the email mentions, renderer(payload, products))
+RENDERERS = {
+    "order_confirmation": (
+        lambda payload: [item["product_id"] for item in payload["items"]],
+        lambda payload, products: render_order_confirmation(
+            payload["order_id"], payload["total_amount"], payload["items"], products
+        ),
+    ),
+}
+
+
+def enqueue_email(cursor, kind, recipient, payload):
+    """Queue an email on the caller's cursor; it is sent after commit."""
+    cursor.execute(
+        "INSERT INTO email_outbox (kind, recipient, payload) VALUES (%s, %s, %s)",
+        (kind, recipient, json.dumps(payload))
+    )
+
+
+def enqueue_order_confirmation(cursor, to_email, order_id, total_amount, items):
+    enqueue_email(cursor, "order_confirmation", to_email, {
+        "order_id": order_id,
+        "total_amount": float(total_amount),
+        "items": [
+            {"product_id": item.product_id, "quantity": item.quantity, "price": float(item.price)}
+            for item in items
+        ],
+    })
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds, after `attempts` tries."""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return int(delay * random.uniform(0.5, 1.0))
+
+
+def _in_list(ids):
+    return "(" + ", ".join(["%s"] * len(ids)) + ")"
+
+
+class EmailOutboxWorker:
+    def __init__(self, workers: int, batch_size: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"email-outbox-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Tell idle workers there is new mail instead of waiting for the next poll."""
+        self._wake.set()
+
+    def _run(self):
+        session = SMTPSession()
+        try:
+            while not self._stop.is_set():
+                try:
+                    claimed = self.drain_once(session)
+                except Exception as e:
+                    print(f"Email outbox worker error: {e}")
+                    claimed = 0
+                if claimed < self.batch_size:
+                    self._wake.wait(EMAIL_POLL_SECONDS)
+                    self._wake.clear()
+        finally:
+            session.close()
+
+    def _claim(self, cursor):
+        cursor.execute(
+            "SELECT id, kind, recipient, payload, attempts FROM email_outbox "
+            "WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW() "
+            "ORDER BY next_attempt_at, id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (self.batch_size,)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            ids = [row[0] for row in rows]
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, "
+                "next_attempt_at = NOW() + INTERVAL %s SECOND WHERE id IN " + _in_list(ids),
+                [CLAIM_LEASE_SECONDS] + ids
+            )
+        return rows
+
+    def drain_once(self, session: SMTPSession):
+        """Claim and send one batch. Returns the number of rows claimed."""
+        conn = get_db_connection()
+        if not conn:
+            return 0
+        cursor = conn.cursor()
+        try:
+            rows = self._claim(cursor)
+            # Release the row locks before talking to SMTP
+            conn.commit()
+            if not rows:
+                return 0
+
+            # A payload that cannot be read fails its own row like a bad
+            # send; raising here would roll back the whole batch and leave
+            # it to be claimed again, attempts never reaching the limit
+            batch = []
+            product_ids = []
+            for outbox_id, kind, recipient, payload, attempts in rows:
+                try:
+                    payload = json.loads(payload)
+                    if kind in RENDERERS:
+                        product_ids.extend(RENDERERS[kind][0](payload))
+                except Exception as e:
+                    self._record_failure(cursor, outbox_id, attempts + 1, e)
+                    continue
+                batch.append((outbox_id, kind, recipient, payload, attempts))
+            # Product names and images for the whole batch in one lookup
+            products = fetch_product_summaries(cursor, product_ids)
+
+            sent_ids = []
+            for outbox_id, kind, recipient, payload, attempts in batch:
+                try:
+                    subject, body, html_body = RENDERERS[kind][1](payload, products)
+                    session.send(recipient, build_message(recipient, subject, body, html_body))
+                    sent_ids.append(outbox_id)
+                except Exception as e:
+                    self._record_failure(cursor, outbox_id, attempts + 1, e)
+                    # Whatever broke may have left the session unusable
+                    session.close()
+
+            if sent_ids:
+                cursor.execute(
+                    "UPDATE email_outbox SET status = 'sent', sent_at = NOW(), last_error = NULL "
+                    "WHERE id IN " + _in_list(sent_ids),
+                    sent_ids
+                )
+            conn.commit()
+            with self._lock:
+                self._sent += len(sent_ids)
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _record_failure(self, cursor, outbox_id, attempts, error):
+        print(f"Failed to send email {outbox_id} (attempt {attempts}): {error}")
+        if attempts >= EMAIL_MAX_ATTEMPTS:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'failed', last_error = %s WHERE id = %s",
+                (str(error)[:1000], outbox_id)
+            )
+            with self._lock:
+                self._failed += 1
+        else:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'pending', last_error = %s, "
+                "next_attempt_at = NOW() + INTERVAL %s SECOND WHERE id = %s",
+                (str(error)[:1000], retry_delay(attempts), outbox_id)
+            )
+            with self._lock:
+                self._retried += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "sent": self._sent,
+                "retried": self._retried,
+                "failed": self._failed,
+            }
+
+
+email_outbox = EmailOutboxWorker(workers=EMAIL_WORKERS, batch_size=EMAIL_BATCH_SIZE)
@@ -0,0 +1,123 @@
+"""
+Email templates, compiled once at import. Templates use str.format field
+syntax ("{order_id}", "{price:.2f}") and are compiled into plain Python
+functions that join literal text and formatted fields in one step, so
+rendering does no parsing and no per-item string concatenation.
+"""
+import html
+import io
+import json
+from string import Formatter
+
+NUMERIC_FORMATS = set("bdeEfFgGnoxX%")
+
+
+class Template:
+    def __init__(self, source: str, escape=None):
+        pieces = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if literal:
+                pieces.append(repr(literal))
+            if field is not None:
+                if conversion:
+                    raise ValueError(f"Conversions are not supported: {{{field}!{conversion}}}")
+                value = f"format(context[{field!r}], {spec!r})" if spec else f"str(context[{field!r}])"
+                # Numeric formats ("{price:.2f}") cannot produce markup
+                numeric = spec and spec[-1] in NUMERIC_FORMATS
+                pieces.append(f"escape({value})" if escape and not numeric else value)
+        # The template becomes one function whose body is a single join
+        code = f"lambda context: ''.join(({', '.join(pieces)},))" if pieces else "lambda context: ''"
+        self.render = eval(code, {"escape": escape, "format": format, "str": str})
+
+
+class ListTemplate:
+    """A header, one row template repeated per item, and a footer."""
+
+    def __init__(self, header: str, row: str, footer: str, escape=None):
+        self.header = Template(header, escape)
+        self.row = Template(row, escape)
+        self.footer = Template(footer, escape)
+
+    def render(self, context, rows):
+        out = io.StringIO()
+        out.write(self.header.render(context))
+        out.writelines(map(self.row.render, rows))
+        out.write(self.footer.render(context))
+        return out.getvalue()
+
+
+ORDER_CONFIRMATION_SUBJECT = Template("Order Confirmation - Order #{short_id}")
+
+ORDER_CONFIRMATION_TEXT = ListTemplate(
+    header="""
+    Thank you for your order!
+
+    Order ID: {order_id}
+    Total Amount: ${total_amount:.2f}
+
+    Items:
+""",
+    row="    - {name}, Qty: {quantity}, Price: ${price:.2f}\n",
+    footer="\n    We will notify you when your order is shipped.\n",
+)
+
+ORDER_CONFIRMATION_HTML = ListTemplate(
+    header="""<html>
+  <body>
+    <h2>Thank you for your order!</h2>
+    <p><strong>Order ID:</strong> {order_id}</p>
+    <p><strong>Total Amount:</strong> ${total_amount:.2f}</p>
+    <h3>Items:</h3>
+    <table>
+""",
+    row="""      <tr>
+        <td><img src="{image}" alt="" width="64" height="64"></td>
+        <td>{name}</td>
+        <td>Qty: {quantity}</td>
+        <td>${price:.2f}</td>
+      </tr>
+""",
+    footer="""    </table>
+    <p>We will notify you when your order is shipped.</p>
+  </body>
+</html>
+""",
+    escape=lambda text: html.escape(text, quote=True),
+)
+
+
+def fetch_product_summaries(cursor, product_ids):
+    """{product_id: (name, first image URL)} for all ids in one query."""
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return {}
+    cursor.execute(
+        "SELECT id, name, images FROM products WHERE id IN (" + ", ".join(["%s"] * len(product_ids)) + ")",
+        product_ids
+    )
+    summaries = {}
+    for product_id, name, images in cursor.fetchall():
+        images = json.loads(images) if images else []
+        summaries[product_id] = (name, images[0] if images else "")
+    return summaries
+
+
+def render_order_confirmation(order_id: str, total_amount: float, items: list, products: dict = None):
+    """
+    Return (subject, plain text, html) for an order confirmation. `items`
+    are dicts with product_id, quantity and price; `products` comes from
+    fetch_product_summaries(). Products missing from it (deleted since the
+    order, or no lookup done) are shown by id.
+    """
+    products = products or {}
+    context = {"order_id": order_id, "short_id": order_id[:8], "total_amount": total_amount}
+    rows = []
+    for item in items:
+        product = products.get(item["product_id"])
+        name, image = product if product else (f"Product {item['product_id']}", "")
+        rows.append({"name": name, "image": image, "quantity": item["quantity"], "price": item["price"]})
+    return (
+        ORDER_CONFIRMATION_SUBJECT.render(context),
+        ORDER_CONFIRMATION_TEXT.render(context, rows),
+        ORDER_CONFIRMATION_HTML.render(context, rows),
+    )
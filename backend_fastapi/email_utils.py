@@ -1,84 +1,106 @@
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+from dotenv import load_dotenv
+from email_templates import render_order_confirmation
 
-def send_order_confirmation_email(to_email: str, order_id: str, total_amount: float, items: list):
-    """
-    Sends an order confirmation email.
-    If SMTP credentials are not set, logs the email to console.
-    """
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    sender_email = os.getenv("SENDER_EMAIL", smtp_user)
+load_dotenv()
 
-    subject = f"Order Confirmation - Order #{order_id[:8]}"
-    
-    # Construct Plain Text Body
-    body = f"""
-    Thank you for your order!
-    
-    Order ID: {order_id}
-    Total Amount: ${total_amount:.2f}
-    
-    Items:
-    """
-    for item in items:
-        # Assuming item is a dict or object with name/quantity/price
-        # In create_order, we only have product_id, quantity, price. 
-        # Ideally we would look up names, but for now let's show basics.
-        body += f"- Product ID: {item.product_id}, Qty: {item.quantity}, Price: ${item.price:.2f}\n"
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SENDER_EMAIL = os.getenv("SENDER_EMAIL", SMTP_USER or "no-reply@eliteshop.local")
+# "smtp" or "console". Defaults to smtp only when credentials are set; force
+# smtp to talk to an unauthenticated local server (e.g. aiosmtpd in tests).
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "smtp" if SMTP_USER and SMTP_PASSWORD else "console")
+# A session idle longer than this is probed with NOOP before reuse
+SMTP_IDLE_CHECK_SECONDS = 30
 
-    body += "\nWe will notify you when your order is shipped."
 
-    # HTML Body
-    html_body = f"""
-    <html>
-      <body>
-        <h2>Thank you for your order!</h2>
-        <p><strong>Order ID:</strong> {order_id}</p>
-        <p><strong>Total Amount:</strong> ${total_amount:.2f}</p>
-        <h3>Items:</h3>
-        <ul>
+def build_message(to_email: str, subject: str, body: str, html_body: str):
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = to_email
+    msg.attach(MIMEText(body, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
+class SMTPSession:
     """
-    for item in items:
-        html_body += f"<li>Product ID: {item.product_id}, Qty: {item.quantity}, Price: ${item.price:.2f}</li>"
-    
-    html_body += """
-        </ul>
-        <p>We will notify you when your order is shipped.</p>
-      </body>
-    </html>
+    One SMTP connection kept open across many messages, so the TCP
+    handshake, STARTTLS and AUTH are paid once per session rather than once
+    per email. Not thread-safe: give each worker its own session.
     """
 
-    if not smtp_user or not smtp_password:
-        print("---------------------------------------------------")
-        print(f"MOCK EMAIL TO: {to_email}")
-        print(f"SUBJECT: {subject}")
-        print(body)
-        print("---------------------------------------------------")
-        print("To send real emails, set SMTP_USER and SMTP_PASSWORD environment variables.")
-        return
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
 
-    try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = sender_email
-        msg["To"] = to_email
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USER and SMTP_PASSWORD:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        return server
 
-        part1 = MIMEText(body, "plain")
-        part2 = MIMEText(html_body, "html")
+    def _alive(self):
+        if time.monotonic() - self._last_used < SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
 
-        msg.attach(part1)
-        msg.attach(part2)
+    def send(self, to_email: str, msg):
+        if EMAIL_BACKEND != "smtp":
+            print("---------------------------------------------------")
+            print(f"MOCK EMAIL TO: {to_email}")
+            print(f"SUBJECT: {msg['Subject']}")
+            print(msg.get_payload(0).get_payload())
+            print("---------------------------------------------------")
+            return
 
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.sendmail(sender_email, to_email, msg.as_string())
-        server.quit()
+        if self._server is not None and not self._alive():
+            self.close()
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle session; retry once on a fresh one
+            self._server = self._connect()
+            self._server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+def send_order_confirmation_email(to_email: str, order_id: str, total_amount: float, items: list, products: dict = None):
+    """
+    Sends an order confirmation email right away on a one-off connection.
+    Checkout queues confirmations through email_outbox instead.
+    If SMTP is not configured, logs the email to console.
+    """
+    msg = build_message(to_email, *render_order_confirmation(order_id, total_amount, items, products))
+    session = SMTPSession()
+    try:
+        session.send(to_email, msg)
         print(f"Email sent successfully to {to_email}")
     except Exception as e:
         print(f"Failed to send email: {e}")
+    finally:
+        session.close()
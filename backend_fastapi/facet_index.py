@@ -0,0 +1,321 @@
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from database import get_db_connection
+
+# Facet name -> products column. sizes/colors are JSON arrays, the rest scalars.
+FACET_COLUMNS = {
+    "category": "category",
+    "brand": "brand",
+    "gender": "gender",
+    "size": "sizes",
+    "color": "colors",
+}
+MULTI_VALUED = {"size", "color"}
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ("0-25", 0, 25),
+    ("25-50", 25, 50),
+    ("50-100", 50, 100),
+    ("100-200", 100, 200),
+    ("200+", 200, None),
+]
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(value):
+        return bin(value).count("1")
+
+
+def _bitmap(docs, size):
+    buf = bytearray((size >> 3) + 1)
+    for doc in docs:
+        buf[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(buf, "little")
+
+
+class _RangeIndex:
+    """
+    (value, doc) pairs kept sorted, plus prefix bitmaps of the first k*step
+    entries, so a range is the XOR of two prefixes and each prefix only
+    sets the bits of at most `step` entries past its checkpoint. The
+    checkpoints are rebuilt on the first range query after a change.
+    """
+
+    MAX_CHECKPOINTS = 64
+
+    def __init__(self):
+        self._entries = []
+        self._value_of = {}
+        self._step = 0
+        self._checkpoints = None
+
+    def get(self, doc, default=None):
+        return self._value_of.get(doc, default)
+
+    def add(self, doc, value):
+        self._value_of[doc] = value
+        insort(self._entries, (value, doc))
+        self._checkpoints = None
+
+    def remove(self, doc):
+        del self._entries[bisect_left(self._entries, (self._value_of.pop(doc), doc))]
+        self._checkpoints = None
+
+    def _build(self, size):
+        self._step = max(256, -(-len(self._entries) // self.MAX_CHECKPOINTS))
+        buf = bytearray((size >> 3) + 1)
+        checkpoints = [0]
+        for position, (_, doc) in enumerate(self._entries, 1):
+            buf[doc >> 3] |= 1 << (doc & 7)
+            if position % self._step == 0:
+                checkpoints.append(int.from_bytes(buf, "little"))
+        self._checkpoints = checkpoints
+
+    def _prefix(self, end, size):
+        block = end // self._step
+        start = block * self._step
+        return self._checkpoints[block] | _bitmap((doc for _, doc in self._entries[start:end]), size)
+
+    def range(self, minimum, maximum, size):
+        """Bitmap of the docs whose value is within [minimum, maximum] (None: unbounded)."""
+        if self._checkpoints is None:
+            self._build(size)
+        low = 0 if minimum is None else bisect_left(self._entries, (minimum, -1))
+        high = len(self._entries) if maximum is None else bisect_right(self._entries, (maximum, size))
+        if high <= low:
+            return 0
+        return self._prefix(high, size) ^ self._prefix(low, size)
+
+
+def _price_bucket(price):
+    for label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return label
+    return PRICE_BUCKETS[0][0]
+
+
+class FacetIndex:
+    """
+    Posting lists for product facets, stored as int bitmaps over a dense
+    document number per product. Filtering is a chain of `&`/`|` and counts
+    are popcounts, so no GROUP BY is needed to build the facet sidebar.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._doc_of = {}       # product_id -> document number
+        self._free_docs = []    # document numbers released by deletes
+        self._next_doc = 0
+        self._live = 0
+        self._featured = 0
+        self._postings = {facet: {} for facet in FACET_COLUMNS}
+        self._postings["price"] = {}
+        self._doc_values = {}   # product_id -> [(facet, value), ...], for removal
+        self._signatures = {}   # product_id -> everything indexed, to skip unchanged rows
+        self._prices = _RangeIndex()    # for arbitrary price ranges
+        self._ratings = _RangeIndex()   # for minimum ratings
+
+    def __len__(self):
+        return len(self._doc_of)
+
+    def _remove(self, product_id):
+        doc = self._doc_of.pop(product_id, None)
+        if doc is None:
+            return
+        mask = ~(1 << doc)
+        for facet, value in self._doc_values.pop(product_id):
+            postings = self._postings[facet]
+            postings[value] &= mask
+            if not postings[value]:
+                del postings[value]
+        del self._signatures[product_id]
+        self._live &= mask
+        self._featured &= mask
+        self._prices.remove(doc)
+        self._ratings.remove(doc)
+        self._free_docs.append(doc)
+
+    def _add(self, product):
+        product_id = product['id']
+        # Product edits don't carry the rating; keep the one indexed before
+        rating = product.get('rating')
+        if rating is None:
+            rating = self._ratings.get(self._doc_of.get(product_id), 0)
+        rating = float(rating)
+
+        values = []
+        for facet, column in FACET_COLUMNS.items():
+            raw = product.get(column)
+            if facet in MULTI_VALUED:
+                if isinstance(raw, (str, bytes)):
+                    raw = json.loads(raw)
+                values.extend((facet, value) for value in set(raw or []))
+            elif raw is not None:
+                values.append((facet, raw))
+        price = float(product.get('price') or 0)
+        values.append(("price", _price_bucket(price)))
+
+        # Refreshes re-add every row whose stock or rating moved; most of
+        # them change nothing indexed here
+        featured = bool(product.get('featured'))
+        signature = (frozenset(values), price, rating, featured)
+        if self._signatures.get(product_id) == signature:
+            return
+        self._remove(product_id)
+        if self._free_docs:
+            doc = self._free_docs.pop()
+        else:
+            doc = self._next_doc
+            self._next_doc += 1
+        self._doc_of[product_id] = doc
+        bit = 1 << doc
+
+        for facet, value in values:
+            postings = self._postings[facet]
+            postings[value] = postings.get(value, 0) | bit
+        self._doc_values[product_id] = values
+        self._signatures[product_id] = signature
+        self._live |= bit
+        if featured:
+            self._featured |= bit
+        self._prices.add(doc, price)
+        self._ratings.add(doc, rating)
+
+    def add(self, product: dict):
+        """Index a product, replacing any previous version of it."""
+        with self._lock:
+            self._add(product)
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._remove(product_id)
+
+    def set_rating(self, product_id: str, rating: float):
+        """Move a product to its new average rating after a review change."""
+        with self._lock:
+            doc = self._doc_of.get(product_id)
+            if doc is None:
+                return
+            rating = float(rating)
+            values, price, _, featured = self._signatures[product_id]
+            self._signatures[product_id] = (values, price, rating, featured)
+            self._ratings.remove(doc)
+            self._ratings.add(doc, rating)
+
+    def load(self, fetch_products, force: bool = False):
+        """
+        (Re)build the index from `fetch_products()`. The fetch runs under the
+        index lock so a write that lands mid-build is applied after it.
+        """
+        with self._lock:
+            if self.loaded and not force:
+                return
+            products = fetch_products()
+            self._reset()
+            for product in products:
+                self._add(product)
+            self.loaded = True
+
+    def _selected(self, filters, min_price, max_price, min_rating=None):
+        """{facet: bitmap of products matching that facet's selection}"""
+        selected = {}
+        for facet, values in filters.items():
+            if values:
+                postings = self._postings[facet]
+                bitmap = 0
+                for value in values:
+                    bitmap |= postings.get(value, 0)
+                selected[facet] = bitmap
+        if min_price is not None or max_price is not None:
+            selected["price"] = self._prices.range(min_price, max_price, self._next_doc)
+        if min_rating is not None:
+            selected["rating"] = self._ratings.range(min_rating, None, self._next_doc)
+        return selected
+
+    def matching(self, product_ids, filters: dict, featured: bool = False, min_price: float = None,
+                 max_price: float = None, min_rating: float = None, limit: int = None):
+        """The first `limit` of `product_ids` (kept in order) that pass `filters`, as for facet_counts."""
+        with self._lock:
+            matched = self._featured if featured else self._live
+            for bitmap in self._selected(filters, min_price, max_price, min_rating).values():
+                matched &= bitmap
+            result = []
+            for product_id in product_ids:
+                doc = self._doc_of.get(product_id)
+                if doc is not None and matched >> doc & 1:
+                    result.append(product_id)
+                    if len(result) == limit:
+                        break
+            return result
+
+    def facet_counts(self, filters: dict, featured: bool = False, min_price: float = None,
+                     max_price: float = None, min_rating: float = None, product_ids=None):
+        """
+        Count products per facet value under `filters` ({facet: [values]}).
+        Values inside one facet are OR'ed and facets are AND'ed. Each facet's
+        own selection is left out of its counts, so the sidebar still shows
+        what choosing another value of that facet would return.
+
+        `product_ids` narrows the universe, e.g. to search hits.
+        Returns (total matching products, {facet: {value: count}}).
+        """
+        with self._lock:
+            base = self._live
+            if featured:
+                base &= self._featured
+            if product_ids is not None:
+                base &= _bitmap((self._doc_of[pid] for pid in product_ids if pid in self._doc_of), self._next_doc)
+
+            selected = self._selected(filters, min_price, max_price, min_rating)
+            matched = base
+            for bitmap in selected.values():
+                matched &= bitmap
+
+            counts = {}
+            for facet, postings in self._postings.items():
+                universe = base
+                for other, bitmap in selected.items():
+                    if other != facet:
+                        universe &= bitmap
+                facet_counts = {}
+                for value, bitmap in postings.items():
+                    count = popcount(universe & bitmap)
+                    if count:
+                        facet_counts[value] = count
+                counts[facet] = facet_counts
+
+        return popcount(matched), counts
+
+
+facet_index = FacetIndex()
+
+def fetch_facet_products(since=None):
+    """Indexed columns of every product, or of those updated at or after `since`."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        query = "SELECT id, category, brand, gender, sizes, colors, price, rating, featured FROM products"
+        if since is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query + " WHERE updated_at >= %s", (since,))
+        products = cursor.fetchall()
+        cursor.close()
+        return products
+    finally:
+        conn.close()
+
+def ensure_facet_index():
+    """Build the index from the products table the first time it is needed."""
+    if not facet_index.loaded:
+        facet_index.load(fetch_facet_products)
+    return facet_index
@@ -0,0 +1,79 @@
+import os
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from cache_utils import TTLCache
+
+load_dotenv()
+
+IN_FLIGHT_WAIT_SECONDS = 30
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different payload."""
+
+
+class IdempotencyStore:
+    """
+    Remembers the result of a keyed operation so retries get the original
+    response instead of running it again. While the first request for a key
+    is still executing, duplicates wait for its outcome rather than starting
+    their own. Only successful results are remembered, so a request that
+    failed can be retried with the same key. A key comes with the
+    fingerprint of its request's payload; reusing it for a different payload
+    raises IdempotencyKeyReused instead of replaying an unrelated result.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fingerprint, operation):
+        """Return (result, replayed) for `operation()` under `key`."""
+        with self._lock:
+            stored = self._results.get(key)
+            if stored is not None:
+                return self._replay(stored, fingerprint), True
+            stored = self._in_flight.get(key)
+            owner = stored is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = (fingerprint, future)
+
+        if not owner:
+            first_fingerprint, future = stored
+            if first_fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            return future.result(timeout=IN_FLIGHT_WAIT_SECONDS), True
+
+        try:
+            result = operation()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self._results.set(key, (fingerprint, result))
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @staticmethod
+    def _replay(stored, fingerprint):
+        first_fingerprint, result = stored
+        if first_fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        return result
+
+    def stats(self):
+        stats = self._results.stats()
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+order_idempotency = IdempotencyStore(
+    maxsize=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", str(60 * 60 * 24))),
+)
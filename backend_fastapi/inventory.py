@@ -0,0 +1,163 @@
+"""
+Stock reservation for checkout. Everything here runs on the caller's cursor,
+inside the order transaction, so a failed order releases its stock by
+rolling back.
+
+Ordinary products are decremented with a conditional UPDATE on products.
+A product that gets flash-sale traffic can be switched to stock buckets:
+its stock is split across several stock_buckets rows and each order takes
+from a bucket no other transaction holds (FOR UPDATE SKIP LOCKED), so
+concurrent orders for that SKU stop queueing on a single row lock. For a
+bucketed product the buckets are the source of truth and
+products.stockQuantity is refreshed by sync_bucketed_stock().
+
+SKIP LOCKED needs MySQL 8.0+ or MariaDB 10.6+.
+"""
+import os
+from collections import Counter
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_STOCK_BUCKETS = int(os.getenv("STOCK_BUCKETS", "8"))
+
+
+def _insufficient(product_ids):
+    raise HTTPException(status_code=409, detail=f"Insufficient stock for: {', '.join(sorted(product_ids))}")
+
+
+def _bucketed_products(cursor, product_ids):
+    cursor.execute(
+        "SELECT DISTINCT product_id FROM stock_buckets WHERE product_id IN (" + ", ".join(["%s"] * len(product_ids)) + ")",
+        list(product_ids)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _reserve_from_products(cursor, quantities):
+    """One conditional UPDATE for every non-bucketed product in the order."""
+    product_ids = sorted(quantities)
+    case = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(product_ids)) + " END"
+    case_params = [value for product_id in product_ids for value in (product_id, quantities[product_id])]
+    # MySQL applies SET assignments left to right, so inStock sees the new stockQuantity
+    cursor.execute(
+        f"UPDATE products SET stockQuantity = stockQuantity - {case}, inStock = stockQuantity > 0 "
+        f"WHERE id IN (" + ", ".join(["%s"] * len(product_ids)) + f") AND stockQuantity >= {case}",
+        case_params + product_ids + case_params
+    )
+    if cursor.rowcount != len(product_ids):
+        cursor.execute(
+            "SELECT id, stockQuantity FROM products WHERE id IN (" + ", ".join(["%s"] * len(product_ids)) + ")",
+            product_ids
+        )
+        stock = dict(cursor.fetchall())
+        _insufficient(pid for pid in product_ids if (stock.get(pid) or 0) < quantities[pid])
+
+
+def _reserve_from_buckets(cursor, product_id, quantity):
+    # Fast path: any bucket that can cover the whole quantity and that no
+    # other transaction is holding right now
+    cursor.execute(
+        "SELECT bucket FROM stock_buckets WHERE product_id = %s AND quantity >= %s LIMIT 1 FOR UPDATE SKIP LOCKED",
+        (product_id, quantity)
+    )
+    row = cursor.fetchone()
+    if row:
+        cursor.execute(
+            "UPDATE stock_buckets SET quantity = quantity - %s WHERE product_id = %s AND bucket = %s",
+            (quantity, product_id, row[0])
+        )
+        return
+
+    # Slow path: no single free bucket is enough. Wait for all of them and
+    # drain the largest first.
+    cursor.execute(
+        "SELECT bucket, quantity FROM stock_buckets WHERE product_id = %s ORDER BY quantity DESC FOR UPDATE",
+        (product_id,)
+    )
+    buckets = cursor.fetchall()
+    available = sum(bucket_quantity for _, bucket_quantity in buckets)
+    if available < quantity:
+        _insufficient([product_id])
+
+    remaining = quantity
+    for bucket, bucket_quantity in buckets:
+        take = min(bucket_quantity, remaining)
+        if take:
+            cursor.execute(
+                "UPDATE stock_buckets SET quantity = quantity - %s WHERE product_id = %s AND bucket = %s",
+                (take, product_id, bucket)
+            )
+            remaining -= take
+        if not remaining:
+            break
+    if available == quantity:
+        cursor.execute("UPDATE products SET stockQuantity = 0, inStock = FALSE WHERE id = %s", (product_id,))
+
+
+def reserve_stock(cursor, items):
+    """
+    Take stock for every line of an order (objects with product_id and
+    quantity). Raises 409 naming the products that cannot be covered.
+    """
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id] += item.quantity
+
+    bucketed = _bucketed_products(cursor, quantities)
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in bucketed}
+    if plain:
+        _reserve_from_products(cursor, plain)
+    for product_id in sorted(bucketed):
+        _reserve_from_buckets(cursor, product_id, quantities[product_id])
+
+
+def set_stock_buckets(cursor, product_id, buckets, total=None):
+    """
+    Split a product's stock across `buckets` rows, or fold it back into
+    products.stockQuantity when `buckets` is 0. `total` replaces the stock
+    level; by default the current level is kept.
+    """
+    cursor.execute("SELECT stockQuantity FROM products WHERE id = %s FOR UPDATE", (product_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if total is None:
+        cursor.execute(
+            "SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM stock_buckets WHERE product_id = %s FOR UPDATE",
+            (product_id,)
+        )
+        count, bucketed_total = cursor.fetchone()
+        total = int(bucketed_total) if count else row[0]
+
+    cursor.execute("DELETE FROM stock_buckets WHERE product_id = %s", (product_id,))
+    if buckets > 0:
+        share, extra = divmod(total, buckets)
+        rows = [(product_id, bucket, share + (1 if bucket < extra else 0)) for bucket in range(buckets)]
+        cursor.execute(
+            "INSERT INTO stock_buckets (product_id, bucket, quantity) VALUES " + ", ".join(["(%s, %s, %s)"] * buckets),
+            [value for row in rows for value in row]
+        )
+    cursor.execute(
+        "UPDATE products SET stockQuantity = %s, inStock = %s WHERE id = %s",
+        (total, total > 0, product_id)
+    )
+
+
+def bucket_count(cursor, product_id):
+    cursor.execute("SELECT COUNT(*) FROM stock_buckets WHERE product_id = %s", (product_id,))
+    return cursor.fetchone()[0]
+
+
+def sync_bucketed_stock(cursor):
+    """Copy bucket totals into products.stockQuantity/inStock for display."""
+    cursor.execute(
+        """
+        UPDATE products p
+        JOIN (SELECT product_id, SUM(quantity) AS total FROM stock_buckets GROUP BY product_id) b
+          ON p.id = b.product_id
+        SET p.stockQuantity = b.total, p.inStock = b.total > 0
+        """
+    )
+    return cursor.rowcount
@@ -1,16 +1,61 @@
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from routers import products, auth, orders, users, wishlist, notifications, addresses, reviews
+from contextlib import asynccontextmanager
+from routers import products, auth, orders, users, wishlist, notifications, addresses, reviews, admin
+from email_outbox import email_outbox
+from password_hashing import password_hasher
+from token_denylist import token_denylist
+from ratings import rating_reconciler
+from async_database import async_pool
+from database import replica_set
+from search_index import ensure_search_index
+from facet_index import ensure_facet_index
+from product_indexes import product_index_refresher
+import rollups
+from rate_limit import Limit, RateLimitMiddleware, RouteLimit
+from query_stats import QueryStatsMiddleware
+import os
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    password_hasher.start()
+    token_denylist.start()
+    email_outbox.start()
+    rating_reconciler.start()
+    replica_set.start()
+    try:
+        if rollups.rebuild(only_if_empty=True):
+            print("Built dashboard rollups from existing orders")
+    except Exception as e:
+        print(f"Error building dashboard rollups: {e}")
+    # Built before serving: with ASYNC_DB_ENABLED the listing runs on the
+    # event loop, where a first build's full-table read would stall every
+    # request. If this fails the first listing request builds them instead.
+    try:
+        ensure_search_index()
+        ensure_facet_index()
+    except Exception as e:
+        print(f"Error building product indexes: {e}")
+    product_index_refresher.start()
+    yield
+    product_index_refresher.stop()
+    await async_pool.close()
+    replica_set.stop()
+    rating_reconciler.stop()
+    email_outbox.stop()
+    token_denylist.stop()
+    password_hasher.shutdown()
+
 app = FastAPI(
     title="EliteShop API",
     description="Professional E-commerce API for EliteShop Platform via FastAPI.",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 origins = [
@@ -18,12 +63,34 @@ origins = [
     "http://localhost:3000",
 ]
 
+# X-DB-Queries / Server-Timing on every response, N+1 alarm (query_stats.py)
+app.add_middleware(QueryStatsMiddleware)
+
+# Route-specific limits; add a RouteLimit here to throttle any other endpoint.
+# Registered before CORS so 429 responses still carry CORS headers.
+app.add_middleware(
+    RateLimitMiddleware,
+    routes=[
+        RouteLimit(
+            "/api/auth/login",
+            per_ip=Limit.parse(os.getenv("LOGIN_RATE_LIMIT_IP", "20/minute")),
+            per_email=Limit.parse(os.getenv("LOGIN_RATE_LIMIT_EMAIL", "5/minute")),
+        ),
+        RouteLimit(
+            "/api/auth/register",
+            per_ip=Limit.parse(os.getenv("REGISTER_RATE_LIMIT_IP", "5/minute")),
+            per_email=Limit.parse(os.getenv("REGISTER_RATE_LIMIT_EMAIL", "3/hour")),
+        ),
+    ],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "Server-Timing"],
 )
 
 app.include_router(products.router, prefix="/api/products", tags=["products"])
@@ -34,6 +101,7 @@ app.include_router(wishlist.router, prefix="/api/wishlist", tags=["wishlist"])
 app.include_router(notifications.router, prefix="/api/notifications", tags=["notifications"])
 app.include_router(addresses.router, prefix="/api/addresses", tags=["addresses"])
 app.include_router(reviews.router, prefix="/api/reviews", tags=["reviews"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 @app.get("/")
 def read_root():
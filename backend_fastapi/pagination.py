@@ -0,0 +1,55 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_cursor(*values) -> str:
+    """Pack the keyset position of the last row of a page into an opaque token."""
+    raw = json.dumps(values, default=_encode_value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, length: int, convert=()) -> list:
+    """
+    The `length` values packed by encode_cursor(). `convert` holds a function
+    per value (None keeps it as decoded) turning it back into a query
+    parameter; a value it rejects makes the cursor invalid (400).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        for i, function in enumerate(convert):
+            if function is not None:
+                values[i] = function(values[i])
+    except (ValueError, TypeError, ArithmeticError):  # decimal.InvalidOperation is an ArithmeticError
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_condition(column: str, descending: bool, id_column: str = "id") -> str:
+    """
+    WHERE fragment selecting rows after (value, id) in ORDER BY column, id.
+    Written out instead of a row comparison so MySQL can range-scan the
+    matching (column, id) index. Takes params (value, value, id).
+    """
+    op = "<" if descending else ">"
+    return f"({column} {op} %s OR ({column} = %s AND {id_column} {op} %s))"
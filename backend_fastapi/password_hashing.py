@@ -0,0 +1,144 @@
+"""
+Password hashing off the request threads. sha256_crypt at hundreds of
+thousands of rounds is pure CPU, so a burst of logins run on the shared
+threadpool holds the GIL and stalls every other endpoint. Hashing and
+verification run in a small process pool instead, and at most
+PASSWORD_HASH_QUEUE of them may be queued or running at once; past that,
+callers get 503 with Retry-After rather than piling up.
+
+The app starts the pool from its lifespan, before any background threads
+exist, so the workers can simply be forked (spawn would re-import the app
+and open a database pool in every worker). A pool replaced after a worker
+dies comes from a forkserver instead: by then the app is multi-threaded,
+and a fork could copy a lock some other thread held. The forkserver has
+imported just this module; its workers also import the __main__ script,
+harmless under `uvicorn main:app`. PASSWORD_HASH_WORKERS=0 hashes inline on
+the calling thread.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+load_dotenv()
+
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "535000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(max(1, PASSWORD_HASH_WORKERS) * 8)))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+# Pinning min/max rounds to the configured value makes passlib report any
+# hash made with other parameters (or a deprecated scheme) as needing an
+# update, which login uses to rehash transparently.
+pwd_context = CryptContext(
+    schemes=["sha256_crypt"],
+    deprecated="auto",
+    sha256_crypt__default_rounds=PASSWORD_HASH_ROUNDS,
+    sha256_crypt__min_rounds=PASSWORD_HASH_ROUNDS,
+    sha256_crypt__max_rounds=PASSWORD_HASH_ROUNDS,
+)
+
+
+def _forkserver_context():
+    context = multiprocessing.get_context("forkserver")
+    # Workers need this module, not the app (which would open a database pool)
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._executor = None
+        self._context = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spin the workers up now instead of on the first login."""
+        if self.workers:
+            self._pool().submit(_hash, "warm-up").result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _discard_broken(self):
+        # A worker died (e.g. OOM-killed); the next caller gets a fresh pool,
+        # started from the forkserver rather than forked from this process
+        self.shutdown()
+        self._context = _forkserver_context()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise _busy()
+        try:
+            return self._pool().submit(fn, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+        except FutureTimeoutError:
+            raise _busy()
+        except BrokenProcessPool:
+            self._discard_broken()
+            raise _busy()
+        finally:
+            self._slots.release()
+
+    async def _run_async(self, fn, *args):
+        # Same limits as _run, but the caller awaits instead of holding a thread
+        if not self.workers:
+            return await asyncio.to_thread(fn, *args)
+        if not self._slots.acquire(blocking=False):
+            raise _busy()
+        try:
+            future = self._pool().submit(fn, *args)
+            return await asyncio.wait_for(asyncio.wrap_future(future), PASSWORD_HASH_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise _busy()
+        except BrokenProcessPool:
+            self._discard_broken()
+            raise _busy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password)
+
+    def verify_and_update(self, password, hashed_password):
+        """Return (valid, new_hash); new_hash is set when the stored hash is outdated."""
+        return self._run(_verify_and_update, password, hashed_password)
+
+    async def verify_and_update_async(self, password, hashed_password):
+        return await self._run_async(_verify_and_update, password, hashed_password)
+
+
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS, queue_limit=PASSWORD_HASH_QUEUE)
@@ -0,0 +1,171 @@
+"""
+Server-side prepared statements for the hottest queries. A query registered
+with hot_query() is prepared once per pooled connection and from then on
+executed with the binary protocol: the server skips parsing it and the
+driver sends parameters and reads rows without building or escaping SQL
+text. Everything else still goes over the text protocol.
+
+Each physical connection keeps up to PREPARED_CACHE_SIZE prepared cursors,
+closing (and deallocating on the server) the least recently used one past
+that. Statements belong to the session, so the pool stops resetting
+sessions on checkin while this is enabled; database.PooledConnection rolls
+back an open transaction instead. When the pool reconnects a dropped
+connection the cache notices the new connection id and prepares again, and
+a statement the server no longer knows is re-prepared on a new cursor and
+retried once.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+import mysql.connector
+from mysql.connector import errorcode
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PREPARED_STATEMENTS_ENABLED = os.getenv("PREPARED_STATEMENTS_ENABLED", "true").lower() == "true"
+PREPARED_CACHE_SIZE = int(os.getenv("PREPARED_CACHE_SIZE", "16"))
+
+# Registered query text -> the registered string itself. The driver only
+# reuses a prepared statement when given the identical string object.
+_hot_queries = {}
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def hot_query(query: str) -> str:
+    """Register `query` to run as a prepared statement; returns it unchanged."""
+    return _hot_queries.setdefault(query, query)
+
+
+class StatementCache:
+    """Prepared cursors of one physical connection, least recently used closed first."""
+
+    def __init__(self, cnx, size: int):
+        self._cnx = cnx
+        self.size = size
+        self._connection_id = None
+        self._cursors = OrderedDict()
+        self.prepares = 0
+        self.hits = 0
+
+    def execute(self, query: str, params, dictionary: bool):
+        """Run `query` on its prepared cursor and return that cursor for fetching."""
+        if self._cnx.connection_id != self._connection_id:
+            # New session after a reconnect: the old statements went with the
+            # old one, so drop the cursors without trying to close them
+            self._cursors.clear()
+            self._connection_id = self._cnx.connection_id
+        key = (query, dictionary)
+        cursor = self._cursors.get(key)
+        if cursor is None:
+            cursor = self._cursors[key] = self._cnx.cursor(prepared=True, dictionary=dictionary)
+            self.prepares += 1
+            if len(self._cursors) > self.size:
+                _, evicted = self._cursors.popitem(last=False)
+                _close_quietly(evicted)
+        else:
+            self._cursors.move_to_end(key)
+            self.hits += 1
+        try:
+            cursor.execute(query, params)
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_UNKNOWN_STMT_HANDLER:
+                raise
+            # Deallocated behind our back (e.g. a session reset). The cursor
+            # still holds the dead handle and would not prepare again, so
+            # swap in a new one
+            _close_quietly(cursor)
+            cursor = self._cursors[key] = self._cnx.cursor(prepared=True, dictionary=dictionary)
+            self.prepares += 1
+            cursor.execute(query, params)
+        return cursor
+
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+
+
+def statement_cache(cnx) -> StatementCache:
+    cache = _caches.get(cnx)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(cnx)
+            if cache is None:
+                cache = _caches[cnx] = StatementCache(cnx, PREPARED_CACHE_SIZE)
+    return cache
+
+
+def stats():
+    caches = list(_caches.values())
+    return {
+        "enabled": PREPARED_STATEMENTS_ENABLED,
+        "hot_queries": len(_hot_queries),
+        "connections": len(caches),
+        "prepares": sum(cache.prepares for cache in caches),
+        "hits": sum(cache.hits for cache in caches),
+    }
+
+
+class PreparingCursor:
+    """
+    A driver cursor that hands registered hot queries to the connection's
+    prepared cursors; fetches and result attributes follow whichever cursor
+    ran the last statement.
+    """
+
+    __slots__ = ("_cursor", "_cnx", "_dictionary", "_active")
+
+    def __init__(self, cursor, cnx, dictionary: bool = False):
+        self._cursor = cursor
+        self._cnx = cnx
+        self._dictionary = dictionary
+        self._active = cursor
+
+    def execute(self, operation, params=(), *args, **kwargs):
+        self._finish()
+        query = _hot_queries.get(operation)
+        if query is None or args or kwargs:
+            self._active = self._cursor
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        self._active = statement_cache(self._cnx).execute(query, params, self._dictionary)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._finish()
+        self._active = self._cursor
+        return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def _finish(self):
+        # Prepared cursors stay open for the next request, so read whatever
+        # the caller left of their result off the connection now
+        if self._active is not self._cursor and self._cnx.unread_result:
+            self._active.fetchall()
+
+    def fetchone(self):
+        return self._active.fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        return self._active.fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        return self._active.fetchall()
+
+    def __iter__(self):
+        return iter(self._active.fetchone, None)
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._active, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,92 @@
+"""
+Keeps this worker's in-memory product indexes (search and facets) in step
+with the products table. Each process builds its own copy and a product
+write only updates the copy of the process that served it, so every
+worker polls the table: rows whose updated_at moved since the last poll
+are indexed again, and an index holding a different number of products
+than the table (a delete in another worker) is rebuilt.
+
+updated_at is set when a statement runs but becomes visible at commit, so
+every poll also looks back one interval for rows committed late.
+"""
+import os
+import threading
+from datetime import timedelta
+from dotenv import load_dotenv
+from database import get_db_connection
+from search_index import ensure_search_index, fetch_searchable_products, search_index
+from facet_index import ensure_facet_index, fetch_facet_products, facet_index
+
+load_dotenv()
+
+PRODUCT_INDEX_REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "30"))
+
+# (index, builds it if needed, fetch_products(since=None))
+INDEXES = (
+    (search_index, ensure_search_index, fetch_searchable_products),
+    (facet_index, ensure_facet_index, fetch_facet_products),
+)
+
+
+class ProductIndexRefresher:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._since = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _table_state(self):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*), MAX(updated_at) FROM products")
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def refresh_once(self):
+        """Apply product changes made since the last call; returns how many were re-indexed."""
+        count, latest = self._table_state()
+        changed = 0
+        for index, ensure, fetch_products in INDEXES:
+            if self._since is not None and index.loaded:
+                products = fetch_products(since=self._since)
+                for product in products:
+                    index.add(product)
+                changed = max(changed, len(products))
+            ensure()
+            if len(index) != count:
+                index.load(fetch_products, force=True)
+        if latest is not None:
+            self._since = latest - timedelta(seconds=self.interval)
+        return changed
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        try:
+            self.refresh_once()
+        except Exception as e:
+            print(f"Error refreshing product indexes: {e}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="product-indexes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_once()
+            except Exception as e:
+                print(f"Error refreshing product indexes: {e}")
+
+
+product_index_refresher = ProductIndexRefresher(PRODUCT_INDEX_REFRESH_SECONDS)
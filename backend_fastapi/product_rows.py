@@ -0,0 +1,140 @@
+import json
+from collections.abc import Mapping
+from fastapi import HTTPException
+
+JSON_COLUMNS = ("images", "tags", "sizes", "colors")
+BOOL_COLUMNS = ("inStock", "featured", "isNew", "isBestseller")
+_DECODED = dict.fromkeys(JSON_COLUMNS, json)
+_DECODED.update(dict.fromkeys(BOOL_COLUMNS, bool))
+
+PRODUCT_COLUMNS = (
+    "id", "name", "description", "price", "originalPrice", "images", "category", "subcategory",
+    "brand", "rating", "reviewCount", "inStock", "stockQuantity", "tags", "featured", "sizes",
+    "colors", "material", "gender", "sku", "discount", "isNew", "isBestseller", "created_at",
+)
+
+# Named projections for ?fields=. "card" is what a product grid tile renders.
+PROJECTIONS = {
+    "card": (
+        "id", "name", "price", "originalPrice", "images", "category", "brand", "rating",
+        "reviewCount", "inStock", "discount", "isNew", "isBestseller",
+    ),
+    "detail": PRODUCT_COLUMNS,
+}
+
+_column_maps = {}
+
+
+def _column_map(column_names):
+    """Shared {column: position} lookup, one per distinct SELECT list."""
+    column_names = tuple(column_names)
+    columns = _column_maps.get(column_names)
+    if columns is None:
+        columns = _column_maps[column_names] = {name: i for i, name in enumerate(column_names)}
+    return columns
+
+
+def _is_full_row(columns):
+    return len(columns) >= len(PRODUCT_COLUMNS) and all(column in columns for column in PRODUCT_COLUMNS)
+
+
+def _decode(product):
+    """Parse the JSON columns and coerce the flags of a full row dict in place."""
+    for column in JSON_COLUMNS:
+        value = product[column]
+        product[column] = json.loads(value) if value else []
+    for column in BOOL_COLUMNS:
+        product[column] = bool(product[column])
+    return product
+
+
+class ProductRow(Mapping):
+    """
+    Read-only mapping over a projection of a products row (?fields=).
+
+    Values stay in the tuple the driver returned; the column-name lookup is
+    shared by every row of a query. JSON columns are parsed the first time
+    they are read and the parsed value is kept. Flag columns come back as
+    bool. Full rows are returned as plain dicts instead: every field gets
+    serialized anyway and jsonable_encoder walks a dict much faster than a
+    Mapping.
+    """
+
+    __slots__ = ("_values", "_columns", "images", "tags", "sizes", "colors")
+
+    def __init__(self, values, columns):
+        self._values = values
+        self._columns = columns
+
+    def __getitem__(self, key):
+        value = self._values[self._columns[key]]
+        kind = _DECODED.get(key)
+        if kind is None:
+            return value
+        if kind is bool:
+            return bool(value)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            decoded = json.loads(value) if value else []
+            setattr(self, key, decoded)
+            return decoded
+
+    def keys(self):
+        return self._columns.keys()
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __repr__(self):
+        return f"ProductRow(id={self.get('id')!r})"
+
+
+def product_columns(fields: str = None, required=("id",)):
+    """
+    Resolve a ?fields= value (a projection name or comma-separated columns)
+    to the tuple of products columns to SELECT. `required` columns are always
+    included, e.g. the ones a keyset cursor is built from.
+    """
+    if not fields:
+        return PRODUCT_COLUMNS
+    if fields in PROJECTIONS:
+        requested = PROJECTIONS[fields]
+    else:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in PRODUCT_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    columns = list(required)
+    columns.extend(column for column in requested if column not in columns)
+    return tuple(columns)
+
+def select_list(columns, table_alias: str = None) -> str:
+    if columns == PRODUCT_COLUMNS:
+        return f"{table_alias}.*" if table_alias else "*"
+    prefix = f"{table_alias}." if table_alias else ""
+    return ", ".join(prefix + column for column in columns)
+
+def product_rows(column_names, rows):
+    """Already fetched rows (tuples): dicts for full rows, ProductRows for projections."""
+    column_names = tuple(column_names)
+    columns = _column_map(column_names)
+    if _is_full_row(columns):
+        return [_decode(dict(zip(column_names, values))) for values in rows]
+    return [ProductRow(values, columns) for values in rows]
+
+def fetch_product_rows(cursor):
+    """All remaining rows of a plain (non-dictionary) cursor, as product_rows() returns them."""
+    return product_rows(cursor.column_names, cursor.fetchall())
+
+def fetch_product_row(cursor):
+    values = cursor.fetchone()
+    if values is None:
+        return None
+    return product_rows(cursor.column_names, (values,))[0]
@@ -0,0 +1,201 @@
+"""
+Per-request database instrumentation. QueryStatsMiddleware gives every HTTP
+request a QueryStats in a context variable; cursors opened on pooled
+connections while it is set (sync or async, including in threadpool
+handlers) are wrapped to count statements, rows fetched and time spent in
+the driver. Responses carry the totals as X-DB-Queries and Server-Timing
+headers. Headers go out with the first response message, so a streamed body
+(the order export) only reports the queries made before it started.
+
+Statements are also counted by shape: the SQL with literals and parameters
+replaced by `?` and placeholder lists collapsed, so the same lookup issued
+once per row of an earlier result shows up as one shape repeated. A shape
+repeated more than QUERY_REPEAT_LIMIT times in one request is an N+1:
+QUERY_REPEAT_ACTION=log prints it when the request ends, raise fails the
+query that crosses the limit (for tests and development), off ignores it.
+"""
+import functools
+import os
+import re
+import time
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "10"))
+QUERY_REPEAT_ACTION = os.getenv("QUERY_REPEAT_ACTION", "log").lower()  # log, raise or off
+
+_LITERALS = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|\?""")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_REPEATED_LISTS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+_current = ContextVar("query_stats", default=None)
+
+
+class RepeatedQueryError(RuntimeError):
+    pass
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(operation: str) -> str:
+    """'SELECT * FROM t WHERE id IN (%s, %s)' -> 'SELECT * FROM t WHERE id IN (?)'"""
+    shape = _LITERALS.sub("?", operation)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    shape = _REPEATED_LISTS.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    __slots__ = ("queries", "rows", "seconds", "shapes")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def count(self, operation):
+        self.queries += 1
+        shape = statement_shape(operation if isinstance(operation, str) else operation.decode())
+        repeats = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if repeats > QUERY_REPEAT_LIMIT and QUERY_REPEAT_ACTION == "raise":
+            raise RepeatedQueryError(f"Query repeated {repeats} times in one request: {shape}")
+
+    def repeated(self):
+        """{shape: count} for shapes issued more than QUERY_REPEAT_LIMIT times."""
+        return {shape: repeats for shape, repeats in self.shapes.items() if repeats > QUERY_REPEAT_LIMIT}
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1e3:.2f};desc="{self.queries} queries, {self.rows} rows"'
+
+
+def wrap_cursor(cursor):
+    stats = _current.get()
+    return cursor if stats is None else CountedCursor(cursor, stats)
+
+
+def wrap_async_cursor(cursor):
+    stats = _current.get()
+    return cursor if stats is None else AsyncCountedCursor(cursor, stats)
+
+
+class CountedCursor:
+    __slots__ = ("_cursor", "_stats")
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, operation, *args, **kwargs):
+        self._stats.count(operation)
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            self._stats.seconds += time.perf_counter() - started
+
+    def executemany(self, operation, *args, **kwargs):
+        self._stats.count(operation)
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            self._stats.seconds += time.perf_counter() - started
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._stats.seconds += time.perf_counter() - started
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.seconds += time.perf_counter() - started
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._stats.seconds += time.perf_counter() - started
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class AsyncCountedCursor:
+    __slots__ = ("_cursor", "_stats")
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    async def execute(self, operation, *args, **kwargs):
+        self._stats.count(operation)
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            self._stats.seconds += time.perf_counter() - started
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await self._cursor.fetchone()
+        self._stats.seconds += time.perf_counter() - started
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        self._stats.seconds += time.perf_counter() - started
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_STATS_ENABLED:
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Queries", str(stats.queries))
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        token = _current.set(stats)
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            if QUERY_REPEAT_ACTION == "log":
+                for shape, repeats in stats.repeated().items():
+                    print(f"Query repeated {repeats} times in {scope['method']} {scope['path']}: {shape}")
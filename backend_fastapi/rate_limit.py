@@ -0,0 +1,188 @@
+"""
+In-memory token-bucket rate limiting, applied as ASGI middleware so a
+throttled request is answered with 429 before any route code runs: no
+password hashing, no connection checkout.
+
+Buckets live in a fixed number of shards, each a small dict behind its own
+lock, so concurrent requests for different keys rarely contend. A bucket is
+a (tokens, last update) tuple. A shard over its size limit evicts its
+least recently used buckets, oldest first.
+
+Routes with a per-email limit read the request body to find the email, so
+they refuse bodies over MAX_LIMITED_BODY with 413 rather than buffering
+whatever a client sends.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_SHARDS = 16
+# Largest request body accepted on routes with a per-email limit
+MAX_LIMITED_BODY = 16 * 1024
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Limit:
+    """`burst` requests at once, refilled at `rate` requests per second."""
+    rate: float
+    burst: float
+
+    @classmethod
+    def parse(cls, spec: str):
+        """'10/minute' -> burst of 10, refilled evenly over a minute."""
+        count, _, period = spec.partition("/")
+        count = float(count)
+        return cls(rate=count / _PERIODS[period.strip() or "second"], burst=count)
+
+
+class TokenBucketStore:
+    def __init__(self, max_keys: int, shards: int = RATE_LIMIT_SHARDS):
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+
+    def take(self, key, limit: Limit, cost: float = 1.0) -> float:
+        """Spend `cost` tokens for `key`. Returns 0 if allowed, else seconds until it would be."""
+        index = hash(key) % len(self._shards)
+        shard = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            bucket = shard.get(key)
+            if bucket is None:
+                tokens = limit.burst
+            else:
+                tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+                shard.move_to_end(key)
+            if tokens < cost:
+                shard[key] = (tokens, now)
+                return (cost - tokens) / limit.rate
+            tokens -= cost
+            shard[key] = (tokens, now)
+            # Least recently used first; at most one over after an insert
+            while len(shard) > self._max_per_shard:
+                shard.popitem(last=False)
+            return 0.0
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    path: str
+    methods: Sequence[str] = ("POST",)
+    per_ip: Optional[Limit] = None
+    per_email: Optional[Limit] = None
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, routes: Sequence[RouteLimit], store: TokenBucketStore = None):
+        self.app = app
+        self.routes = {(method, route.path.rstrip("/")): route for route in routes for method in route.methods}
+        self.store = store or TokenBucketStore(RATE_LIMIT_MAX_KEYS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        route = self.routes.get((scope["method"], scope["path"].rstrip("/")))
+        if route is None:
+            return await self.app(scope, receive, send)
+
+        if route.per_ip:
+            retry_after = self.store.take(("ip", route.path, _client_ip(scope)), route.per_ip)
+            if retry_after:
+                return await _too_many(send, retry_after)
+
+        if route.per_email:
+            body, receive = await _read_body(scope, receive)
+            if body is None:
+                return await _reject(send, 413, "Request body too large")
+            email = _email_from(body)
+            if email:
+                retry_after = self.store.take(("email", route.path, email), route.per_email)
+                if retry_after:
+                    return await _too_many(send, retry_after)
+
+        await self.app(scope, receive, send)
+
+
+def _client_ip(scope):
+    if RATE_LIMIT_TRUST_PROXY:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _read_body(scope, receive):
+    """
+    Buffer the request body and return it with a receive() that replays it;
+    the body is None once it is known to exceed MAX_LIMITED_BODY.
+    """
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            if not value.isdigit() or int(value) > MAX_LIMITED_BODY:
+                return None, receive
+            break
+    chunks, size, more = [], 0, True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        size += len(chunks[-1])
+        if size > MAX_LIMITED_BODY:
+            return None, receive
+        more = message.get("more_body", False)
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def _email_from(body):
+    try:
+        email = json.loads(body).get("email") if body else None
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+async def _too_many(send, retry_after):
+    await _reject(send, 429, "Too many requests", [(b"retry-after", str(max(1, math.ceil(retry_after))).encode())])
+
+
+async def _reject(send, status, detail, headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,150 @@
+"""
+Product rating aggregates. product_ratings keeps a running sum, count and
+per-star histogram for each product; review writes adjust it on the
+caller's cursor, in the review's own transaction, and copy the result into
+products.rating/reviewCount in the same step, so no write ever rescans a
+product's reviews. reconcile_ratings() rebuilds everything from the reviews
+table to correct any drift and runs periodically in the background.
+"""
+import os
+import threading
+from dotenv import load_dotenv
+from database import get_db_connection
+from cache_utils import invalidate_product
+
+load_dotenv()
+
+RATING_RECONCILE_SECONDS = float(os.getenv("RATING_RECONCILE_SECONDS", "3600"))
+STARS = (1, 2, 3, 4, 5)
+STAR_COLUMNS = tuple(f"star_{star}" for star in STARS)
+
+_SYNC_PRODUCT = (
+    "UPDATE products SET "
+    "reviewCount = (SELECT rating_count FROM product_ratings WHERE product_id = %s), "
+    "rating = (SELECT CASE WHEN rating_count > 0 THEN rating_sum / rating_count ELSE 0 END "
+    "FROM product_ratings WHERE product_id = %s) "
+    "WHERE id = %s"
+)
+
+
+def apply_review(cursor, product_id: str, rating: int, delta: int):
+    """Add (delta=1) or remove (delta=-1) one review of `rating` stars."""
+    star = STAR_COLUMNS[rating - 1]
+    cursor.execute(
+        f"INSERT INTO product_ratings (product_id, rating_sum, rating_count, {star}) VALUES (%s, %s, %s, %s) "
+        f"ON DUPLICATE KEY UPDATE rating_sum = rating_sum + VALUES(rating_sum), "
+        f"rating_count = rating_count + VALUES(rating_count), {star} = {star} + VALUES({star})",
+        (product_id, rating * delta, delta, delta)
+    )
+    cursor.execute(_SYNC_PRODUCT, (product_id, product_id, product_id))
+
+
+def _summary(rating_sum, rating_count, histogram):
+    return {
+        "average": round(rating_sum / rating_count, 2) if rating_count else 0,
+        "count": rating_count,
+        "histogram": {str(star): count for star, count in zip(STARS, histogram)},
+    }
+
+
+EMPTY_SUMMARY = _summary(0, 0, (0,) * len(STARS))
+
+
+def fetch_rating_summaries(cursor, product_ids):
+    """{product_id: summary} for all ids in one query; unrated products get zeros."""
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        return {}
+    cursor.execute(
+        f"SELECT product_id, rating_sum, rating_count, {', '.join(STAR_COLUMNS)} FROM product_ratings "
+        "WHERE product_id IN (" + ", ".join(["%s"] * len(product_ids)) + ")",
+        product_ids
+    )
+    summaries = {product_id: EMPTY_SUMMARY for product_id in product_ids}
+    for row in cursor.fetchall():
+        summaries[row[0]] = _summary(int(row[1]), int(row[2]), [int(count) for count in row[3:]])
+    return summaries
+
+
+def reconcile_ratings(cursor):
+    """
+    Recompute every aggregate from the reviews table and fix products whose
+    rating or reviewCount drifted. Returns the number of products corrected.
+    """
+    star_sums = ", ".join(f"SUM(rating = {star})" for star in STARS)
+    star_updates = ", ".join(f"{column} = VALUES({column})" for column in STAR_COLUMNS)
+    cursor.execute(
+        f"INSERT INTO product_ratings (product_id, rating_sum, rating_count, {', '.join(STAR_COLUMNS)}) "
+        f"SELECT product_id, SUM(rating), COUNT(*), {star_sums} FROM reviews GROUP BY product_id "
+        f"ON DUPLICATE KEY UPDATE rating_sum = VALUES(rating_sum), rating_count = VALUES(rating_count), {star_updates}"
+    )
+    cursor.execute(
+        "UPDATE product_ratings SET rating_sum = 0, rating_count = 0, "
+        + ", ".join(f"{column} = 0" for column in STAR_COLUMNS)
+        + " WHERE rating_count <> 0 AND product_id NOT IN (SELECT DISTINCT product_id FROM reviews)"
+    )
+    cursor.execute(
+        """
+        UPDATE products p
+        JOIN product_ratings r ON r.product_id = p.id
+        SET p.reviewCount = r.rating_count,
+            p.rating = CASE WHEN r.rating_count > 0 THEN r.rating_sum / r.rating_count ELSE 0 END
+        WHERE p.reviewCount <> r.rating_count
+           OR p.rating <> ROUND(CASE WHEN r.rating_count > 0 THEN r.rating_sum / r.rating_count ELSE 0 END, 2)
+        """
+    )
+    return cursor.rowcount
+
+
+class RatingReconciler:
+    """Runs reconcile_ratings() at startup and then every RATING_RECONCILE_SECONDS."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rating-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def run_once(self):
+        conn = get_db_connection()
+        if not conn:
+            return 0
+        cursor = conn.cursor()
+        try:
+            corrected = reconcile_ratings(cursor)
+            conn.commit()
+            if corrected:
+                invalidate_product()
+            return corrected
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _run(self):
+        while True:
+            try:
+                corrected = self.run_once()
+                if corrected:
+                    print(f"Rating reconciliation corrected {corrected} products")
+            except Exception as e:
+                print(f"Error reconciling ratings: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+
+rating_reconciler = RatingReconciler(RATING_RECONCILE_SECONDS)
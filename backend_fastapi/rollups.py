@@ -0,0 +1,249 @@
+"""
+Rollup tables behind the admin dashboard. Order counts and revenue are kept
+per hour and per day and per order status, product sales per day, and
+signups per day. Writers adjust them on their own cursor inside the
+transaction that changes the order or user, so the dashboard reads a few
+small tables instead of scanning orders, order_items and users.
+
+Buckets are derived from the order row itself (its created_at), so a
+status change lands in the same bucket the order was first counted in.
+Cancelled orders stay in the order counts under 'cancelled' but are left
+out of revenue and product sales. rebuild_rollups() recomputes everything
+from the source tables.
+"""
+import os
+from dotenv import load_dotenv
+from database import get_db_connection
+
+load_dotenv()
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+CANCELLED = "cancelled"
+SUMMARY_DAYS = 30
+TOP_PRODUCTS = 10
+
+_ADD_ORDER = """
+    INSERT INTO {table} ({bucket_column}, status, order_count, revenue)
+    SELECT {bucket}, %s, %s, %s * total_amount FROM orders WHERE id = %s
+    ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count), revenue = revenue + VALUES(revenue)
+"""
+_ADD_PRODUCT_SALES = """
+    INSERT INTO product_sales_daily (day, product_id, units, revenue)
+    SELECT DATE(o.created_at), oi.product_id, %s * SUM(oi.quantity), %s * SUM(oi.quantity * oi.price_at_purchase)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    WHERE oi.order_id = %s
+    GROUP BY DATE(o.created_at), oi.product_id
+    ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue)
+"""
+
+
+def _count_order(cursor, order_id, status, sign):
+    # Revenue only counts for orders that are not cancelled
+    revenue_sign = 0 if status == CANCELLED else sign
+    cursor.execute(
+        _ADD_ORDER.format(table="sales_hourly", bucket_column="hour", bucket="DATE_FORMAT(created_at, %s)"),
+        (HOUR_FORMAT, status, sign, revenue_sign, order_id)
+    )
+    cursor.execute(
+        _ADD_ORDER.format(table="sales_daily", bucket_column="day", bucket="DATE(created_at)"),
+        (status, sign, revenue_sign, order_id)
+    )
+
+
+def _count_product_sales(cursor, order_id, sign):
+    cursor.execute(_ADD_PRODUCT_SALES, (sign, sign, order_id))
+
+
+def record_order(cursor, order_id, status="pending"):
+    """Count a newly created order (after its items are inserted)."""
+    _count_order(cursor, order_id, status, 1)
+    if status != CANCELLED:
+        _count_product_sales(cursor, order_id, 1)
+
+
+def record_status_change(cursor, order_id, old_status, new_status):
+    if old_status == new_status:
+        return
+    _count_order(cursor, order_id, old_status, -1)
+    _count_order(cursor, order_id, new_status, 1)
+    if new_status == CANCELLED:
+        _count_product_sales(cursor, order_id, -1)
+    elif old_status == CANCELLED:
+        _count_product_sales(cursor, order_id, 1)
+
+
+def record_signup(cursor):
+    cursor.execute(
+        "INSERT INTO user_signups_daily (day, signups) VALUES (CURRENT_DATE, 1) "
+        "ON DUPLICATE KEY UPDATE signups = signups + 1"
+    )
+
+
+def rebuild_rollups(cursor):
+    """Recompute every rollup from orders, order_items and users."""
+    for table in ("sales_hourly", "sales_daily", "product_sales_daily", "user_signups_daily"):
+        cursor.execute(f"DELETE FROM {table}")
+    revenue = f"SUM(CASE WHEN status = '{CANCELLED}' THEN 0 ELSE total_amount END)"
+    cursor.execute(
+        f"INSERT INTO sales_hourly (hour, status, order_count, revenue) "
+        f"SELECT DATE_FORMAT(created_at, %s), status, COUNT(*), {revenue} FROM orders "
+        f"GROUP BY DATE_FORMAT(created_at, %s), status",
+        (HOUR_FORMAT, HOUR_FORMAT)
+    )
+    cursor.execute(
+        f"INSERT INTO sales_daily (day, status, order_count, revenue) "
+        f"SELECT DATE(created_at), status, COUNT(*), {revenue} FROM orders GROUP BY DATE(created_at), status"
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO product_sales_daily (day, product_id, units, revenue)
+        SELECT DATE(o.created_at), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price_at_purchase)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status <> '{CANCELLED}'
+        GROUP BY DATE(o.created_at), oi.product_id
+        """
+    )
+    cursor.execute(
+        "INSERT INTO user_signups_daily (day, signups) "
+        "SELECT DATE(created_at), COUNT(*) FROM users GROUP BY DATE(created_at)"
+    )
+
+
+def _needs_rebuild(cursor):
+    # Rollups added to an existing database, or a database seeded without
+    # going through the writers, start out empty next to their source rows
+    for rollup, source in (("sales_daily", "orders"), ("user_signups_daily", "users")):
+        cursor.execute(f"SELECT 1 FROM {rollup} LIMIT 1")
+        if cursor.fetchone() is not None:
+            continue
+        cursor.execute(f"SELECT 1 FROM {source} LIMIT 1")
+        if cursor.fetchone() is not None:
+            return True
+    return False
+
+
+def rebuild(only_if_empty: bool = False):
+    """Rebuild the rollups in their own transaction. Returns whether it ran."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    cursor = conn.cursor()
+    try:
+        if only_if_empty and not _needs_rebuild(cursor):
+            return False
+        rebuild_rollups(cursor)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _stock_levels(cursor):
+    # Range scans on idx_products_stock rather than a pass over products
+    cursor.execute("SELECT COUNT(*) AS total FROM products")
+    total = int(cursor.fetchone()['total'])
+    cursor.execute(
+        "SELECT COUNT(*) AS low_stock, COALESCE(SUM(stockQuantity <= 0), 0) AS out_of_stock "
+        "FROM products WHERE stockQuantity <= %s",
+        (LOW_STOCK_THRESHOLD,)
+    )
+    row = cursor.fetchone()
+    low_stock, out_of_stock = int(row['low_stock']), int(row['out_of_stock'])
+
+    # products.stockQuantity of a bucketed product is only refreshed by
+    # sync_bucketed_stock(); count those few by their buckets instead
+    cursor.execute(
+        "SELECT p.stockQuantity AS listed, b.total FROM products p "
+        "JOIN (SELECT product_id, SUM(quantity) AS total FROM stock_buckets GROUP BY product_id) b "
+        "ON b.product_id = p.id"
+    )
+    for row in cursor.fetchall():
+        listed, actual = row['listed'], int(row['total'])
+        counted = listed is not None
+        low_stock += (actual <= LOW_STOCK_THRESHOLD) - (counted and listed <= LOW_STOCK_THRESHOLD)
+        out_of_stock += (actual <= 0) - (counted and listed <= 0)
+    return {"total": total, "low_stock": low_stock, "out_of_stock": out_of_stock}
+
+
+def fetch_summary(cursor):
+    """Dashboard summary read from the rollups (dictionary cursor)."""
+    cursor.execute(
+        "SELECT status, SUM(order_count) AS orders, SUM(revenue) AS revenue FROM sales_daily "
+        "GROUP BY status HAVING SUM(order_count) > 0"
+    )
+    by_status = {row['status']: row for row in cursor.fetchall()}
+
+    cursor.execute(
+        "SELECT day, SUM(order_count) AS orders, SUM(revenue) AS revenue FROM sales_daily "
+        "WHERE day >= CURRENT_DATE - INTERVAL %s DAY GROUP BY day ORDER BY day",
+        (SUMMARY_DAYS - 1,)
+    )
+    daily = [
+        {"day": row['day'], "orders": int(row['orders']), "revenue": float(row['revenue'])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute(
+        "SELECT hour, SUM(order_count) AS orders, SUM(revenue) AS revenue FROM sales_hourly "
+        "WHERE hour >= NOW() - INTERVAL 1 DAY GROUP BY hour ORDER BY hour"
+    )
+    hourly = [
+        {"hour": row['hour'], "orders": int(row['orders']), "revenue": float(row['revenue'])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute(
+        """
+        SELECT s.product_id, p.name, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+        FROM product_sales_daily s
+        LEFT JOIN products p ON p.id = s.product_id
+        WHERE s.day >= CURRENT_DATE - INTERVAL %s DAY
+        GROUP BY s.product_id, p.name
+        HAVING SUM(s.units) > 0
+        ORDER BY revenue DESC
+        LIMIT %s
+        """,
+        (SUMMARY_DAYS - 1, TOP_PRODUCTS)
+    )
+    top_products = [
+        {"product_id": row['product_id'], "name": row['name'], "units": int(row['units']), "revenue": float(row['revenue'])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute(
+        "SELECT COALESCE(SUM(signups), 0) AS total, "
+        "COALESCE(SUM(CASE WHEN day = CURRENT_DATE THEN signups ELSE 0 END), 0) AS today "
+        "FROM user_signups_daily"
+    )
+    users = cursor.fetchone()
+
+    products = _stock_levels(cursor)
+
+    return {
+        "revenue": {
+            "total": float(sum(row['revenue'] for row in by_status.values())),
+            "last_30_days": sum(day['revenue'] for day in daily),
+            "last_24_hours": sum(hour['revenue'] for hour in hourly),
+        },
+        "orders": {
+            "total": int(sum(row['orders'] for row in by_status.values())),
+            "by_status": {status: int(row['orders']) for status, row in by_status.items()},
+        },
+        "users": {"total": int(users['total']), "new_today": int(users['today'])},
+        "products": {
+            "total": products['total'],
+            "low_stock": products['low_stock'],
+            "out_of_stock": products['out_of_stock'],
+            "low_stock_threshold": LOW_STOCK_THRESHOLD,
+        },
+        "top_products": top_products,
+        "daily": daily,
+        "hourly": hourly,
+    }
@@ -34,12 +34,14 @@ def get_addresses(current_user: dict = Depends(get_current_user)):
 @router.post("/")
 def add_address(address: AddressSchema, current_user: dict = Depends(get_current_user)):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if address.isDefault:
-        cursor.execute("UPDATE addresses SET isDefault = FALSE WHERE user_id = %s", (current_user['id'],))
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
     
+    cursor = conn.cursor()
     try:
+        if address.isDefault:
+            cursor.execute("UPDATE addresses SET isDefault = FALSE WHERE user_id = %s", (current_user['id'],))
+        
         cursor.execute(
             """
             INSERT INTO addresses (user_id, type, name, street, city, state, zipCode, country, phone, isDefault)
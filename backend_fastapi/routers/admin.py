@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Depends
+from database import get_db_connection, pool_stats
+from auth_utils import get_current_user
+from rollups import fetch_summary, rebuild
+
+router = APIRouter()
+
+def _require_admin(current_user):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.get("/summary")
+def get_summary(current_user: dict = Depends(get_current_user)):
+    _require_admin(current_user)
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return fetch_summary(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/rollups/rebuild")
+def rebuild_summary_rollups(current_user: dict = Depends(get_current_user)):
+    _require_admin(current_user)
+    try:
+        rebuilt = rebuild()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not rebuilt:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    return {"message": "Rollups rebuilt"}
+
+@router.get("/db/stats")
+def get_db_stats(current_user: dict = Depends(get_current_user)):
+    _require_admin(current_user)
+    return pool_stats()
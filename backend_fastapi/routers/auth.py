@@ -1,7 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel, EmailStr
-from database import get_db_connection
-from auth_utils import get_password_hash, verify_password, create_access_token
+from typing import Optional
+from database import get_db_connection, db_connection
+from async_database import async_pool, when_async_enabled
+from auth_utils import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash, verify_and_update_password,
+    verify_and_update_password_async, create_access_token,
+    decode_access_token, get_current_user, oauth2_scheme,
+)
+from token_denylist import token_denylist
+from rollups import record_signup
+import time
 import uuid
 
 router = APIRouter()
@@ -15,40 +24,85 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class TokenRevoke(BaseModel):
+    jti: Optional[str] = None
+    user_id: Optional[str] = None
+
 @router.post("/register")
 def register(user: UserRegister):
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if user exists
-    cursor.execute("SELECT id FROM users WHERE email = %s", (user.email,))
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=400, detail="Email already registered")
+    # Hash before checking out a connection so it is not held while hashing
+    pw_hash = get_password_hash(user.password)
     
     user_id = str(uuid.uuid4())
-    pw_hash = get_password_hash(user.password)
     
-    try:
-        cursor.execute(
-            "INSERT INTO users (id, name, email, password_hash, role) VALUES (%s, %s, %s, %s, %s)",
-            (user_id, user.name, user.email, pw_hash, "user")
-        )
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            # Check if user exists
+            cursor.execute("SELECT id FROM users WHERE email = %s", (user.email,))
+            if cursor.fetchone():
+                raise HTTPException(status_code=400, detail="Email already registered")
+            
+            cursor.execute(
+                "INSERT INTO users (id, name, email, password_hash, role) VALUES (%s, %s, %s, %s, %s)",
+                (user_id, user.name, user.email, pw_hash, "user")
+            )
+            record_signup(cursor)
+            conn.commit()
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
     
     return {"message": "User registered successfully", "user_id": user_id}
 
+LOGIN_QUERY = "SELECT id, name, email, role, password_hash FROM users WHERE email = %s"
+
+def _invalid_login():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect email or password",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _login_response(db_user):
+    access_token = create_access_token(
+        data={"sub": db_user['id'], "role": db_user['role'], "email": db_user['email'], "name": db_user['name']}
+    )
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": {
+            "id": db_user['id'],
+            "name": db_user['name'],
+            "email": db_user['email'],
+            "role": db_user['role']
+        }
+    }
+
+async def login_async(user: UserLogin):
+    async with async_pool.connection() as conn:
+        cursor = await conn.cursor(dictionary=True)
+        await cursor.execute(LOGIN_QUERY, (user.email,))
+        db_user = await cursor.fetchone()
+        await cursor.close()
+    
+    if db_user:
+        valid, new_hash = await verify_and_update_password_async(user.password, db_user['password_hash'])
+    else:
+        valid, new_hash = False, None
+    if not valid:
+        raise _invalid_login()
+    if new_hash:
+        await _rehash_async(db_user['id'], db_user['password_hash'], new_hash)
+    return _login_response(db_user)
+
 @router.post("/login")
+@when_async_enabled(login_async)
 def login(user: UserLogin):
     conn = get_db_connection()
     if not conn:
@@ -56,30 +110,68 @@ def login(user: UserLogin):
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE email = %s", (user.email,))
+        cursor.execute(LOGIN_QUERY, (user.email,))
         db_user = cursor.fetchone()
         cursor.close()
-        
-        if not db_user or not verify_password(user.password, db_user['password_hash']):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect email or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        access_token = create_access_token(
-            data={"sub": db_user['id'], "role": db_user['role'], "email": db_user['email'], "name": db_user['name']}
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user": {
-                "id": db_user['id'],
-                "name": db_user['name'],
-                "email": db_user['email'],
-                "role": db_user['role']
-            }
-        }
     finally:
+        # Released before verifying: the hash takes far longer than the query
         conn.close()
+    
+    valid, new_hash = verify_and_update_password(user.password, db_user['password_hash']) if db_user else (False, None)
+    if not valid:
+        raise _invalid_login()
+    if new_hash:
+        _rehash(db_user['id'], db_user['password_hash'], new_hash)
+    return _login_response(db_user)
+
+REHASH_QUERY = "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s"
+
+def _rehash(user_id, old_hash, new_hash):
+    """Store a hash made with the current parameters; best effort, login still succeeds."""
+    conn = get_db_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        # Only if the password was not changed in the meantime
+        cursor.execute(REHASH_QUERY, (new_hash, user_id, old_hash))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error updating password hash: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+async def _rehash_async(user_id, old_hash, new_hash):
+    try:
+        async with async_pool.connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(REHASH_QUERY, (new_hash, user_id, old_hash))
+            await conn.commit()
+            await cursor.close()
+    except Exception as e:
+        print(f"Error updating password hash: {e}")
+
+@router.post("/logout")
+def logout(token: str = Depends(oauth2_scheme), current_user: dict = Depends(get_current_user)):
+    payload = decode_access_token(token)
+    # Tokens issued before jti was added simply run out
+    if payload.get("jti"):
+        token_denylist.revoke(payload["jti"], payload["exp"], current_user['id'])
+    return {"message": "Logged out successfully"}
+
+@router.post("/revoke")
+def revoke_tokens(revoke: TokenRevoke, current_user: dict = Depends(get_current_user)):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not revoke.jti and not revoke.user_id:
+        raise HTTPException(status_code=400, detail="Provide jti or user_id")
+    
+    # No token we issue outlives this, so neither does the revocation
+    expires_at = time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    if revoke.jti:
+        token_denylist.revoke(revoke.jti, expires_at, revoke.user_id)
+    else:
+        token_denylist.revoke_user(revoke.user_id, expires_at)
+    return {"message": "Tokens revoked successfully"}
@@ -1,57 +1,161 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
-from database import get_db_connection
-from auth_utils import get_current_user
-import uuid
+from datetime import datetime
+from decimal import Decimal
+from database import get_db_connection, run_queries
+from async_database import ASYNC_DB_ENABLED, db_endpoint
+from auth_utils import get_current_user, get_current_user_async
+from product_rows import product_rows
+from inventory import reserve_stock
+from cache_utils import invalidate_product
+from idempotency import order_idempotency, IdempotencyKeyReused
+from email_outbox import email_outbox, enqueue_order_confirmation
+from rollups import record_order, record_status_change
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import mysql.connector
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, keyset_condition
+import csv
+import hashlib
+import io
 import json
+import uuid
 
 router = APIRouter()
 
 class OrderItemSchema(BaseModel):
     product_id: str
     quantity: int
-    price: float
+    # Ignored: prices are always read from the products table
+    price: Optional[float] = None
 
 class OrderCreate(BaseModel):
     items: List[OrderItemSchema]
-    total_amount: float
+    # Ignored: the total is recomputed from authoritative prices
+    total_amount: Optional[float] = None
     shipping_address: str
 
-@router.post("/")
-def create_order(order: OrderCreate, current_user: dict = Depends(get_current_user)):
+class PricedItem(BaseModel):
+    product_id: str
+    quantity: int
+    price: Decimal
+
+def _price_items(cursor, items):
+    """Look up current prices for every product in `items` with one query."""
+    if not items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    if any(item.quantity < 1 for item in items):
+        raise HTTPException(status_code=400, detail="Item quantity must be at least 1")
+
+    product_ids = list({item.product_id for item in items})
+    cursor.execute(
+        "SELECT id, price FROM products WHERE id IN (" + ", ".join(["%s"] * len(product_ids)) + ")",
+        product_ids
+    )
+    prices = dict(cursor.fetchall())
+    missing = [product_id for product_id in product_ids if product_id not in prices]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown products: {', '.join(missing)}")
+
+    return [
+        PricedItem(product_id=item.product_id, quantity=item.quantity, price=Decimal(prices[item.product_id]))
+        for item in items
+    ]
+
+def _insert_order_items(cursor, order_id, priced_items):
+    """Write all order lines with a single multi-row INSERT."""
+    params = []
+    for item in priced_items:
+        params.extend((order_id, item.product_id, item.quantity, item.price))
+    cursor.execute(
+        "INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase) VALUES "
+        + ", ".join(["(%s, %s, %s, %s)"] * len(priced_items)),
+        params
+    )
+
+def _order_response(order_id, total_amount):
+    return {"message": "Order created successfully", "order_id": order_id, "total_amount": float(total_amount)}
+
+def _request_hash(order: OrderCreate):
+    """Fingerprint of what an order request asks for; prices and totals are ignored anyway."""
+    canonical = {
+        "items": [[item.product_id, item.quantity] for item in order.items],
+        "shipping_address": order.shipping_address,
+    }
+    return hashlib.sha256(json.dumps(canonical, separators=(",", ":")).encode()).hexdigest()
+
+def _reused_key():
+    return HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+def _existing_order(cursor, user_id, idempotency_key, request_hash):
+    cursor.execute(
+        "SELECT id, total_amount, request_hash FROM orders WHERE user_id = %s AND idempotency_key = %s",
+        (user_id, idempotency_key)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row[2] != request_hash:
+        raise _reused_key()
+    return _order_response(row[0], row[1])
+
+def _create_order(order: OrderCreate, current_user: dict, idempotency_key: Optional[str]):
+    """Returns (response, replayed); replayed when the key's order already existed."""
     conn = get_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
     cursor = conn.cursor()
     order_id = str(uuid.uuid4())
+    request_hash = _request_hash(order) if idempotency_key else None
     
     try:
+        # Another worker process (or this one before a restart) may already
+        # have handled this key; the unique index is the final word
+        if idempotency_key:
+            existing = _existing_order(cursor, current_user['id'], idempotency_key, request_hash)
+            if existing:
+                return existing, True
+
+        # Pricing, stock reservation, order and items share one transaction
+        priced_items = _price_items(cursor, order.items)
+        reserve_stock(cursor, priced_items)
+        total_amount = sum((item.price * item.quantity for item in priced_items), Decimal("0"))
+
         # Create order
-        cursor.execute(
-            "INSERT INTO orders (id, user_id, total_amount, shipping_address, status) VALUES (%s, %s, %s, %s, %s)",
-            (order_id, current_user['id'], order.total_amount, order.shipping_address, "pending")
-        )
-        
-        # Create order items
-        for item in order.items:
+        try:
             cursor.execute(
-                "INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase) VALUES (%s, %s, %s, %s)",
-                (order_id, item.product_id, item.quantity, item.price)
+                "INSERT INTO orders (id, user_id, total_amount, shipping_address, status, idempotency_key, request_hash) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (order_id, current_user['id'], total_amount, order.shipping_address, "pending", idempotency_key, request_hash)
             )
+        except mysql.connector.IntegrityError:
+            if not idempotency_key:
+                raise
+            conn.rollback()
+            existing = _existing_order(cursor, current_user['id'], idempotency_key, request_hash)
+            if existing:
+                return existing, True
+            raise
         
-        conn.commit()
+        # Create order items
+        _insert_order_items(cursor, order_id, priced_items)
+        record_order(cursor, order_id)
         
-        # Send confirmation email
-        try:
-            # We need to get the user's email. it's in current_user['email']
-            from email_utils import send_order_confirmation_email
-            send_order_confirmation_email(current_user['email'], order_id, order.total_amount, order.items)
-        except Exception as email_err:
-            print(f"Error sending email: {email_err}")
-            # Don't fail the order if email fails
+        # Queue the confirmation email; it is sent by the outbox workers
+        # once this transaction commits
+        enqueue_order_confirmation(cursor, current_user['email'], order_id, total_amount, priced_items)
+        
+        conn.commit()
+        email_outbox.wake()
+        # Stock moved: cached product pages must not keep the old level
+        for product_id in {item.product_id for item in priced_items}:
+            invalidate_product(product_id, listings=False)
             
+    except HTTPException:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -59,48 +163,117 @@ def create_order(order: OrderCreate, current_user: dict = Depends(get_current_us
         cursor.close()
         conn.close()
     
-    return {"message": "Order created successfully", "order_id": order_id}
+    return _order_response(order_id, total_amount), False
+
+@router.post("/")
+def create_order(
+    order: OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: dict = Depends(get_current_user)
+):
+    if idempotency_key is None:
+        return _create_order(order, current_user, None)[0]
+    if not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+
+    try:
+        (result, stored), replayed = order_idempotency.run(
+            (current_user['id'], idempotency_key),
+            _request_hash(order),
+            lambda: _create_order(order, current_user, idempotency_key)
+        )
+    except FutureTimeoutError:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    except IdempotencyKeyReused:
+        raise _reused_key()
+    # Replayed from this worker's memory, or found in the orders table
+    # (another worker, or before a restart)
+    if replayed or stored:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def _load_items(orders):
+    """Query generator: load the items of all `orders` in one query and set order['items'] on each."""
+    items_by_order = {}
+    for order in orders:
+        order['items'] = items_by_order[order['id']] = []
+    if not orders:
+        return orders
+
+    rows = yield (
+        """
+        SELECT oi.*, p.name, p.images 
+        FROM order_items oi 
+        JOIN products p ON oi.product_id = p.id 
+        WHERE oi.order_id IN (""" + ", ".join(["%s"] * len(items_by_order)) + """)
+        ORDER BY oi.id
+        """,
+        list(items_by_order)
+    )
+    for item in product_rows(*rows):
+        items_by_order[item['order_id']].append(item)
+    return orders
+
+def _attach_items(conn, orders):
+    return run_queries(_load_items(orders), conn)
 
 @router.get("/history")
-def get_order_history(current_user: dict = Depends(get_current_user)):
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get orders
-    cursor.execute(
+@db_endpoint(read_only=True)
+def get_order_history(current_user: dict = Depends(get_current_user_async if ASYNC_DB_ENABLED else get_current_user)):
+    # Query generator run by db_endpoint (see async_database.py)
+    column_names, rows = yield (
         "SELECT * FROM orders WHERE user_id = %s ORDER BY created_at DESC",
         (current_user['id'],)
     )
-    orders = cursor.fetchall()
-    
-    # Get items for each order
-    for order in orders:
-        cursor.execute(
-            """
-            SELECT oi.*, p.name, p.images 
-            FROM order_items oi 
-            JOIN products p ON oi.product_id = p.id 
-            WHERE oi.order_id = %s
-            """,
-            (order['id'],)
-        )
-        items = cursor.fetchall()
-        for item in items:
-            item['images'] = json.loads(item['images']) if item['images'] else []
-        order['items'] = items
-    
-    cursor.close()
-    conn.close()
-    
-    return orders
+    orders = [dict(zip(column_names, row)) for row in rows]
+    return (yield from _load_items(orders))
+
+ORDER_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+EXPORT_BATCH_SIZE = 500
+EXPORT_ORDER_COLUMNS = (
+    "order_id", "created_at", "status", "payment_status", "user_id", "userName", "userEmail",
+    "total_amount", "shipping_address",
+)
+EXPORT_ITEM_COLUMNS = ("product_id", "quantity", "price_at_purchase")
+
+def _order_filters(status, user_id, date_from, date_to):
+    conditions = []
+    params = []
+    if status:
+        if status not in ORDER_STATUSES:
+            raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+        conditions.append("o.status = %s")
+        params.append(status)
+    if user_id:
+        conditions.append("o.user_id = %s")
+        params.append(user_id)
+    if date_from:
+        conditions.append("o.created_at >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("o.created_at < %s")
+        params.append(date_to)
+    return conditions, params
 
 @router.get("/all")
-def get_all_orders(current_user: dict = Depends(get_current_user)):
+def get_all_orders(
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user.get('role') != 'admin':
         raise HTTPException(status_code=403, detail="Forbidden")
+
+    conditions, params = _order_filters(status, user_id, date_from, date_to)
+    if cursor_token:
+        last_created_at, last_id = decode_cursor(cursor_token, 2, convert=(datetime.fromisoformat, str))
+        conditions.append(keyset_condition("o.created_at", True, "o.id"))
+        params.extend([last_created_at, last_created_at, last_id])
         
     conn = get_db_connection()
     if not conn:
@@ -108,37 +281,131 @@ def get_all_orders(current_user: dict = Depends(get_current_user)):
     
     cursor = conn.cursor(dictionary=True)
     
-    # Get all orders with user info
-    cursor.execute(
-        """
+    # Newest first, one page at a time, with user info
+    query = """
         SELECT o.*, u.name as userName, u.email as userEmail 
         FROM orders o 
         JOIN users u ON o.user_id = u.id 
-        ORDER BY o.created_at DESC
         """
-    )
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY o.created_at DESC, o.id DESC LIMIT %s"
+    cursor.execute(query, params + [limit + 1])
     orders = cursor.fetchall()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1]['created_at'], orders[-1]['id'])
     
-    # Get items for each order
-    for order in orders:
-        cursor.execute(
-            """
-            SELECT oi.*, p.name, p.images 
-            FROM order_items oi 
-            JOIN products p ON oi.product_id = p.id 
-            WHERE oi.order_id = %s
-            """,
-            (order['id'],)
-        )
-        items = cursor.fetchall()
-        for item in items:
-            item['images'] = json.loads(item['images']) if item['images'] else []
-        order['items'] = items
+    _attach_items(conn, orders)
     
     cursor.close()
     conn.close()
     
-    return orders
+    return {"items": orders, "next_cursor": next_cursor}
+
+def _export_rows(conn, conditions, params):
+    """
+    Yield (order row, [item rows]) from an unbuffered cursor, so the server
+    streams the result and only one order is held in memory at a time.
+    """
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        query = """
+            SELECT o.id AS order_id, o.created_at, o.status, o.payment_status, o.user_id,
+                   u.name AS userName, u.email AS userEmail, o.total_amount, o.shipping_address,
+                   oi.product_id, oi.quantity, oi.price_at_purchase
+            FROM orders o
+            JOIN users u ON o.user_id = u.id
+            LEFT JOIN order_items oi ON oi.order_id = o.id
+            """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY o.created_at DESC, o.id DESC, oi.id"
+        cursor.execute(query, params)
+
+        current, items = None, []
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                if current is not None and row['order_id'] != current['order_id']:
+                    yield current, items
+                    items = []
+                current = row
+                if row['product_id'] is not None:
+                    items.append(row)
+        if current is not None:
+            yield current, items
+    finally:
+        # A client that disconnects mid-export leaves unread rows behind
+        conn.consume_results()
+        cursor.close()
+        conn.close()
+
+def _finish_export(rows, conn):
+    # Runs once the response is over, however it ended: a client that went
+    # away before the first chunk never started the generator, so its
+    # finally cannot be what hands the connection back
+    try:
+        rows.close()
+    except ValueError:
+        pass  # still being advanced by a cancelled send; close() below returns it
+    conn.close()
+
+def _ndjson_lines(rows):
+    for order, items in rows:
+        record = {column: order[column] for column in EXPORT_ORDER_COLUMNS}
+        record["items"] = [{column: item[column] for column in EXPORT_ITEM_COLUMNS} for item in items]
+        yield json.dumps(record, default=str) + "\n"
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = EXPORT_ORDER_COLUMNS + EXPORT_ITEM_COLUMNS
+    writer.writerow(columns)
+    for order, items in rows:
+        # One line per item; each item row already carries its order's columns
+        for row in items or [order]:
+            writer.writerow([row[column] for column in columns])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@router.get("/export")
+def export_orders(
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    conditions, params = _order_filters(status, user_id, date_from, date_to)
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+    # Held for as long as the client takes to download the export
+    conn.allow_long_hold()
+    rows = _export_rows(conn, conditions, params)
+    release = BackgroundTask(_finish_export, rows, conn)
+    if format == "csv":
+        return StreamingResponse(
+            _csv_lines(rows), media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=orders.csv"},
+            background=release,
+        )
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson", background=release)
 
 class OrderStatusUpdate(BaseModel):
     status: str
@@ -147,6 +414,8 @@ class OrderStatusUpdate(BaseModel):
 def update_order_status(order_id: str, status_update: OrderStatusUpdate, current_user: dict = Depends(get_current_user)):
     if current_user.get('role') != 'admin':
         raise HTTPException(status_code=403, detail="Forbidden")
+    if status_update.status not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {status_update.status}")
         
     conn = get_db_connection()
     if not conn:
@@ -154,11 +423,21 @@ def update_order_status(order_id: str, status_update: OrderStatusUpdate, current
     
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            "UPDATE orders SET status = %s WHERE id = %s",
-            (status_update.status, order_id)
-        )
+        # Lock the order so the rollups move it out of the status it really had
+        cursor.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if row[0] != status_update.status:
+            cursor.execute(
+                "UPDATE orders SET status = %s WHERE id = %s",
+                (status_update.status, order_id)
+            )
+            record_status_change(cursor, order_id, row[0], status_update.status)
         conn.commit()
+    except HTTPException:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,34 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, status
 from typing import List, Optional
 import json
-from database import get_db_connection
+from database import CATALOG, get_db_connection, product_scope
+from async_database import db_endpoint
 from auth_utils import get_current_user
+from cache_utils import product_cache, product_list_cache, user_cache, invalidate_product
+from search_index import search_index, ensure_search_index
+from facet_index import facet_index, ensure_facet_index
+from inventory import DEFAULT_STOCK_BUCKETS, bucket_count, set_stock_buckets, sync_bucketed_stock
+from product_rows import product_rows, product_columns, select_list, PRODUCT_COLUMNS
+from prepared_statements import hot_query
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, keyset_condition
 from pydantic import BaseModel
+from datetime import datetime
+from decimal import Decimal
 
 router = APIRouter()
 
+MAX_SEARCH_RESULTS = 200
+PRODUCT_QUERY = hot_query("SELECT * FROM products WHERE id = %s")
+
+# Sortable columns and how to turn a cursor value back into a query parameter.
+# Each one is backed by a (column, id) index in schema.sql.
+SORT_COLUMNS = {
+    "created_at": datetime.fromisoformat,
+    "price": Decimal,
+    "rating": Decimal,
+    "discount": int,
+}
+
 class ProductSchema(BaseModel):
     name: str
     description: str
@@ -29,87 +51,209 @@ class ProductSchema(BaseModel):
     isNew: bool = False
     isBestseller: bool = False
 
+# The listing and detail handlers are query generators run by db_endpoint
+# (see async_database.py): each `yield (query, params)` evaluates to the
+# (column_names, rows) it returned, on a sync or async connection.
 @router.get("/")
+@db_endpoint(read_only=True, scope=CATALOG)
 def get_products(
     category: Optional[str] = None,
     search: Optional[str] = None,
-    featured: Optional[bool] = None
+    featured: Optional[bool] = None,
+    brand: Optional[List[str]] = Query(None),
+    gender: Optional[List[str]] = Query(None),
+    size: Optional[List[str]] = Query(None),
+    color: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    sort: Optional[str] = None,
+    order: str = "desc",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None
 ):
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    if sort is None:
+        sort = "relevance" if search else "created_at"
+    if sort == "relevance" and not search:
+        raise HTTPException(status_code=400, detail="Sorting by relevance requires a search query")
+    if sort != "relevance" and sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    descending = order == "desc"
+    columns = product_columns(fields, required=("id",) if sort == "relevance" else ("id", sort))
+
+    facet_filters = {"category": [category] if category else None, "brand": brand, "gender": gender, "size": size, "color": color}
+    cache_key = (
+        search, bool(featured), min_price, max_price, min_rating, sort, order, limit, cursor_token, columns,
+        tuple((facet, tuple(values or ())) for facet, values in facet_filters.items()),
+    )
+    cached = product_list_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = product_list_cache.generation
+
+    ranking = None
+    hits = None
+    if search:
+        hits = [product_id for product_id, _ in ensure_search_index().search(search)]
+        if not hits:
+            return {"items": [], "next_cursor": None, "total": 0, "facets": {}}
+
+    index = ensure_facet_index()
+    total, facets = index.facet_counts(
+        facet_filters, featured=bool(featured), min_price=min_price, max_price=max_price,
+        min_rating=min_rating, product_ids=hits
+    )
+    if hits is not None:
+        # Filter before cutting to the top hits, so a narrow filter still
+        # finds matches ranked below MAX_SEARCH_RESULTS overall
+        ranked = index.matching(
+            hits, facet_filters, featured=bool(featured), min_price=min_price, max_price=max_price,
+            min_rating=min_rating, limit=MAX_SEARCH_RESULTS
+        )
+        if not ranked:
+            return {"items": [], "next_cursor": None, "total": total, "facets": facets}
+        ranking = {product_id: position for position, product_id in enumerate(ranked)}
+
+    conditions = []
+    params = []
+
+    if category:
+        conditions.append("category = %s")
+        params.append(category)
     
-    try:
-        cursor = conn.cursor(dictionary=True)
-        
-        query = "SELECT * FROM products"
-        conditions = []
-        params = []
+    if featured:
+        conditions.append("featured = TRUE")
 
-        if category:
-            conditions.append("category = %s")
-            params.append(category)
-        
-        if featured:
-            conditions.append("featured = TRUE")
-        
-        if search:
-            conditions.append("(name LIKE %s OR description LIKE %s)")
-            search_term = f"%{search}%"
-            params.extend([search_term, search_term])
-        
+    for column, values in (("brand", brand), ("gender", gender)):
+        if values:
+            conditions.append(f"{column} IN (" + ", ".join(["%s"] * len(values)) + ")")
+            params.extend(values)
+
+    for column, values in (("sizes", size), ("colors", color)):
+        if values:
+            conditions.append("(" + " OR ".join([f"JSON_CONTAINS({column}, JSON_QUOTE(%s))"] * len(values)) + ")")
+            params.extend(values)
+
+    if min_price is not None:
+        conditions.append("price >= %s")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price <= %s")
+        params.append(max_price)
+    if min_rating is not None:
+        conditions.append("rating >= %s")
+        params.append(min_rating)
+    
+    if ranking is not None:
+        conditions.append("id IN (" + ", ".join(["%s"] * len(ranking)) + ")")
+        params.extend(ranking)
+
+    next_cursor = None
+    if sort == "relevance":
+        # Rank order lives in memory: find which hits pass the filters,
+        # then load full rows for the requested page only.
+        offset = 0
+        if cursor_token:
+            token_sort, offset = decode_cursor(cursor_token, 2)
+            if token_sort != "relevance" or not isinstance(offset, int) or offset < 0:
+                raise HTTPException(status_code=400, detail="Cursor does not match this query")
+
+        _, rows = yield "SELECT id FROM products WHERE " + " AND ".join(conditions), params
+        matched = sorted((row[0] for row in rows), key=ranking.__getitem__)
+        page_ids = matched[offset:offset + limit]
+        if offset + limit < len(matched):
+            next_cursor = encode_cursor("relevance", offset + limit)
+
+        products = []
+        if page_ids:
+            rows = yield (
+                f"SELECT {select_list(columns)} FROM products WHERE id IN (" + ", ".join(["%s"] * len(page_ids)) + ")",
+                page_ids
+            )
+            products = sorted(product_rows(*rows), key=lambda product: ranking[product['id']])
+    else:
+        if cursor_token:
+            token_sort, token_order, last_value, last_id = decode_cursor(
+                cursor_token, 4, convert=(None, None, SORT_COLUMNS[sort], str)
+            )
+            if token_sort != sort or token_order != order:
+                raise HTTPException(status_code=400, detail="Cursor does not match this query")
+            conditions.append(keyset_condition(sort, descending))
+            params.extend([last_value, last_value, last_id])
+
+        direction = "DESC" if descending else "ASC"
+        query = f"SELECT {select_list(columns)} FROM products"
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
-        
-        cursor.execute(query, params)
-        products = cursor.fetchall()
-        cursor.close()
-        
-        # Parse JSON fields
-        for product in products:
-            product['images'] = json.loads(product['images']) if product['images'] else []
-            product['tags'] = json.loads(product['tags']) if product['tags'] else []
-            product['sizes'] = json.loads(product['sizes']) if product['sizes'] else []
-            product['colors'] = json.loads(product['colors']) if product['colors'] else []
-            product['inStock'] = bool(product['inStock'])
-            product['featured'] = bool(product['featured'])
-            product['isNew'] = bool(product['isNew'])
-            product['isBestseller'] = bool(product['isBestseller'])
-            
-        return products
-    finally:
-        conn.close()
+        query += f" ORDER BY {sort} {direction}, id {direction} LIMIT %s"
+        params.append(limit + 1)
+
+        products = product_rows(*(yield query, params))
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            next_cursor = encode_cursor(sort, order, last[sort], last['id'])
+
+    page = {"items": products, "next_cursor": next_cursor, "total": total, "facets": facets}
+    product_list_cache.set(cache_key, page, generation)
+    return page
+
+@router.get("/cache/stats")
+def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"products": product_cache.stats(), "listings": product_list_cache.stats(), "users": user_cache.stats()}
+
+def _product_scopes(product_id, **_):
+    # Product edits mark CATALOG; reviews only mark the product
+    return [CATALOG, product_scope(product_id)]
 
 @router.get("/{product_id}")
-def get_product(product_id: str):
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+@db_endpoint(read_only=True, scope=_product_scopes)
+def get_product(product_id: str, fields: Optional[str] = None):
+    # Only full rows are cached; projections of a cached row are cut in memory
+    columns = product_columns(fields)
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        if columns == PRODUCT_COLUMNS:
+            return cached
+        return {column: cached[column] for column in columns}
+    generation = product_cache.generation
+
+    if columns == PRODUCT_COLUMNS:
+        query = PRODUCT_QUERY
+    else:
+        query = f"SELECT {select_list(columns)} FROM products WHERE id = %s"
+    products = product_rows(*(yield query, (product_id,)))
+    if not products:
+        raise HTTPException(status_code=404, detail="Product not found")
     
-    try:
-        cursor = conn.cursor(dictionary=True)
-        
-        query = "SELECT * FROM products WHERE id = %s"
-        cursor.execute(query, (product_id,))
-        product = cursor.fetchone()
-        cursor.close()
-        
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-            
-        # Parse JSON fields
-        product['images'] = json.loads(product['images']) if product['images'] else []
-        product['tags'] = json.loads(product['tags']) if product['tags'] else []
-        product['sizes'] = json.loads(product['sizes']) if product['sizes'] else []
-        product['colors'] = json.loads(product['colors']) if product['colors'] else []
-        product['inStock'] = bool(product['inStock'])
-        product['featured'] = bool(product['featured'])
-        product['isNew'] = bool(product['isNew'])
-        product['isBestseller'] = bool(product['isBestseller'])
-        
-        return product
-    finally:
-        conn.close()
+    product = products[0]
+    if columns == PRODUCT_COLUMNS:
+        product_cache.set(product_id, product, generation)
+    return product
+
+def _reindex_product(product_id: str, product: ProductSchema):
+    search_index.add({
+        "id": product_id,
+        "name": product.name,
+        "description": product.description,
+        "tags": product.tags,
+        "brand": product.brand,
+    })
+    facet_index.add({
+        "id": product_id,
+        "category": product.category,
+        "brand": product.brand,
+        "gender": product.gender,
+        "sizes": product.sizes,
+        "colors": product.colors,
+        "price": product.price,
+        "featured": product.featured,
+    })
 
 @router.post("/")
 def create_product(product: ProductSchema, current_user: dict = Depends(get_current_user)):
@@ -135,6 +279,8 @@ def create_product(product: ProductSchema, current_user: dict = Depends(get_curr
              product.sku, product.discount, product.isNew, product.isBestseller)
         )
         conn.commit()
+        invalidate_product(product_id)
+        _reindex_product(product_id, product)
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -144,6 +290,60 @@ def create_product(product: ProductSchema, current_user: dict = Depends(get_curr
     
     return {"message": "Product created successfully", "id": product_id}
 
+class StockBucketsUpdate(BaseModel):
+    buckets: int = DEFAULT_STOCK_BUCKETS
+
+@router.put("/{product_id}/stock-buckets")
+def update_stock_buckets(product_id: str, update: StockBucketsUpdate, current_user: dict = Depends(get_current_user)):
+    """Split a hot product's stock into `buckets` rows (0 turns bucketing off)."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not 0 <= update.buckets <= 64:
+        raise HTTPException(status_code=400, detail="buckets must be between 0 and 64")
+
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    cursor = conn.cursor()
+    try:
+        set_stock_buckets(cursor, product_id, update.buckets)
+        conn.commit()
+        invalidate_product(product_id)
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {"message": "Stock buckets updated", "buckets": update.buckets}
+
+@router.post("/stock/sync")
+def sync_stock(current_user: dict = Depends(get_current_user)):
+    """Refresh stockQuantity/inStock of bucketed products from their buckets."""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    cursor = conn.cursor()
+    try:
+        updated = sync_bucketed_stock(cursor)
+        conn.commit()
+        invalidate_product()
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {"message": "Stock synced", "updated": updated}
+
 @router.put("/{product_id}")
 def update_product(product_id: str, product: ProductSchema, current_user: dict = Depends(get_current_user)):
     if current_user.get('role') != 'admin':
@@ -152,6 +352,11 @@ def update_product(product_id: str, product: ProductSchema, current_user: dict =
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        # UPDATE's rowcount can't tell a missing product from an unchanged
+        # one; without this an unknown id would be added to the indexes
+        cursor.execute("SELECT id FROM products WHERE id = %s FOR UPDATE", (product_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Product not found")
         cursor.execute(
             """
             UPDATE products 
@@ -166,7 +371,16 @@ def update_product(product_id: str, product: ProductSchema, current_user: dict =
              json.dumps(product.sizes), json.dumps(product.colors), product.material, product.gender, 
              product.sku, product.discount, product.isNew, product.isBestseller, product_id)
         )
+        # A bucketed product's stock lives in its buckets: spread the new level over them
+        buckets = bucket_count(cursor, product_id)
+        if buckets:
+            set_stock_buckets(cursor, product_id, buckets, total=product.stockQuantity)
         conn.commit()
+        invalidate_product(product_id)
+        _reindex_product(product_id, product)
+    except HTTPException:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -184,8 +398,13 @@ def delete_product(product_id: str, current_user: dict = Depends(get_current_use
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        cursor.execute("DELETE FROM stock_buckets WHERE product_id = %s", (product_id,))
+        cursor.execute("DELETE FROM product_ratings WHERE product_id = %s", (product_id,))
         cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
         conn.commit()
+        invalidate_product(product_id)
+        search_index.remove(product_id)
+        facet_index.remove(product_id)
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
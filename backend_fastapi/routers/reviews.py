@@ -1,16 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from database import get_db_connection
+from database import get_db_connection, product_scope
+from prepared_statements import hot_query
 from auth_utils import get_current_user
+from cache_utils import invalidate_product
+from facet_index import facet_index
+from ratings import apply_review, fetch_rating_summaries, rating_reconciler
+from pagination import MAX_PAGE_SIZE, encode_cursor, decode_cursor, keyset_condition
+from datetime import datetime
+import mysql.connector
 
 router = APIRouter()
 
+DEFAULT_REVIEW_PAGE_SIZE = 20
+MAX_SUMMARY_PRODUCTS = 500
+
+# Newest first, one page at a time along (product_id, created_at, id)
+REVIEWS_QUERY = """
+    SELECT r.id, r.product_id, r.user_id, r.rating, r.comment, r.created_at, u.name as user_name
+    FROM reviews r
+    JOIN users u ON r.user_id = u.id
+    WHERE {}
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT %s
+"""
+FIRST_PAGE_QUERY = hot_query(REVIEWS_QUERY.format("r.product_id = %s"))
+NEXT_PAGE_QUERY = hot_query(
+    REVIEWS_QUERY.format("r.product_id = %s AND " + keyset_condition("r.created_at", True, "r.id"))
+)
+
 class ReviewCreate(BaseModel):
     product_id: str
-    rating: int
+    rating: int = Field(..., ge=1, le=5)
     comment: str
 
+class RatingSummaryRequest(BaseModel):
+    product_ids: List[str]
+
 @router.post("/")
 def create_review(review: ReviewCreate, current_user: dict = Depends(get_current_user)):
     conn = get_db_connection()
@@ -28,40 +55,26 @@ def create_review(review: ReviewCreate, current_user: dict = Depends(get_current
         if cursor.fetchone():
              raise HTTPException(status_code=400, detail="You have already reviewed this product")
 
-        # Create review
-        cursor.execute(
-            "INSERT INTO reviews (product_id, user_id, rating, comment) VALUES (%s, %s, %s, %s)",
-            (review.product_id, current_user['id'], review.rating, review.comment)
-        )
+        # Create review and fold it into the product's rating in one transaction
+        try:
+            cursor.execute(
+                "INSERT INTO reviews (product_id, user_id, rating, comment) VALUES (%s, %s, %s, %s)",
+                (review.product_id, current_user['id'], review.rating, review.comment)
+            )
+        except mysql.connector.IntegrityError:
+            # A concurrent request from the same user got there first
+            raise HTTPException(status_code=400, detail="You have already reviewed this product")
+        apply_review(cursor, review.product_id, review.rating, 1)
+        cursor.execute("SELECT rating FROM products WHERE id = %s", (review.product_id,))
+        product = cursor.fetchone()
         
         conn.commit()
-        
-        # Recalculate product rating (Optional optimization: do this async or periodically)
-        cursor.execute(
-            "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM reviews WHERE product_id = %s",
-            (review.product_id,)
-        )
-        stats = cursor.fetchone() # returns tuple or dict depending on driver, but here we used default cursor for insert, let's switch to dict cursor for select if needed, or just access by index
-        
-        # Re-fetch with dict cursor to be safe
-        cursor.close()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM reviews WHERE product_id = %s",
-            (review.product_id,)
-        )
-        stats = cursor.fetchone()
-        
-        if stats:
-             new_rating = float(stats['avg_rating'])
-             new_count = stats['count']
-             cursor.execute(
-                 "UPDATE products SET rating = %s, reviewCount = %s WHERE id = %s",
-                 (new_rating, new_count, review.product_id)
-             )
-             conn.commit()
+        invalidate_product(review.product_id, listings=False)
+        if product:
+            facet_index.set_rating(review.product_id, product[0])
 
     except HTTPException as he:
+        conn.rollback()
         raise he
     except Exception as e:
         conn.rollback()
@@ -73,25 +86,52 @@ def create_review(review: ReviewCreate, current_user: dict = Depends(get_current
     return {"message": "Review added successfully"}
 
 @router.get("/{product_id}")
-def get_product_reviews(product_id: str):
-    conn = get_db_connection()
+def get_product_reviews(
+    product_id: str,
+    limit: int = Query(DEFAULT_REVIEW_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor_token: Optional[str] = Query(None, alias="cursor")
+):
+    query, params = FIRST_PAGE_QUERY, [product_id]
+    if cursor_token:
+        last_created_at, last_id = decode_cursor(cursor_token, 2, convert=(datetime.fromisoformat, int))
+        query = NEXT_PAGE_QUERY
+        params.extend([last_created_at, last_created_at, last_id])
+    
+    conn = get_db_connection(read_only=True, scope=product_scope(product_id))
     if not conn:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            """
-            SELECT r.id, r.product_id, r.user_id, r.rating, r.comment, r.created_at, u.name as user_name 
-            FROM reviews r
-            JOIN users u ON r.user_id = u.id
-            WHERE r.product_id = %s
-            ORDER BY r.created_at DESC
-            """,
-            (product_id,)
-        )
+        cursor.execute(query, params + [limit + 1])
         reviews = cursor.fetchall()
-        return reviews
+        cursor.close()
+        
+        next_cursor = None
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            next_cursor = encode_cursor(reviews[-1]['created_at'], reviews[-1]['id'])
+        
+        # The star histogram is precomputed, so the summary is a key lookup
+        cursor = conn.cursor()
+        summary = fetch_rating_summaries(cursor, [product_id])[product_id]
+        return {"items": reviews, "next_cursor": next_cursor, "summary": summary}
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/summaries")
+def get_rating_summaries(request: RatingSummaryRequest):
+    if len(request.product_ids) > MAX_SUMMARY_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SUMMARY_PRODUCTS} product ids per request")
+    
+    conn = get_db_connection(read_only=True, scope=[product_scope(pid) for pid in request.product_ids])
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    cursor = conn.cursor()
+    try:
+        return {"summaries": fetch_rating_summaries(cursor, request.product_ids)}
     finally:
         cursor.close()
         conn.close()
@@ -105,8 +145,9 @@ def delete_review(review_id: int, current_user: dict = Depends(get_current_user)
     try:
         cursor = conn.cursor(dictionary=True)
         
-        # Check ownership or admin
-        cursor.execute("SELECT user_id, product_id FROM reviews WHERE id = %s", (review_id,))
+        # Check ownership or admin; the row lock keeps a concurrent delete
+        # from taking the review out of the aggregates twice
+        cursor.execute("SELECT user_id, product_id, rating FROM reviews WHERE id = %s FOR UPDATE", (review_id,))
         review = cursor.fetchone()
         
         if not review:
@@ -116,25 +157,16 @@ def delete_review(review_id: int, current_user: dict = Depends(get_current_user)
             raise HTTPException(status_code=403, detail="Not authorized to delete this review")
             
         cursor.execute("DELETE FROM reviews WHERE id = %s", (review_id,))
+        apply_review(cursor, review['product_id'], review['rating'], -1)
+        cursor.execute("SELECT rating FROM products WHERE id = %s", (review['product_id'],))
+        product = cursor.fetchone()
         conn.commit()
-        
-        # Recalculate stats
-        cursor.execute(
-            "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM reviews WHERE product_id = %s",
-            (review['product_id'],)
-        )
-        stats = cursor.fetchone()
-        
-        new_rating = float(stats['avg_rating']) if stats['avg_rating'] else 0
-        new_count = stats['count']
-        
-        cursor.execute(
-             "UPDATE products SET rating = %s, reviewCount = %s WHERE id = %s",
-             (new_rating, new_count, review['product_id'])
-        )
-        conn.commit()
+        invalidate_product(review['product_id'], listings=False)
+        if product:
+            facet_index.set_rating(review['product_id'], product['rating'])
         
     except HTTPException as he:
+        conn.rollback()
         raise he
     except Exception as e:
         conn.rollback()
@@ -144,3 +176,13 @@ def delete_review(review_id: int, current_user: dict = Depends(get_current_user)
         conn.close()
         
     return {"message": "Review deleted"}
+
+@router.post("/reconcile")
+def reconcile_product_ratings(current_user: dict = Depends(get_current_user)):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        corrected = rating_reconciler.run_once()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"message": "Ratings reconciled", "corrected": corrected}
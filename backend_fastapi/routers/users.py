@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from database import get_db_connection
 from auth_utils import get_current_user
+from cache_utils import invalidate_user
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -60,6 +61,7 @@ def update_profile(profile: UserProfileUpdate, current_user: dict = Depends(get_
             (profile.name, profile.phone, current_user['id'])
         )
         conn.commit()
+        invalidate_user(current_user['id'])
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
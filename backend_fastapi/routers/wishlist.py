@@ -1,35 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
 from database import get_db_connection
 from auth_utils import get_current_user
-import json
+from product_rows import fetch_product_rows, product_columns, select_list, PRODUCT_COLUMNS
+from prepared_statements import hot_query
 
 router = APIRouter(tags=["wishlist"])
 
+WISHLIST_QUERY = """
+    SELECT {} FROM products p
+    JOIN wishlist w ON p.id = w.product_id
+    WHERE w.user_id = %s
+"""
+FULL_WISHLIST_QUERY = hot_query(WISHLIST_QUERY.format(select_list(PRODUCT_COLUMNS, "p")))
+
 @router.get("/")
-def get_wishlist(current_user: dict = Depends(get_current_user)):
+def get_wishlist(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    columns = product_columns(fields)
     conn = get_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT p.* FROM products p
-        JOIN wishlist w ON p.id = w.product_id
-        WHERE w.user_id = %s
-    """, (current_user['id'],))
-    
-    products = cursor.fetchall()
+    cursor = conn.cursor()
+    if columns == PRODUCT_COLUMNS:
+        query = FULL_WISHLIST_QUERY
+    else:
+        query = WISHLIST_QUERY.format(select_list(columns, "p"))
+    cursor.execute(query, (current_user['id'],))
     
-    # Parse JSON fields
-    for p in products:
-        p['images'] = json.loads(p['images']) if p['images'] else []
-        p['tags'] = json.loads(p['tags']) if p['tags'] else []
-        p['sizes'] = json.loads(p['sizes']) if p['sizes'] else []
-        p['colors'] = json.loads(p['colors']) if p['colors'] else []
-        p['inStock'] = bool(p['inStock'])
-        p['featured'] = bool(p['featured'])
-        p['isNew'] = bool(p['isNew'] or False)
-        p['isBestseller'] = bool(p['isBestseller'] or False)
+    products = fetch_product_rows(cursor)
 
     cursor.close()
     conn.close()
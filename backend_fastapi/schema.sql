@@ -1,7 +1,16 @@
 SET FOREIGN_KEY_CHECKS = 0;
+DROP TABLE IF EXISTS user_signups_daily;
+DROP TABLE IF EXISTS product_sales_daily;
+DROP TABLE IF EXISTS sales_daily;
+DROP TABLE IF EXISTS sales_hourly;
 DROP TABLE IF EXISTS notifications;
+DROP TABLE IF EXISTS product_ratings;
+DROP TABLE IF EXISTS email_outbox;
+DROP TABLE IF EXISTS revoked_tokens;
+DROP TABLE IF EXISTS revoked_users;
 DROP TABLE IF EXISTS wishlist;
 DROP TABLE IF EXISTS order_items;
+DROP TABLE IF EXISTS stock_buckets;
 DROP TABLE IF EXISTS orders;
 DROP TABLE IF EXISTS products;
 DROP TABLE IF EXISTS users;
@@ -44,7 +53,27 @@ CREATE TABLE IF NOT EXISTS products (
   discount INT DEFAULT 0,
   isNew BOOLEAN DEFAULT FALSE,
   isBestseller BOOLEAN DEFAULT FALSE,
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  -- Keyset pagination: one (sort column, id) index per supported sort
+  INDEX idx_products_created (created_at, id),
+  INDEX idx_products_price (price, id),
+  INDEX idx_products_rating (rating, id),
+  INDEX idx_products_discount (discount, id),
+  INDEX idx_products_category_created (category, created_at, id),
+  -- Low-stock counts on the admin dashboard
+  INDEX idx_products_stock (stockQuantity),
+  -- Workers polling for product changes (see product_indexes.py)
+  INDEX idx_products_updated (updated_at)
+);
+
+-- Stock of high-contention products split across rows (see inventory.py)
+CREATE TABLE IF NOT EXISTS stock_buckets (
+  product_id VARCHAR(255) NOT NULL,
+  bucket TINYINT NOT NULL,
+  quantity INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (product_id, bucket),
+  FOREIGN KEY (product_id) REFERENCES products(id)
 );
 
 CREATE TABLE IF NOT EXISTS orders (
@@ -54,8 +83,16 @@ CREATE TABLE IF NOT EXISTS orders (
   status ENUM('pending', 'processing', 'shipped', 'delivered', 'cancelled') DEFAULT 'pending',
   shipping_address TEXT,
   payment_status ENUM('pending', 'completed', 'failed') DEFAULT 'pending',
+  idempotency_key VARCHAR(255),
+  -- SHA-256 of the request an idempotency key was first used with
+  request_hash CHAR(64),
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  FOREIGN KEY (user_id) REFERENCES users(id)
+  FOREIGN KEY (user_id) REFERENCES users(id),
+  UNIQUE KEY uq_orders_idempotency (user_id, idempotency_key),
+  -- Admin listing/export: keyset on (created_at, id), optionally filtered
+  INDEX idx_orders_created (created_at, id),
+  INDEX idx_orders_status_created (status, created_at, id),
+  INDEX idx_orders_user_created (user_id, created_at, id)
 );
 
 CREATE TABLE IF NOT EXISTS order_items (
@@ -112,5 +149,88 @@ CREATE TABLE IF NOT EXISTS reviews (
   comment TEXT,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   FOREIGN KEY (product_id) REFERENCES products(id),
-  FOREIGN KEY (user_id) REFERENCES users(id)
+  FOREIGN KEY (user_id) REFERENCES users(id),
+  UNIQUE KEY uq_reviews_user_product (user_id, product_id),
+  -- Keyset pagination of a product's reviews, newest first
+  INDEX idx_reviews_product_created (product_id, created_at, id)
+);
+
+-- Running rating aggregates per product, maintained with each review write
+-- and reconciled against reviews periodically (see ratings.py)
+CREATE TABLE IF NOT EXISTS product_ratings (
+  product_id VARCHAR(255) PRIMARY KEY,
+  rating_sum INT NOT NULL DEFAULT 0,
+  rating_count INT NOT NULL DEFAULT 0,
+  star_1 INT NOT NULL DEFAULT 0,
+  star_2 INT NOT NULL DEFAULT 0,
+  star_3 INT NOT NULL DEFAULT 0,
+  star_4 INT NOT NULL DEFAULT 0,
+  star_5 INT NOT NULL DEFAULT 0,
+  FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+-- Emails queued in the same transaction as the change they announce and
+-- delivered by background workers (see email_outbox.py)
+CREATE TABLE IF NOT EXISTS email_outbox (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  kind VARCHAR(50) NOT NULL,
+  recipient VARCHAR(255) NOT NULL,
+  payload JSON NOT NULL,
+  status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+  attempts INT DEFAULT 0,
+  next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  last_error TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  sent_at TIMESTAMP NULL,
+  INDEX idx_email_outbox_due (status, next_attempt_at)
+);
+
+-- Access tokens revoked before expiry, by jti or for every token a user was
+-- issued before not_before (see token_denylist.py). Rows are deleted once
+-- the tokens they cover would have expired.
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+  jti VARCHAR(64) PRIMARY KEY,
+  user_id VARCHAR(255),
+  expires_at DATETIME NOT NULL,
+  revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_revoked_tokens_expires (expires_at)
+);
+
+CREATE TABLE IF NOT EXISTS revoked_users (
+  user_id VARCHAR(255) PRIMARY KEY,
+  not_before DATETIME NOT NULL,
+  expires_at DATETIME NOT NULL,
+  INDEX idx_revoked_users_expires (expires_at)
+);
+
+-- Dashboard rollups, maintained in the transactions that create orders,
+-- change their status and register users (see rollups.py). Buckets follow
+-- the order's created_at; cancelled orders carry no revenue.
+CREATE TABLE IF NOT EXISTS sales_hourly (
+  hour DATETIME NOT NULL,
+  status VARCHAR(20) NOT NULL,
+  order_count INT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (hour, status)
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+  day DATE NOT NULL,
+  status VARCHAR(20) NOT NULL,
+  order_count INT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+  day DATE NOT NULL,
+  product_id VARCHAR(255) NOT NULL,
+  units INT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_signups_daily (
+  day DATE PRIMARY KEY,
+  signups INT NOT NULL DEFAULT 0
 );
@@ -0,0 +1,179 @@
+import heapq
+import json
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from database import get_db_connection
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Field weights: a match in the name counts for more than one in the description
+FIELD_WEIGHTS = {"name": 3, "brand": 2, "tags": 2, "description": 1}
+MAX_PREFIX_EXPANSIONS = 20
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index over product name, description, tags and brand,
+    ranked with BM25. Query cost depends on the postings of the query terms,
+    not on the catalog size.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.loaded = False
+        self._postings = {}     # term -> {product_id: weighted term frequency}
+        self._doc_terms = {}    # product_id -> Counter of terms, for removal
+        self._doc_len = {}
+        self._total_len = 0
+        self._vocabulary = []   # sorted terms, for prefix matching
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def _document_terms(self, product):
+        terms = Counter()
+        tags = product.get('tags') or []
+        if isinstance(tags, (str, bytes)):
+            tags = json.loads(tags)
+        fields = {
+            "name": product.get('name'),
+            "brand": product.get('brand'),
+            "tags": " ".join(tags),
+            "description": product.get('description'),
+        }
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                terms[term] += weight
+        return terms
+
+    def _remove(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[product_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+        self._total_len -= self._doc_len.pop(product_id)
+
+    def _add(self, product):
+        product_id = product['id']
+        self._remove(product_id)
+        terms = self._document_terms(product)
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocabulary, term)
+            postings[product_id] = tf
+        length = sum(terms.values())
+        self._doc_terms[product_id] = terms
+        self._doc_len[product_id] = length
+        self._total_len += length
+
+    def add(self, product: dict):
+        """Index a product, replacing any previous version of it."""
+        with self._lock:
+            self._add(product)
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._remove(product_id)
+
+    def load(self, fetch_products, force: bool = False):
+        """
+        (Re)build the index from `fetch_products()`. The fetch runs under the
+        index lock so a write that lands mid-build is applied after it.
+        """
+        with self._lock:
+            if self.loaded and not force:
+                return
+            products = fetch_products()
+            self._postings, self._doc_terms, self._doc_len = {}, {}, {}
+            self._total_len = 0
+            self._vocabulary = []
+            for product in products:
+                self._add(product)
+            self.loaded = True
+
+    def _expand_prefix(self, prefix):
+        start = bisect_left(self._vocabulary, prefix)
+        matches = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, limit: int = None):
+        """
+        Return [(product_id, score), ...] best first. The last query token is
+        also matched as a prefix so results stay useful while the user types.
+        """
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            terms = set(query_terms[:-1])
+            terms.update(self._expand_prefix(query_terms[-1]))
+
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for product_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[product_id] / avg_len)
+                    scores[product_id] = scores.get(product_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = scores.items()
+        if limit is not None:
+            return heapq.nlargest(limit, ranked, key=lambda item: (item[1], item[0]))
+        return sorted(ranked, key=lambda item: (item[1], item[0]), reverse=True)
+
+
+search_index = ProductSearchIndex()
+
+def fetch_searchable_products(since=None):
+    """Indexed columns of every product, or of those updated at or after `since`."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cursor = conn.cursor(dictionary=True)
+        if since is None:
+            cursor.execute("SELECT id, name, description, tags, brand FROM products")
+        else:
+            cursor.execute(
+                "SELECT id, name, description, tags, brand FROM products WHERE updated_at >= %s", (since,)
+            )
+        products = cursor.fetchall()
+        cursor.close()
+        return products
+    finally:
+        conn.close()
+
+def ensure_search_index():
+    """Build the index from the products table the first time it is needed."""
+    if not search_index.loaded:
+        search_index.load(fetch_searchable_products)
+    return search_index
@@ -595,6 +595,10 @@ def seed_database():
             (admin_id, "Admin", "admin@eliteshop.com", admin_pw, "admin")
         )
 
+        # Dashboard rollups for the rows inserted above
+        from rollups import rebuild_rollups
+        rebuild_rollups(cursor)
+
         conn.commit()
         print(f"{len(products)} products inserted")
         print("Database seeded successfully")
@@ -0,0 +1,97 @@
+"""
+The outbox delivers through a real SMTP conversation and gives up on an
+email whose payload cannot be rendered instead of re-claiming its batch
+forever. Queues one order confirmation and one row whose payload has no
+items in the database from .env, drains the outbox against a local aiosmtpd
+server until the broken row runs out of attempts, then removes both rows.
+Other pending outbox rows get sent to the local server too, so run it
+against a development database. Needs aiosmtpd (pip install aiosmtpd).
+"""
+import json
+import os
+import sys
+import uuid
+
+os.environ.update({
+    "EMAIL_BACKEND": "smtp",
+    "SMTP_SERVER": "127.0.0.1",
+    "SMTP_PORT": "8025",
+    "SMTP_STARTTLS": "false",
+    "EMAIL_MAX_ATTEMPTS": "3",
+})
+os.environ.pop("SMTP_USER", None)
+os.environ.pop("SMTP_PASSWORD", None)
+
+from aiosmtpd.controller import Controller
+from database import db_connection
+from email_outbox import EMAIL_MAX_ATTEMPTS, email_outbox, enqueue_email
+from email_utils import SMTPSession
+
+
+class Inbox:
+    def __init__(self):
+        self.recipients = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+def execute(query, params=()):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.description else None
+        conn.commit()
+        cursor.close()
+        return rows
+
+
+tag = uuid.uuid4().hex[:12]
+good, broken = f"outbox-ok-{tag}@example.com", f"outbox-broken-{tag}@example.com"
+product_id = execute("SELECT id FROM products LIMIT 1")[0][0]
+with db_connection() as conn:
+    cursor = conn.cursor()
+    enqueue_email(cursor, "order_confirmation", good, {
+        "order_id": f"check-{tag}",
+        "total_amount": 9.99,
+        "items": [{"product_id": product_id, "quantity": 1, "price": 9.99}],
+    })
+    cursor.execute(
+        "INSERT INTO email_outbox (kind, recipient, payload) VALUES (%s, %s, %s)",
+        # Valid JSON (the column is JSON) that the renderer cannot use
+        ("order_confirmation", broken, json.dumps({"order_id": f"check-{tag}"})),
+    )
+    conn.commit()
+    cursor.close()
+
+inbox = Inbox()
+controller = Controller(inbox, hostname="127.0.0.1", port=8025)
+controller.start()
+session = SMTPSession()
+try:
+    for _ in range(EMAIL_MAX_ATTEMPTS):
+        # Skip the retry backoff
+        execute("UPDATE email_outbox SET next_attempt_at = NOW() WHERE recipient IN (%s, %s)", (good, broken))
+        email_outbox.drain_once(session)
+    outcome = dict(
+        (row[0], row[1:]) for row in execute(
+            "SELECT recipient, status, attempts, last_error FROM email_outbox WHERE recipient IN (%s, %s)",
+            (good, broken),
+        )
+    )
+finally:
+    session.close()
+    controller.stop()
+    execute("DELETE FROM email_outbox WHERE recipient IN (%s, %s)", (good, broken))
+
+checks = {
+    "order confirmation delivered once": inbox.recipients.count(good) == 1 and outcome[good][0] == "sent",
+    "broken payload never sent": broken not in inbox.recipients,
+    f"broken payload failed after {EMAIL_MAX_ATTEMPTS} attempts": (
+        outcome[broken][:2] == ("failed", EMAIL_MAX_ATTEMPTS) and bool(outcome[broken][2])
+    ),
+}
+for name, ok in checks.items():
+    print(f"{'OK  ' if ok else 'FAIL'} {name}")
+sys.exit(0 if all(checks.values()) else 1)
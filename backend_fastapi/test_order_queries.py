@@ -0,0 +1,88 @@
+"""
+Order history and the admin order list must load a page's items with a
+fixed number of queries, however many orders it holds. Runs the app
+in-process against the database from .env: a throwaway customer and admin
+get 1, 5 and then 25 orders (inserted directly, removed at the end) and
+X-DB-Queries has to stay the same. Needs at least one product (seeder.py).
+"""
+import os
+import sys
+import uuid
+
+os.environ["QUERY_REPEAT_ACTION"] = "raise"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient
+from auth_utils import create_access_token
+from database import db_connection
+import main
+
+ORDER_COUNTS = (1, 5, 25)
+ITEMS_PER_ORDER = 2
+
+
+def execute(query, params=()):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.description else None
+        conn.commit()
+        cursor.close()
+        return rows
+
+
+def add_orders(user_id, product_id, count):
+    for _ in range(count):
+        order_id = str(uuid.uuid4())
+        execute(
+            "INSERT INTO orders (id, user_id, total_amount, shipping_address) VALUES (%s, %s, %s, %s)",
+            (order_id, user_id, 10, "Query count check"),
+        )
+        for _ in range(ITEMS_PER_ORDER):
+            execute(
+                "INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase) VALUES (%s, %s, 1, 5)",
+                (order_id, product_id),
+            )
+
+
+customer_id, admin_id = str(uuid.uuid4()), str(uuid.uuid4())
+product_id = execute("SELECT id FROM products LIMIT 1")[0][0]
+for user_id, role in ((customer_id, "user"), (admin_id, "admin")):
+    execute(
+        "INSERT INTO users (id, name, email, password_hash, role) VALUES (%s, %s, %s, %s, %s)",
+        (user_id, "Query Check", f"query-check-{user_id}@example.com", "!", role),
+    )
+
+counts = {"history": [], "all": []}
+try:
+    with TestClient(main.app) as client:
+        customer = {"Authorization": f"Bearer {create_access_token({'sub': customer_id})}"}
+        admin = {"Authorization": f"Bearer {create_access_token({'sub': admin_id})}"}
+        requests = {
+            "history": lambda: client.get("/api/orders/history", headers=customer),
+            "all": lambda: client.get("/api/orders/all", params={"user_id": customer_id, "limit": 100}, headers=admin),
+        }
+        for request in requests.values():
+            request()  # loads the users into the user cache
+        added = 0
+        for count in ORDER_COUNTS:
+            add_orders(customer_id, product_id, count - added)
+            added = count
+            for name, request in requests.items():
+                response = request()
+                response.raise_for_status()
+                body = response.json()
+                orders = body if name == "history" else body["items"]
+                assert len(orders) == count and all(len(order["items"]) == ITEMS_PER_ORDER for order in orders)
+                counts[name].append(int(response.headers["X-DB-Queries"]))
+finally:
+    execute("DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE user_id = %s)", (customer_id,))
+    execute("DELETE FROM orders WHERE user_id = %s", (customer_id,))
+    execute("DELETE FROM users WHERE id IN (%s, %s)", (customer_id, admin_id))
+
+failed = False
+for name, queries in counts.items():
+    constant = len(set(queries)) == 1
+    failed = failed or not constant
+    print(f"{'OK  ' if constant else 'FAIL'} {name}: {dict(zip(ORDER_COUNTS, queries))} queries by order count")
+sys.exit(1 if failed else 0)
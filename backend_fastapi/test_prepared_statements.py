@@ -0,0 +1,35 @@
+"""
+A prepared statement the server dropped behind the cache's back is
+prepared again on a fresh cursor. COM_RESET_CONNECTION deallocates every
+statement of the session but keeps its connection id, so the cache cannot
+tell from the id and has to take the ER_UNKNOWN_STMT_HANDLER path. Runs on
+the pure Python driver and, when it loads, the C extension. Needs the
+database from .env; no tables are touched.
+"""
+import sys
+import mysql.connector
+from database import db_config
+from prepared_statements import StatementCache, hot_query
+
+QUERY = hot_query("SELECT %s + 1 AS n")
+
+failed = False
+for use_pure in (True, False) if mysql.connector.HAVE_CEXT else (True,):
+    conn = mysql.connector.connect(use_pure=use_pure, **db_config)
+    try:
+        cache = StatementCache(conn, 4)
+        before = cache.execute(QUERY, (1,), True).fetchall()
+        connection_id = conn.connection_id
+        conn.cmd_reset_connection()
+        after = cache.execute(QUERY, (41,), True).fetchall()
+        again = cache.execute(QUERY, (99,), True).fetchall()
+        ok = (
+            before == [{"n": 2}] and after == [{"n": 42}] and again == [{"n": 100}]
+            and conn.connection_id == connection_id and cache.prepares == 2
+        )
+    finally:
+        conn.close()
+    failed = failed or not ok
+    driver = "pure" if use_pure else "C extension"
+    print(f"{'OK  ' if ok else 'FAIL'} {driver}: {before} / after reset {after} / {again}, {cache.prepares} prepares")
+sys.exit(1 if failed else 0)
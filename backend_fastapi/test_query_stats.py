@@ -0,0 +1,27 @@
+"""
+Queries per request for the main read endpoints of a running server. Start
+it with QUERY_REPEAT_ACTION=raise so an N+1 regression answers 500 here.
+"""
+import sys
+import requests
+
+BASE_URL = "http://localhost:8000/api"
+
+login = requests.post(f"{BASE_URL}/auth/login", json={"email": "admin@eliteshop.com", "password": "admin123"})
+headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+product_id = requests.get(f"{BASE_URL}/products/", params={"limit": 1}).json()["items"][0]["id"]
+
+failed = False
+for path in [
+    "/products/?limit=20",
+    f"/products/{product_id}",
+    f"/reviews/{product_id}",
+    "/orders/history",
+    "/wishlist/",
+    "/notifications/",
+    "/admin/summary",
+]:
+    response = requests.get(BASE_URL + path, headers=headers)
+    print(f"{response.status_code} {path}: {response.headers.get('X-DB-Queries')} queries, {response.headers.get('Server-Timing')}")
+    failed = failed or response.status_code >= 500
+sys.exit(1 if failed else 0)
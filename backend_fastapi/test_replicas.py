@@ -0,0 +1,26 @@
+"""
+Check replica routing against the databases in .env, e.g. a primary on
+3306 and a replica on 3307 (DB_REPLICA_HOSTS=127.0.0.1:3307).
+"""
+from database import get_db_connection, replica_set
+
+
+def served_by(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT @@hostname, @@port")
+    host, port = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return f"{host}:{port}"
+
+
+replica_set.check()
+for replica in replica_set.replicas:
+    print(f"Replica {replica.host}: healthy={replica.healthy} lag={replica.lag}")
+
+print("Primary read:", served_by(get_db_connection()))
+for _ in range(len(replica_set.replicas) * 2 or 1):
+    print("Read-only read:", served_by(get_db_connection(read_only=True)))
+
+replica_set.mark_written("test-user")
+print("Read after write:", served_by(get_db_connection(read_only=True, user_id="test-user")))
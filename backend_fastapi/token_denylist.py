@@ -0,0 +1,140 @@
+"""
+Revoked access tokens. Tokens carry a random `jti`; logout and admin
+revocation add it here, and an admin can also cut off every token a user
+was issued before a point in time. Entries only matter until the token
+would have expired anyway, so they are pruned after that.
+
+The check sits on every authenticated request and is a single dict
+lookup. Revocations are written to the database and every worker reloads
+them periodically, so they survive restarts and reach the other processes.
+"""
+import calendar
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from database import get_db_connection
+
+load_dotenv()
+
+TOKEN_DENYLIST_REFRESH_SECONDS = float(os.getenv("TOKEN_DENYLIST_REFRESH_SECONDS", "30"))
+
+
+def _epoch(value: datetime):
+    return calendar.timegm(value.utctimetuple())
+
+
+def _utc(epoch: float):
+    return datetime.utcfromtimestamp(epoch)
+
+
+class TokenDenylist:
+    def __init__(self):
+        self._revoked = {}  # jti -> expiry (epoch seconds)
+        self._cutoffs = {}  # user_id -> (not_before, expiry)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti is not None and jti in self._revoked:
+            return True
+        if self._cutoffs:
+            cutoff = self._cutoffs.get(payload.get("sub"))
+            # Tokens issued before iat existed cannot prove they are newer
+            if cutoff is not None and payload.get("iat", 0) < cutoff[0]:
+                return True
+        return False
+
+    def revoke(self, jti: str, expires_at: float, user_id: str = None):
+        self._persist(
+            "INSERT INTO revoked_tokens (jti, user_id, expires_at) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE expires_at = VALUES(expires_at)",
+            (jti, user_id, _utc(expires_at))
+        )
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def revoke_user(self, user_id: str, expires_at: float, not_before: float = None):
+        """Revoke every token `user_id` was issued before `not_before` (default: now)."""
+        # Whole seconds, like iat; rounding up also catches tokens issued
+        # earlier in the current second
+        not_before = math.ceil(time.time() if not_before is None else not_before)
+        self._persist(
+            "INSERT INTO revoked_users (user_id, not_before, expires_at) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE not_before = VALUES(not_before), expires_at = VALUES(expires_at)",
+            (user_id, _utc(not_before), _utc(expires_at))
+        )
+        with self._lock:
+            cutoffs = dict(self._cutoffs)
+            cutoffs[user_id] = (not_before, expires_at)
+            self._cutoffs = cutoffs
+
+    def load(self):
+        """Replace the in-memory state with the unexpired rows from the database."""
+        conn = get_db_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            now = _utc(time.time())
+            cursor.execute("DELETE FROM revoked_tokens WHERE expires_at <= %s", (now,))
+            cursor.execute("DELETE FROM revoked_users WHERE expires_at <= %s", (now,))
+            conn.commit()
+            cursor.execute("SELECT jti, expires_at FROM revoked_tokens")
+            revoked = {jti: _epoch(expires_at) for jti, expires_at in cursor.fetchall()}
+            cursor.execute("SELECT user_id, not_before, expires_at FROM revoked_users")
+            cutoffs = {user_id: (_epoch(nb), _epoch(exp)) for user_id, nb, exp in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            # Keep revocations made while the rows were being read; entries
+            # past their expiry are dropped here
+            unexpired = time.time()
+            for jti, expires_at in self._revoked.items():
+                if expires_at > unexpired:
+                    revoked.setdefault(jti, expires_at)
+            for user_id, cutoff in self._cutoffs.items():
+                if cutoff[1] > unexpired:
+                    cutoffs.setdefault(user_id, cutoff)
+            self._revoked = revoked
+            self._cutoffs = cutoffs
+
+    def _persist(self, query, params):
+        conn = get_db_connection()
+        if not conn:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def start(self):
+        self.load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-denylist", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(TOKEN_DENYLIST_REFRESH_SECONDS):
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Error reloading token denylist: {e}")
+
+
+token_denylist = TokenDenylist()
@@ -17,22 +17,28 @@ import {
 } from 'lucide-react';
 import {
   fetchAllOrders,
-  updateOrderStatusApi,
-  fetchAllUsers,
-  fetchProducts,
+  updateOrderStatus,
+  fetchUsers,
+  fetchAllProducts,
+  fetchAdminSummary,
   createProductApi,
   updateProductApi,
   deleteProductApi
 } from '../services/api';
-import { Order, User as UserType, Product } from '../types';
+import { Order, User as UserType, Product, AdminSummary } from '../types';
+
+type Tab = 'overview' | 'orders' | 'products' | 'users';
 
 const AdminDashboard: React.FC = () => {
   const [orders, setOrders] = useState<Order[]>([]);
   const [users, setUsers] = useState<UserType[]>([]);
   const [products, setProducts] = useState<Product[]>([]);
-  const [totalUsers, setTotalUsers] = useState(0);
+  const [summary, setSummary] = useState<AdminSummary | null>(null);
   const [loading, setLoading] = useState(true);
-  const [activeTab, setActiveTab] = useState('overview');
+  const [activeTab, setActiveTab] = useState<Tab>('overview');
+  // Tabs whose list has been fetched; each list is only loaded when its tab is first opened
+  const [loadedTabs, setLoadedTabs] = useState<Tab[]>([]);
+  const [tabLoading, setTabLoading] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedOrder, setSelectedOrder] = useState<Order | null>(null);
 
@@ -52,42 +58,65 @@ const AdminDashboard: React.FC = () => {
     inStock: true
   });
 
-  const loadData = async () => {
-    setLoading(true);
-    try {
-      const [ordersData, usersData, productsData] = await Promise.all([
-        fetchAllOrders(),
-        fetchAllUsers(),
-        fetchProducts()
-      ]);
+  const loadSummary = async () => {
+    setSummary(await fetchAdminSummary());
+  };
 
-      setOrders(ordersData.map((o: any) => ({
-        ...o,
-        total: parseFloat(o.total_amount),
-        createdAt: new Date(o.created_at),
-        items: o.items.map((item: any) => ({
-          product: { ...item, price: parseFloat(item.price_at_purchase) },
-          quantity: item.quantity
-        })),
-        shippingAddress: { street: o.shipping_address, city: '', state: '', zipCode: '', country: '' }
-      })));
-      setUsers(usersData.users);
-      setTotalUsers(usersData.total);
-      setProducts(productsData);
-    } catch (error) {
-      console.error('Failed to load dashboard data:', error);
-    } finally {
-      setLoading(false);
-    }
+  const loadOrders = async () => {
+    const ordersData = await fetchAllOrders();
+    setOrders(ordersData.map((o: any) => ({
+      ...o,
+      total: parseFloat(o.total_amount),
+      createdAt: new Date(o.created_at),
+      items: o.items.map((item: any) => ({
+        product: { ...item, price: parseFloat(item.price_at_purchase) },
+        quantity: item.quantity
+      })),
+      shippingAddress: { street: o.shipping_address, city: '', state: '', zipCode: '', country: '' }
+    })));
+  };
+
+  const loadUsers = async () => {
+    const usersData = await fetchUsers();
+    setUsers(usersData.users);
+  };
+
+  const loadProducts = async () => {
+    setProducts(await fetchAllProducts());
+  };
+
+  const tabLoaders: Partial<Record<Tab, () => Promise<void>>> = {
+    orders: loadOrders,
+    products: loadProducts,
+    users: loadUsers
+  };
+
+  // After a change: the stats and the list that was changed
+  const refresh = (tab: Tab) => {
+    Promise.all([loadSummary(), tabLoaders[tab]?.()]).catch(error => {
+      console.error('Failed to refresh dashboard data:', error);
+    });
   };
 
   useEffect(() => {
-    loadData();
+    loadSummary()
+      .catch(error => console.error('Failed to load dashboard summary:', error))
+      .finally(() => setLoading(false));
   }, []);
 
+  useEffect(() => {
+    const load = tabLoaders[activeTab];
+    if (!load || loadedTabs.includes(activeTab)) return;
+    setTabLoading(true);
+    load()
+      .then(() => setLoadedTabs(tabs => [...tabs, activeTab]))
+      .catch(error => console.error(`Failed to load ${activeTab}:`, error))
+      .finally(() => setTabLoading(false));
+  }, [activeTab]);
+
   const handleStatusUpdate = async (orderId: string, newStatus: Order['status']) => {
-    await updateOrderStatusApi(orderId, newStatus);
-    loadData();
+    await updateOrderStatus(orderId, newStatus);
+    refresh('orders');
   };
 
   const handleProductSubmit = async (e: React.FormEvent) => {
@@ -100,7 +129,7 @@ const AdminDashboard: React.FC = () => {
       }
       setShowProductModal(false);
       setEditingProduct(null);
-      loadData();
+      refresh('products');
     } catch (e) {
       console.error(e);
       alert('Failed to save product');
@@ -110,7 +139,7 @@ const AdminDashboard: React.FC = () => {
   const handleDeleteProduct = async (id: string) => {
     if (window.confirm('Are you sure you want to delete this product?')) {
       await deleteProductApi(id);
-      loadData();
+      refresh('products');
     }
   };
 
@@ -155,7 +184,7 @@ const AdminDashboard: React.FC = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-sm text-gray-500">Total Users</p>
-                <p className="text-2xl font-bold">{totalUsers}</p>
+                <p className="text-2xl font-bold">{summary ? summary.users.total : '-'}</p>
               </div>
               <Users className="w-10 h-10 text-blue-500 bg-blue-50 p-2 rounded-xl" />
             </div>
@@ -164,7 +193,7 @@ const AdminDashboard: React.FC = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-sm text-gray-500">Total Orders</p>
-                <p className="text-2xl font-bold">{orders.length}</p>
+                <p className="text-2xl font-bold">{summary ? summary.orders.total : '-'}</p>
               </div>
               <ShoppingCart className="w-10 h-10 text-green-500 bg-green-50 p-2 rounded-xl" />
             </div>
@@ -173,7 +202,10 @@ const AdminDashboard: React.FC = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-sm text-gray-500">Total Products</p>
-                <p className="text-2xl font-bold">{products.length}</p>
+                <p className="text-2xl font-bold">{summary ? summary.products.total : '-'}</p>
+                {summary && summary.products.low_stock > 0 && (
+                  <p className="text-xs text-orange-500">{summary.products.low_stock} low on stock</p>
+                )}
               </div>
               <Package className="w-10 h-10 text-purple-500 bg-purple-50 p-2 rounded-xl" />
             </div>
@@ -182,7 +214,7 @@ const AdminDashboard: React.FC = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-sm text-gray-500">Revenue</p>
-                <p className="text-2xl font-bold">${orders.reduce((s, o) => s + o.total, 0).toFixed(2)}</p>
+                <p className="text-2xl font-bold">{summary ? `$${summary.revenue.total.toFixed(2)}` : '-'}</p>
               </div>
               <TrendingUp className="w-10 h-10 text-orange-500 bg-orange-50 p-2 rounded-xl" />
             </div>
@@ -191,7 +223,7 @@ const AdminDashboard: React.FC = () => {
 
         {/* Tabs */}
         <div className="flex space-x-4 mb-6">
-          {['overview', 'orders', 'products', 'users'].map(tab => (
+          {(['overview', 'orders', 'products', 'users'] as Tab[]).map(tab => (
             <button
               key={tab}
               onClick={() => setActiveTab(tab)}
@@ -205,7 +237,11 @@ const AdminDashboard: React.FC = () => {
 
         {/* Content */}
         <div className="bg-white rounded-3xl shadow-sm border border-gray-100 overflow-hidden">
-          {activeTab === 'orders' && (
+          {tabLoading && (
+            <div className="p-8 text-center text-gray-500">Loading {activeTab}...</div>
+          )}
+
+          {!tabLoading && activeTab === 'orders' && (
             <div className="overflow-x-auto">
               <table className="w-full text-left">
                 <thead className="bg-gray-50 border-b border-gray-100">
@@ -248,7 +284,7 @@ const AdminDashboard: React.FC = () => {
             </div>
           )}
 
-          {activeTab === 'products' && (
+          {!tabLoading && activeTab === 'products' && (
             <div>
               <div className="p-6 flex justify-between items-center border-b border-gray-100">
                 <h2 className="text-xl font-bold">Manage Products</h2>
@@ -296,7 +332,7 @@ const AdminDashboard: React.FC = () => {
             </div>
           )}
 
-          {activeTab === 'users' && (
+          {!tabLoading && activeTab === 'users' && (
             <div className="overflow-x-auto">
               <table className="w-full text-left">
                 <thead className="bg-gray-50 border-b border-gray-100">
@@ -2,14 +2,16 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import { ArrowRight, Smartphone, Watch, Camera, Gamepad2, Headphones, Armchair } from 'lucide-react';
 import { useState, useEffect } from 'react';
-import { fetchProducts } from '../services/api';
-import { Product } from '../types';
+import { fetchProductsPage } from '../services/api';
 
 const CategoriesPage: React.FC = () => {
-  const [products, setProducts] = useState<Product[]>([]);
+  const [categoryCounts, setCategoryCounts] = useState<Record<string, number>>({});
 
   useEffect(() => {
-    fetchProducts().then(setProducts).catch(console.error);
+    // The listing's facet counts cover the whole catalog; one row is enough to get them
+    fetchProductsPage({ limit: 1 })
+      .then(page => setCategoryCounts(page.facets.category || {}))
+      .catch(console.error);
   }, []);
   const categories = [
     {
@@ -17,7 +19,7 @@ const CategoriesPage: React.FC = () => {
       icon: Smartphone,
       description: 'Latest gadgets and electronic devices',
       image: 'https://images.pexels.com/photos/163140/iphone-cell-phone-smartphone-technology-163140.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Electronics').length,
+      count: categoryCounts['Electronics'] || 0,
       color: 'from-blue-500 to-blue-600'
     },
     {
@@ -25,7 +27,7 @@ const CategoriesPage: React.FC = () => {
       icon: Watch,
       description: 'Smartwatches, fitness trackers, and more',
       image: 'https://images.pexels.com/photos/267394/pexels-photo-267394.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Wearables').length,
+      count: categoryCounts['Wearables'] || 0,
       color: 'from-emerald-500 to-emerald-600'
     },
     {
@@ -33,7 +35,7 @@ const CategoriesPage: React.FC = () => {
       icon: Camera,
       description: 'Professional cameras, lenses, and accessories',
       image: 'https://images.pexels.com/photos/190819/pexels-photo-190819.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Photography').length,
+      count: categoryCounts['Photography'] || 0,
       color: 'from-purple-500 to-purple-600'
     },
     {
@@ -41,7 +43,7 @@ const CategoriesPage: React.FC = () => {
       icon: Armchair,
       description: 'Modern furniture for home and office',
       image: 'https://images.pexels.com/photos/586093/pexels-photo-586093.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Furniture').length,
+      count: categoryCounts['Furniture'] || 0,
       color: 'from-orange-500 to-orange-600'
     },
     {
@@ -49,7 +51,7 @@ const CategoriesPage: React.FC = () => {
       icon: Gamepad2,
       description: 'Gaming gear and accessories',
       image: 'https://images.pexels.com/photos/2047905/pexels-photo-2047905.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Gaming').length,
+      count: categoryCounts['Gaming'] || 0,
       color: 'from-red-500 to-red-600'
     },
     {
@@ -57,7 +59,7 @@ const CategoriesPage: React.FC = () => {
       icon: Headphones,
       description: 'Essential accessories for all your devices',
       image: 'https://images.pexels.com/photos/3394650/pexels-photo-3394650.jpeg?auto=compress&cs=tinysrgb&w=800',
-      count: products.filter(p => p.category === 'Accessories').length,
+      count: categoryCounts['Accessories'] || 0,
       color: 'from-pink-500 to-pink-600'
     }
   ];
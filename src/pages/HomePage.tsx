@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { ArrowRight, Truck, Shield, HeartHandshake, Award, ChevronLeft, ChevronRight, Star, TrendingUp, Zap, Gift } from 'lucide-react';
 import ProductCard from '../components/ProductCard';
-import { fetchProducts } from '../services/api';
+import { fetchAllProducts } from '../services/api';
 import { Product } from '../types';
 
 const HomePage: React.FC = () => {
@@ -45,7 +45,7 @@ const HomePage: React.FC = () => {
   useEffect(() => {
     const loadFeatured = async () => {
       try {
-        const data = await fetchProducts({ featured: true });
+        const data = await fetchAllProducts({ featured: true });
         setFeaturedProducts(data);
       } catch (error) {
         console.error('Failed to load featured products:', error);
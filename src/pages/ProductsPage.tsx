@@ -1,102 +1,102 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useSearchParams } from 'react-router-dom';
 import { Filter, Grid, List, ChevronDown, SlidersHorizontal, X } from 'lucide-react';
 import ProductCard from '../components/ProductCard';
-import { fetchProducts } from '../services/api';
+import { fetchProductsPage } from '../services/api';
 import { Product } from '../types';
 
+// Sort options and the list endpoint's sort/order for each
+const SORTS: Record<string, { sort: string; order: string }> = {
+  relevance: { sort: 'relevance', order: 'desc' },
+  newest: { sort: 'created_at', order: 'desc' },
+  'price-low': { sort: 'price', order: 'asc' },
+  'price-high': { sort: 'price', order: 'desc' },
+  rating: { sort: 'rating', order: 'desc' },
+  discount: { sort: 'discount', order: 'desc' },
+};
+
 const ProductsPage: React.FC = () => {
   const [searchParams, setSearchParams] = useSearchParams();
   const [products, setProducts] = useState<Product[]>([]);
-  const [filteredProducts, setFilteredProducts] = useState<Product[]>([]);
   const [viewMode, setViewMode] = useState<'grid' | 'list'>('grid');
-  const [sortBy, setSortBy] = useState('name');
-  const [selectedCategory, setSelectedCategory] = useState('all');
+  const [sortBy, setSortBy] = useState('relevance');
   const [selectedBrands, setSelectedBrands] = useState<string[]>([]);
   const [priceRange, setPriceRange] = useState([0, 1000]);
   const [showFilters, setShowFilters] = useState(false);
   const [ratingFilter, setRatingFilter] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [total, setTotal] = useState(0);
+  const [facets, setFacets] = useState<Record<string, Record<string, number>>>({});
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  const searchQuery = searchParams.get('search') || undefined;
+  const selectedCategory = searchParams.get('category') || 'all';
+  // Relevance only exists for a search; fall back to newest without one
+  const sort = SORTS[sortBy === 'relevance' && !searchQuery ? 'newest' : sortBy];
 
-  const categories = ['all', ...Array.from(new Set(products.map(p => p.category)))];
-  const brands = Array.from(new Set(products.map(p => p.brand)));
+  // Filtering and sorting happen on the server, over the whole catalog.
+  // Facet counts leave out their own facet's selection, so summing the
+  // category counts gives the "all categories" total.
+  const categoryCounts = facets.category || {};
+  const brandCounts = facets.brand || {};
+  const categories = ['all', ...Object.keys(categoryCounts)];
+  const brands = Array.from(new Set([...Object.keys(brandCounts), ...selectedBrands]));
+  const allCategoriesCount = Object.values(categoryCounts).reduce((sum, count) => sum + count, 0);
 
+  const filters = {
+    search: searchQuery,
+    category: selectedCategory !== 'all' ? selectedCategory : undefined,
+    brand: selectedBrands.length > 0 ? selectedBrands : undefined,
+    min_price: priceRange[0] > 0 ? priceRange[0] : undefined,
+    max_price: priceRange[1] < 1000 ? priceRange[1] : undefined,
+    min_rating: ratingFilter > 0 ? ratingFilter : undefined,
+    sort: sort.sort,
+    order: sort.order,
+  };
+  const filtersKey = JSON.stringify(filters);
+  // A page that arrives after the filters changed belongs to the old list
+  const currentKey = useRef(filtersKey);
+  currentKey.current = filtersKey;
+
+  // Any filter or sort change starts over from the first page
   useEffect(() => {
+    let stale = false;
     const loadProducts = async () => {
       try {
-        const search = searchParams.get('search') || undefined;
-        const category = searchParams.get('category') || undefined;
-        const data = await fetchProducts({ search, category });
-        setProducts(data);
-        setFilteredProducts(data);
+        const page = await fetchProductsPage(filters);
+        if (stale) return;
+        setProducts(page.items);
+        setNextCursor(page.next_cursor);
+        setTotal(page.total);
+        setFacets(page.facets || {});
       } catch (error) {
         console.error('Failed to load products:', error);
       }
     };
+    setNextCursor(null);
     loadProducts();
-  }, [searchParams]);
-
-  useEffect(() => {
-    let filtered = [...products];
-
-    // Search filter
-    const searchQuery = searchParams.get('search');
-    if (searchQuery) {
-      filtered = filtered.filter(product =>
-        product.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        product.description.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        product.brand.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        product.tags.some(tag => tag.toLowerCase().includes(searchQuery.toLowerCase()))
-      );
-    }
-
-    // Category filter
-    const categoryQuery = searchParams.get('category');
-    if (categoryQuery && categoryQuery !== 'all') {
-      filtered = filtered.filter(product => product.category === categoryQuery);
-      setSelectedCategory(categoryQuery);
-    } else if (selectedCategory !== 'all') {
-      filtered = filtered.filter(product => product.category === selectedCategory);
-    }
-
-    // Brand filter
-    if (selectedBrands.length > 0) {
-      filtered = filtered.filter(product => selectedBrands.includes(product.brand));
-    }
-
-    // Price range filter
-    filtered = filtered.filter(product =>
-      product.price >= priceRange[0] && product.price <= priceRange[1]
-    );
+    return () => {
+      stale = true;
+    };
+  }, [filtersKey]);
 
-    // Rating filter
-    if (ratingFilter > 0) {
-      filtered = filtered.filter(product => product.rating >= ratingFilter);
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    const requestKey = filtersKey;
+    setLoadingMore(true);
+    try {
+      const page = await fetchProductsPage({ ...filters, cursor: nextCursor });
+      if (currentKey.current !== requestKey) return;
+      setProducts(prev => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Failed to load more products:', error);
+    } finally {
+      setLoadingMore(false);
     }
-
-    // Sort
-    filtered.sort((a, b) => {
-      switch (sortBy) {
-        case 'price-low':
-          return a.price - b.price;
-        case 'price-high':
-          return b.price - a.price;
-        case 'rating':
-          return b.rating - a.rating;
-        case 'popularity':
-          return b.reviewCount - a.reviewCount;
-        case 'newest':
-          return b.id.localeCompare(a.id);
-        case 'name':
-        default:
-          return a.name.localeCompare(b.name);
-      }
-    });
-
-    setFilteredProducts(filtered);
-  }, [searchParams, selectedCategory, selectedBrands, priceRange, sortBy, ratingFilter, products]);
+  };
 
   const handleCategoryChange = (category: string) => {
-    setSelectedCategory(category);
     if (category === 'all') {
       searchParams.delete('category');
     } else {
@@ -114,7 +114,6 @@ const ProductsPage: React.FC = () => {
   };
 
   const clearFilters = () => {
-    setSelectedCategory('all');
     setSelectedBrands([]);
     setPriceRange([0, 1000]);
     setRatingFilter(0);
@@ -136,7 +135,7 @@ const ProductsPage: React.FC = () => {
           <div>
             <h1 className="text-2xl sm:text-3xl font-bold text-gray-900 mb-2">Products</h1>
             <p className="text-sm sm:text-base text-gray-600">
-              Showing {filteredProducts.length} of {products.length} products
+              Showing {products.length} of {total} products
               {searchParams.get('search') && (
                 <span className="ml-2 text-blue-600">
                   for "{searchParams.get('search')}"
@@ -165,16 +164,16 @@ const ProductsPage: React.FC = () => {
             {/* Sort Dropdown */}
             <div className="relative">
               <select
-                value={sortBy}
+                value={sort === SORTS[sortBy] ? sortBy : 'newest'}
                 onChange={(e) => setSortBy(e.target.value)}
                 className="appearance-none bg-white border border-gray-300 rounded-lg px-3 sm:px-4 py-1.5 sm:py-2 pr-6 sm:pr-8 focus:outline-none focus:ring-2 focus:ring-blue-500 text-sm"
               >
-                <option value="name">Sort by Name</option>
+                {searchQuery && <option value="relevance">Best Match</option>}
+                <option value="newest">Newest First</option>
                 <option value="price-low">Price: Low to High</option>
                 <option value="price-high">Price: High to Low</option>
                 <option value="rating">Highest Rated</option>
-                <option value="popularity">Most Popular</option>
-                <option value="newest">Newest First</option>
+                <option value="discount">Biggest Discount</option>
               </select>
               <ChevronDown className="absolute right-1.5 sm:right-2 top-1/2 transform -translate-y-1/2 w-3.5 h-3.5 sm:w-4 sm:h-4 text-gray-400 pointer-events-none" />
             </div>
@@ -257,7 +256,7 @@ const ProductsPage: React.FC = () => {
                   >
                     {category === 'all' ? 'All Categories' : category}
                     <span className="text-xs text-gray-400 ml-2">
-                      ({products.filter(p => category === 'all' || p.category === category).length})
+                      ({category === 'all' ? allCategoriesCount : categoryCounts[category]})
                     </span>
                   </button>
                 ))}
@@ -314,7 +313,7 @@ const ProductsPage: React.FC = () => {
                     />
                     <span className="text-sm text-gray-600">{brand}</span>
                     <span className="text-xs text-gray-400">
-                      ({products.filter(p => p.brand === brand).length})
+                      ({brandCounts[brand] || 0})
                     </span>
                   </label>
                 ))}
@@ -347,7 +346,7 @@ const ProductsPage: React.FC = () => {
 
           {/* Products Grid */}
           <div className="flex-1">
-            {filteredProducts.length === 0 ? (
+            {products.length === 0 ? (
               <div className="text-center py-12">
                 <div className="text-6xl mb-4">🔍</div>
                 <h3 className="text-xl font-semibold text-gray-900 mb-2">No products found</h3>
@@ -366,17 +365,21 @@ const ProductsPage: React.FC = () => {
                 ? 'grid-cols-2 sm:grid-cols-3 lg:grid-cols-3 xl:grid-cols-4'
                 : 'grid-cols-1'
                 }`}>
-                {filteredProducts.map((product) => (
+                {products.map((product) => (
                   <ProductCard key={product.id} product={product} />
                 ))}
               </div>
             )}
 
             {/* Load More Button */}
-            {filteredProducts.length > 0 && filteredProducts.length >= 12 && (
+            {nextCursor && (
               <div className="text-center mt-12">
-                <button className="bg-gray-200 text-gray-700 hover:bg-gray-300 px-8 py-3 rounded-full transition-colors">
-                  Load More Products
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="bg-gray-200 text-gray-700 hover:bg-gray-300 px-8 py-3 rounded-full transition-colors disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load More Products'}
                 </button>
               </div>
             )}
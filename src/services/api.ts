@@ -8,13 +8,38 @@ const getHeaders = () => {
     };
 };
 
-export const fetchProducts = async (filters = {}) => {
-    const query = new URLSearchParams(filters).toString();
-    const response = await fetch(`${API_URL}/products?${query}`);
+// Skips unset filters, which URLSearchParams would send as "undefined".
+// Arrays become repeated keys (brand=a&brand=b), as list query params expect.
+const toQuery = (filters: Record<string, any>) => {
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([key, value]) => {
+        const values = Array.isArray(value) ? value : [value];
+        values.forEach(item => {
+            if (item !== undefined && item !== null && item !== '') params.append(key, String(item));
+        });
+    });
+    return params.toString();
+};
+
+// Returns one page: { items, next_cursor, total, facets }. Pass next_cursor back as `cursor` for the next page.
+export const fetchProductsPage = async (filters: Record<string, any> = {}) => {
+    const response = await fetch(`${API_URL}/products?${toQuery(filters)}`);
     if (!response.ok) throw new Error('Failed to fetch products');
     return response.json();
 };
 
+// Every matching product, following next_cursor page by page. Only for callers that need the full list.
+export const fetchAllProducts = async (filters: Record<string, any> = {}) => {
+    const products: any[] = [];
+    let cursor: string | undefined;
+    do {
+        const page = await fetchProductsPage({ ...filters, limit: 100, cursor });
+        products.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return products;
+};
+
 export const fetchProductById = async (id: string) => {
     const response = await fetch(`${API_URL}/products/${id}`);
     if (!response.ok) throw new Error('Failed to fetch product');
@@ -70,14 +95,28 @@ export const fetchOrderHistory = async () => {
     return response.json();
 };
 
-export const fetchAllOrders = async () => {
-    const response = await fetch(`${API_URL}/orders/all`, {
+// Returns one page: { items, next_cursor }. Filters: status, user_id, date_from, date_to, limit, cursor.
+export const fetchOrdersPage = async (filters: Record<string, any> = {}) => {
+    const query = toQuery(filters);
+    const response = await fetch(`${API_URL}/orders/all?${query}`, {
         headers: getHeaders()
     });
     if (!response.ok) throw new Error('Failed to fetch all orders');
     return response.json();
 };
 
+// Every matching order, following next_cursor page by page.
+export const fetchAllOrders = async (filters: Record<string, any> = {}) => {
+    const orders: any[] = [];
+    let cursor: string | undefined;
+    do {
+        const page = await fetchOrdersPage({ ...filters, limit: 100, cursor });
+        orders.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return orders;
+};
+
 export const updateOrderStatus = async (orderId: string, status: string) => {
     const response = await fetch(`${API_URL}/orders/${orderId}/status`, {
         method: 'PUT',
@@ -115,6 +154,15 @@ export const removeFromWishlistApi = async (productId: string) => {
     return response.json();
 };
 
+// Admin
+export const fetchAdminSummary = async () => {
+    const response = await fetch(`${API_URL}/admin/summary`, {
+        headers: getHeaders()
+    });
+    if (!response.ok) throw new Error('Failed to fetch admin summary');
+    return response.json();
+};
+
 // Users
 export const fetchUsers = async () => {
     const response = await fetch(`${API_URL}/users/all`, {
@@ -229,14 +277,31 @@ export const markNotificationRead = async (id: number) => {
 };
 
 // Reviews
-export const fetchProductReviews = async (productId: string) => {
-    const response = await fetch(`${API_URL}/reviews/${productId}`, {
+export const fetchProductReviewsPage = async (productId: string, params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`${API_URL}/reviews/${productId}?${query}`, {
         headers: getHeaders()
     });
     if (!response.ok) throw new Error('Failed to fetch reviews');
     return response.json();
 };
 
+export const fetchProductReviews = async (productId: string) => {
+    const page = await fetchProductReviewsPage(productId);
+    return page.items;
+};
+
+export const fetchRatingSummaries = async (productIds: string[]) => {
+    const response = await fetch(`${API_URL}/reviews/summaries`, {
+        method: 'POST',
+        headers: getHeaders(),
+        body: JSON.stringify({ product_ids: productIds })
+    });
+    if (!response.ok) throw new Error('Failed to fetch rating summaries');
+    const data = await response.json();
+    return data.summaries;
+};
+
 export const createReviewApi = async (data: { product_id: string; rating: number; comment: string }) => {
     const response = await fetch(`${API_URL}/reviews/`, {
         method: 'POST',
@@ -137,4 +137,13 @@ export interface SearchFilters {
   inStock?: boolean;
   sortBy?: 'name' | 'price-low' | 'price-high' | 'rating' | 'newest' | 'popularity';
   search?: string;
-}
\ No newline at end of file
+}
+export interface AdminSummary {
+  revenue: { total: number; last_30_days: number; last_24_hours: number };
+  orders: { total: number; by_status: Record<string, number> };
+  users: { total: number; new_today: number };
+  products: { total: number; low_stock: number; out_of_stock: number; low_stock_threshold: number };
+  top_products: { product_id: string; name: string | null; units: number; revenue: number }[];
+  daily: { day: string; orders: number; revenue: number }[];
+  hourly: { hour: string; orders: number; revenue: number }[];
+}